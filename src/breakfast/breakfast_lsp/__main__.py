@@ -1,13 +1,16 @@
 import sys
 
 from breakfast import __version__
-from breakfast.breakfast_lsp import server
+from breakfast.breakfast_lsp import daemon, server
 
 
 def main() -> None:
     if "--version" in sys.argv:
         print(__version__)
         sys.exit(0)
+    if "--daemon" in sys.argv:
+        daemon.start()
+        return
     server.start()
 
 
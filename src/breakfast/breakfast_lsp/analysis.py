@@ -0,0 +1,622 @@
+from __future__ import annotations
+
+import ast
+import logging
+import os
+from collections.abc import Callable, Iterable
+from itertools import groupby
+
+from lsprotocol.types import (
+    AnnotatedTextEdit,
+    CodeAction,
+    CodeActionKind,
+    CreateFile,
+    Definition,
+    DefinitionLink,
+    DefinitionParams,
+    DeleteFile,
+    DidChangeTextDocumentParams,
+    DocumentHighlight,
+    DocumentHighlightKind,
+    DocumentHighlightParams,
+    Location,
+    LocationLink,
+    OptionalVersionedTextDocumentIdentifier,
+    Position,
+    Range,
+    ReferenceParams,
+    RenameFile,
+    RenameParams,
+    SymbolInformation,
+    SymbolKind,
+    TextDocumentContentChangeEvent_Type1,
+    TextDocumentEdit,
+    TextDocumentItem,
+    TextEdit,
+    WorkspaceEdit,
+)
+from pygls.workspace import PositionCodec
+
+from breakfast import types
+from breakfast.names import (
+    ExportedName,
+    ImportedName,
+    compile_modules,
+    export_summary,
+    local_occurrences,
+)
+from breakfast.project import Project
+from breakfast.refactoring import CodeSelection, Editor
+from breakfast.source import Source
+from breakfast.symbols import Kind, Symbol
+from breakfast.types import Edit, Occurrence
+from breakfast.workspace import MemoryStatistics, Workspace
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_KINDS = {
+    Kind.CLASS: SymbolKind.Class,
+    Kind.FUNCTION: SymbolKind.Function,
+    Kind.METHOD: SymbolKind.Method,
+    Kind.VARIABLE: SymbolKind.Variable,
+}
+
+
+class Analysis:
+    """
+    The open documents and the workspace index of one project root, with
+    the analysis behind each request. Everything it takes and returns can be
+    pickled, so it can live in another process than the language server.
+    """
+
+    def __init__(self, root: str, workspace: Workspace | None = None) -> None:
+        self.root = root
+        self.owns_workspace = workspace is None
+        self.workspace = workspace or Workspace(
+            root,
+            memory_budget=memory_budget(),
+            compile_workers=compile_workers(),
+        )
+        self.sources: dict[str, Source] = {}
+        self.versions: dict[str, int] = {}
+
+    def index(self, report: Callable[[int, int], None] | None = None) -> int:
+        self.workspace.index(report=report)
+        return len(self.workspace.sources)
+
+    def memory_statistics(self) -> MemoryStatistics:
+        return self.workspace.memory_statistics()
+
+    def document_source(self, uri: str) -> Source:
+        if (source := self.sources.get(uri)) is None:
+            source = Source(path=uri[len("file://") :], project_root=self.root)
+        return source
+
+    def project(self, source: Source) -> Project:
+        return Project(
+            source=source,
+            root=self.root,
+            known_sources=(*self.sources.values(), *self.workspace.sources),
+        )
+
+    def open_document(self, document: TextDocumentItem) -> None:
+        source = self.sources[document.uri] = get_source(
+            uri=document.uri,
+            project_root=self.root,
+            lines=document.text.split("\n"),
+        )
+        self.versions[document.uri] = document.version
+        self.workspace.changed(source)
+
+    def change_document(
+        self,
+        params: DidChangeTextDocumentParams,
+        codec: PositionCodec | None = None,
+    ) -> None:
+        """
+        Apply the changes to the open document. Change ranges are in the
+        client's position encoding, UTF-16 unless another was negotiated.
+        """
+        codec = codec or PositionCodec()
+        uri = params.text_document.uri
+        self.versions[uri] = params.text_document.version
+        source = self.sources.get(uri)
+        for change in params.content_changes:
+            if not isinstance(change, TextDocumentContentChangeEvent_Type1):
+                source = self.sources[uri] = get_source(
+                    uri=uri,
+                    project_root=self.root,
+                    lines=change.text.split("\n"),
+                )
+                continue
+
+            if source is None:
+                logger.debug(f"Ignoring change to unopened document {uri}")
+                return
+
+            change_range = codec.range_from_client_units(
+                list(source.text), change.range
+            )
+            start = source.position(
+                row=change_range.start.line,
+                column=change_range.start.character,
+            )
+            end = source.position(
+                row=change_range.end.line, column=change_range.end.character
+            )
+            source.apply_edit(start.to(end).replace(change.text))
+        if source is not None:
+            self.workspace.changed(source)
+
+    def close_document(self, uri: str) -> None:
+        self.versions.pop(uri, None)
+        if (source := self.sources.pop(uri, None)) is not None:
+            self.workspace.reload(source.path)
+
+    def close(self) -> None:
+        for uri in list(self.sources):
+            self.close_document(uri)
+        if self.owns_workspace:
+            self.workspace.close()
+
+    def occurrences(
+        self, source: Source, position: types.Position
+    ) -> list[Occurrence]:
+        """
+        A module-level name can only be referred to from the module that
+        defines it and the modules that import that one, directly or through
+        re-exports, so only those are loaded. For any other name, every
+        module is.
+        """
+        known = {
+            s.path: s for s in (*self.workspace.sources, *self.sources.values())
+        }
+        known[source.path] = source
+        sources = list(known.values())
+        defining = self.defining_module(source, position, known)
+        if defining is not None:
+            needed = {
+                source.path,
+                defining,
+                *self.workspace.importers([defining]),
+            }
+            sources = [known[path] for path in needed if path in known]
+        return self.collect(source, position, sources)
+
+    def defining_module(
+        self,
+        source: types.Source,
+        position: types.Position,
+        known: dict[str, types.Source],
+    ) -> str | None:
+        """
+        Follow the module-level name at position through the imports and
+        re-exports in the export summaries to the module that defines it.
+        """
+        try:
+            found = module_level_names(source, position)
+        except KeyError:
+            return None
+
+        seen = {source.path}
+        while len(found) == 1 and isinstance(found[0], ImportedName):
+            imported = found[0]
+            if imported.module is None:
+                return None
+
+            module = (
+                (*source.module_name[: -imported.level], *imported.module)
+                if imported.level
+                else imported.module
+            )
+            paths = self.workspace.module_paths(module) & known.keys()
+            if not paths:
+                return source.path
+            if len(paths) > 1 or paths <= seen:
+                return None
+
+            (path,) = paths
+            seen.add(path)
+            source = known[path]
+            found = [
+                n
+                for n in export_summary(source).names
+                if n.name == imported.name
+            ]
+
+        if not found or any(isinstance(n, ImportedName) for n in found):
+            return None
+
+        return source.path
+
+    def collect(
+        self,
+        source: Source,
+        position: types.Position,
+        sources: list[types.Source],
+    ) -> list[Occurrence]:
+        project = Project(source=source, root=self.root, known_sources=sources)
+        if (compilers := self.workspace.compilers) is not None:
+            compile_modules(
+                project.sources,
+                query=source.get_name_at(position),
+                executor=compilers,
+            )
+        return project.get_occurrences(position)
+
+    def outdated(self, uri: str, version: int | None) -> bool:
+        """
+        Whether the document changed since the request for version was
+        made, so that its positions no longer match the text.
+        """
+        return version is not None and self.versions.get(uri) != version
+
+    def rename(
+        self, params: RenameParams, version: int | None = None
+    ) -> WorkspaceEdit | None:
+        if self.outdated(params.text_document.uri, version):
+            return None
+
+        source = self.document_source(params.text_document.uri)
+        line = source.text[params.position.line]
+
+        start = find_identifier_start(line, params.position)
+        if start is None:
+            return None
+
+        position = source.position(row=params.position.line, column=start)
+
+        try:
+            occurrences = self.occurrences(source, position)
+        except KeyError:
+            return None
+
+        if not occurrences:
+            return None
+
+        logger.debug(f"found: {len(occurrences)} occurrences: {occurrences}")
+        old_identifier = source.get_name_at(position)
+        if old_identifier is None:
+            return None
+        document_changes: list[
+            TextDocumentEdit | CreateFile | RenameFile | DeleteFile
+        ] = []
+        for source, source_occurences in groupby(
+            occurrences, lambda o: o.position.source
+        ):
+            document_uri = f"file://{source.path}"
+            logger.debug(f"{document_uri=}")
+            document_changes.append(
+                TextDocumentEdit(
+                    text_document=OptionalVersionedTextDocumentIdentifier(
+                        uri=document_uri,
+                        version=self.versions.get(document_uri),
+                    ),
+                    edits=[
+                        TextEdit(
+                            range=Range(
+                                start=Position(
+                                    line=o.position.row,
+                                    character=o.position.column,
+                                ),
+                                end=Position(
+                                    line=o.position.row,
+                                    character=o.position.column
+                                    + len(old_identifier),
+                                ),
+                            ),
+                            new_text=params.new_name,
+                        )
+                        for o in source_occurences
+                    ],
+                )
+            )
+
+        return WorkspaceEdit(
+            document_changes=document_changes,
+        )
+
+    def code_actions(
+        self, uri: str, selection: Range, version: int | None = None
+    ) -> list[CodeAction] | None:
+        if self.outdated(uri, version):
+            return None
+
+        source = self.document_source(uri)
+        project = self.project(source)
+        start = source.position(
+            row=selection.start.line,
+            column=selection.start.character,
+        )
+        end = source.position(
+            row=selection.end.line,
+            column=max(selection.end.character, 0),
+        )
+
+        code_selection = CodeSelection(
+            sources=project.sources, text_range=start.to(end)
+        ).rtrim()
+
+        actions: list[CodeAction] = []
+        version = self.versions.get(uri)
+        for name, refactoring in code_selection.refactorings.items():
+            edits = get_edits(refactoring, uri, version)
+            if edits:
+                actions.append(
+                    CodeAction(
+                        title=f"breakfast: {name}",
+                        kind=CodeActionKind.RefactorExtract
+                        if "extract" in name
+                        else CodeActionKind.Refactor,
+                        data=uri,
+                        edit=edits,
+                        diagnostics=[],
+                    )
+                )
+
+        logger.debug(f"Found {len(actions)} available refactoring actions.")
+        return actions
+
+    def definitions(
+        self, params: DefinitionParams
+    ) -> Definition | list[DefinitionLink] | None:
+        source = self.document_source(params.text_document.uri)
+        line = source.text[params.position.line]
+
+        start = find_identifier_start(line, params.position)
+        if start is None:
+            return None
+
+        position = source.position(row=params.position.line, column=start)
+        try:
+            occurrences = self.occurrences(source, position)
+        except KeyError:
+            return None
+
+        if not occurrences:
+            return None
+
+        definitions = [o for o in occurrences if o.is_definition]
+        logger.warning(f"{definitions=}")
+        if len(definitions) == 1:
+            return make_location(definitions[0])
+
+        return [make_location_link(o) for o in definitions]
+
+    def references(self, params: ReferenceParams) -> list[Location] | None:
+        source = self.document_source(params.text_document.uri)
+        if (position := identifier_position(source, params.position)) is None:
+            return None
+
+        try:
+            occurrences = self.occurrences(source, position)
+        except KeyError:
+            return None
+
+        return [
+            Location(
+                uri=f"file://{o.position.source.path}", range=name_range(o)
+            )
+            for o in occurrences[::-1]
+            if params.context.include_declaration or not o.is_definition
+        ]
+
+    def highlights(
+        self, params: DocumentHighlightParams
+    ) -> list[DocumentHighlight] | None:
+        source = self.document_source(params.text_document.uri)
+        if (position := identifier_position(source, params.position)) is None:
+            return None
+
+        return [
+            DocumentHighlight(
+                range=name_range(o),
+                kind=DocumentHighlightKind.Write
+                if o.is_definition
+                else DocumentHighlightKind.Read,
+            )
+            for o in local_occurrences(position)
+        ]
+
+    def symbols(self, query: str) -> list[SymbolInformation]:
+        return [
+            symbol_information(symbol)
+            for symbol in self.workspace.search(query)
+        ]
+
+
+def module_level_names(
+    source: types.Source, position: types.Position
+) -> list[ExportedName | ImportedName]:
+    """
+    The entries in the export summary of source that the name at position
+    refers to. A name that stays unresolved within its own module can only
+    refer to a module-level name, usually one imported from elsewhere.
+    """
+    names = export_summary(source).names
+    at_position = [
+        n for n in names if (n.row, n.column) == (position.row, position.column)
+    ]
+    if at_position:
+        return at_position
+
+    if occurrences := local_occurrences(position):
+        positions = {(o.position.row, o.position.column) for o in occurrences}
+        return [n for n in names if (n.row, n.column) in positions]
+
+    name = source.get_name_at(position)
+    named = [n for n in names if n.name == name]
+    if named and any(
+        isinstance(node, ast.Name) and source.node_position(node) == position
+        for node in ast.walk(source.ast)
+    ):
+        return named
+
+    return []
+
+
+def memory_budget() -> int | None:
+    """
+    The memory budget for parsed modules, from BREAKFAST_MEMORY_BUDGET in
+    megabytes. Without it, every module stays parsed.
+    """
+    if not (megabytes := os.environ.get("BREAKFAST_MEMORY_BUDGET")):
+        return None
+    return int(megabytes) * 2**20
+
+
+def compile_workers() -> int | None:
+    """
+    The number of processes that compile modules for cross-module queries,
+    from BREAKFAST_COMPILE_WORKERS. Without it, they are compiled in the
+    analysis process.
+    """
+    if not (workers := os.environ.get("BREAKFAST_COMPILE_WORKERS")):
+        return None
+    return int(workers)
+
+
+def get_source(uri: str, project_root: str, lines: Iterable[str]) -> Source:
+    return Source(
+        input_lines=tuple(line for line in lines),
+        path=uri[len("file://") :],
+        project_root=project_root,
+    )
+
+
+def is_valid_identifier_character(character: str) -> bool:
+    return character.isalnum() or character == "_"
+
+
+def is_valid_identifier_start(character: str) -> bool:
+    return character.isalpha() or character == "_"
+
+
+def find_identifier_start(line: str, position: Position) -> int | None:
+    start = position.character
+    if start < 0 or start >= len(line):
+        logger.debug("Invalid position.")
+        return None
+
+    if not is_valid_identifier_character(line[start]):
+        logger.debug("Cursor not at a name.")
+        return None
+
+    while start > 0 and is_valid_identifier_character(line[start - 1]):
+        start -= 1
+
+    if not is_valid_identifier_start(line[start]):
+        return None
+
+    return start
+
+
+def find_identifier_end(line: str, position: Position) -> int:
+    end = position.character
+
+    while end < len(line) and is_valid_identifier_character(line[end]):
+        end += 1
+
+    return end
+
+
+def identifier_position(
+    source: Source, position: Position
+) -> types.Position | None:
+    if position.line >= len(source.text):
+        return None
+
+    start = find_identifier_start(source.text[position.line], position)
+    if start is None:
+        return None
+
+    return source.position(row=position.line, column=start)
+
+
+def edits_to_text_edits(
+    edits: Iterable[Edit],
+) -> list[TextEdit | AnnotatedTextEdit]:
+    return [
+        TextEdit(
+            range=Range(
+                start=Position(
+                    line=edit.start.row, character=edit.start.column
+                ),
+                end=Position(line=edit.end.row, character=edit.end.column),
+            ),
+            new_text=edit.text,
+        )
+        for edit in edits
+    ]
+
+
+def get_edits(
+    editor: Editor, document_uri: str, version: int | None
+) -> WorkspaceEdit | None:
+    if not editor.edits:
+        logger.debug(f"Refactoring: {editor}. No edits found.")
+        return None
+
+    text_edits: list[TextEdit | AnnotatedTextEdit] = edits_to_text_edits(
+        editor.edits
+    )
+
+    document_changes: list[
+        TextDocumentEdit | CreateFile | RenameFile | DeleteFile
+    ] = [
+        TextDocumentEdit(
+            text_document=OptionalVersionedTextDocumentIdentifier(
+                uri=document_uri, version=version
+            ),
+            edits=text_edits,
+        )
+    ]
+    return WorkspaceEdit(document_changes=document_changes)
+
+
+def symbol_information(symbol: Symbol) -> SymbolInformation:
+    position = symbol.position
+    return SymbolInformation(
+        name=symbol.name,
+        kind=SYMBOL_KINDS[symbol.kind],
+        container_name=symbol.container,
+        location=Location(
+            uri=f"file://{position.source.path}",
+            range=Range(
+                start=Position(position.row, position.column),
+                end=Position(position.row, position.column + len(symbol.name)),
+            ),
+        ),
+    )
+
+
+def make_location(occurrence: Occurrence) -> Location:
+    return Location(
+        uri=f"file://{occurrence.position.source.path}",
+        range=to_range(occurrence),
+    )
+
+
+def make_location_link(occurrence: Occurrence) -> LocationLink:
+    return LocationLink(
+        target_uri=f"file://{occurrence.position.source.path}",
+        target_range=to_range(occurrence),
+        target_selection_range=to_range(occurrence),
+    )
+
+
+def to_range(occurrence: Occurrence) -> Range:
+    return Range(
+        start=Position(occurrence.position.row, occurrence.position.column),
+        end=Position(occurrence.position.row, occurrence.position.column),
+    )
+
+
+def name_range(occurrence: Occurrence) -> Range:
+    return Range(
+        start=Position(occurrence.position.row, occurrence.position.column),
+        end=Position(
+            occurrence.position.row,
+            occurrence.position.column + len(occurrence.name),
+        ),
+    )
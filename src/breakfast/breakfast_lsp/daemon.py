@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import logging
+import os
+import secrets
+import stat
+import tempfile
+from collections.abc import Callable
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import (
+    Client,
+    Connection,
+    Listener,
+    answer_challenge,
+    deliver_challenge,
+)
+from pathlib import Path
+from threading import Lock, Thread
+
+from breakfast.breakfast_lsp.analysis import (
+    Analysis,
+    compile_workers,
+    memory_budget,
+)
+from breakfast.breakfast_lsp.executors import handle
+from breakfast.workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+SOCKET_NAME = "breakfast.sock"
+AUTHKEY_NAME = "authkey"
+AUTHKEY_SIZE = 32
+
+
+class DaemonRunningError(Exception):
+    pass
+
+
+class InsecurePathError(Exception):
+    pass
+
+
+def socket_address() -> str:
+    """
+    The socket lives in a directory only the current user can enter, since
+    anyone who can connect can make the daemon run arbitrary code. A
+    directory that is not private is refused, even when another user
+    created it first.
+    """
+    if address := os.environ.get("BREAKFAST_SOCKET"):
+        check_private(Path(address).parent, stat.S_ISDIR)
+        return address
+
+    directory = Path(tempfile.gettempdir()) / f"breakfast-{os.getuid()}"
+    directory.mkdir(mode=0o700, exist_ok=True)
+    check_private(directory, stat.S_ISDIR)
+    return str(directory / SOCKET_NAME)
+
+
+def load_authkey() -> bytes:
+    """
+    The secret both ends of a daemon connection prove they know, so that
+    neither will unpickle anything from someone else. It is created on
+    first use in a file only the current user can read.
+    """
+    path = authkey_path()
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    check_private(path.parent, stat.S_ISDIR)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(descriptor, "wb") as key_file:
+            key_file.write(secrets.token_bytes(AUTHKEY_SIZE))
+        os.link(temporary, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temporary)
+
+    check_private(path, stat.S_ISREG)
+    return path.read_bytes()
+
+
+def authkey_path() -> Path:
+    if runtime := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime) / "breakfast" / AUTHKEY_NAME
+
+    config = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(config) / "breakfast" / AUTHKEY_NAME
+
+
+def check_private(path: Path, is_kind: Callable[[int], bool]) -> None:
+    status = path.lstat()
+    if not is_kind(status.st_mode):
+        raise InsecurePathError(f"{path} is a symbolic link or the wrong kind")
+    if status.st_uid != os.getuid():
+        raise InsecurePathError(f"{path} belongs to another user")
+    if status.st_mode & 0o077:
+        raise InsecurePathError(f"{path} is accessible to other users")
+
+
+class Daemon:
+    """
+    Keep one workspace index per project root and share it between the
+    language servers that connect. Every connection gets its own Analysis,
+    so the open documents of one editor do not leak into another, and calls
+    from all connections run one at a time. The compile processes of a
+    workspace stop when the last connection using it closes.
+    """
+
+    def __init__(self, address: str, authkey: bytes) -> None:
+        self.address = address
+        self.authkey = authkey
+        self.workspaces: dict[str, Workspace] = {}
+        self.sessions: dict[str, int] = {}
+        self._lock = Lock()
+        self._calls = Lock()
+
+    def attach(self, root: str) -> Workspace:
+        with self._lock:
+            if (workspace := self.workspaces.get(root)) is None:
+                workspace = self.workspaces[root] = Workspace(
+                    root,
+                    memory_budget=memory_budget(),
+                    compile_workers=compile_workers(),
+                )
+            self.sessions[root] = self.sessions.get(root, 0) + 1
+            return workspace
+
+    def detach(self, root: str) -> None:
+        with self._lock:
+            self.sessions[root] -= 1
+            if self.sessions[root]:
+                return
+
+            del self.sessions[root]
+            workspace = self.workspaces[root]
+        workspace.close()
+
+    def serve_forever(self) -> None:
+        remove_stale_socket(self.address)
+        with Listener(self.address, family="AF_UNIX") as listener:
+            logger.info(f"Listening on {self.address}")
+            while True:
+                connection = listener.accept()
+                Thread(
+                    target=self.session, args=(connection,), daemon=True
+                ).start()
+
+    def session(self, connection: Connection) -> None:
+        """
+        Authenticate here rather than in the listener, so that a client
+        that never answers does not keep others from connecting.
+        """
+        try:
+            deliver_challenge(connection, self.authkey)
+            answer_challenge(connection, self.authkey)
+            root = connection.recv()
+        except (AuthenticationError, EOFError, OSError) as e:
+            logger.warning(f"Refusing connection: {e!r}")
+            connection.close()
+            return
+
+        analysis = Analysis(root, workspace=self.attach(root))
+        logger.info(f"Session started for {root}")
+        try:
+            handle(connection, analysis, self._calls)
+        finally:
+            with self._calls:
+                analysis.close()
+                self.detach(root)
+            connection.close()
+            logger.info(f"Session ended for {root}")
+
+
+def remove_stale_socket(address: str) -> None:
+    if not os.path.exists(address):
+        return
+
+    try:
+        Client(address, family="AF_UNIX").close()
+    except OSError:
+        os.unlink(address)
+        return
+
+    raise DaemonRunningError(f"A daemon is already listening on {address}")
+
+
+def start() -> None:
+    Daemon(socket_address(), load_authkey()).serve_forever()
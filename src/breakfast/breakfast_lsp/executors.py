@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable
+from concurrent.futures import Future
+from enum import Enum
+from functools import partial
+from itertools import count
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Connection
+from threading import Lock, Thread
+from typing import Any, Protocol, Self
+
+from breakfast.breakfast_lsp.analysis import Analysis
+
+logger = logging.getLogger(__name__)
+
+
+class Message(Enum):
+    PROGRESS = "progress"
+    RESULT = "result"
+    ERROR = "error"
+
+
+class Executor(Protocol):
+    def run[T](self, function: Callable[[Analysis], T]) -> T: ...
+
+    def index(
+        self, report: Callable[[int, int], None] | None = None
+    ) -> int: ...
+
+
+class ThreadExecutor:
+    def __init__(self, root: str) -> None:
+        self.analysis = Analysis(root)
+
+    def run[T](self, function: Callable[[Analysis], T]) -> T:
+        try:
+            with self.analysis.workspace.using():
+                return function(self.analysis)
+        finally:
+            self.analysis.workspace.trim()
+
+    def index(self, report: Callable[[int, int], None] | None = None) -> int:
+        return self.analysis.index(report)
+
+
+class RemoteExecutor:
+    """
+    Run the analysis in another process that owns the Analysis, so that it
+    does not compete with the language server for the GIL. Functions and
+    their results are pickled across the connection. The other side runs
+    one call at a time, except for indexing, which runs alongside the other
+    calls.
+    """
+
+    def __init__(self, connection: Connection) -> None:
+        self.connection = connection
+        self._ids = count()
+        self._pending: dict[
+            int, tuple[Future[Any], Callable[[int, int], None] | None]
+        ] = {}
+        self._lock = Lock()
+        Thread(target=self._receive, daemon=True).start()
+
+    @classmethod
+    def spawn(cls, root: str) -> Self:
+        context = get_context("spawn")
+        connection, child = context.Pipe()
+        context.Process(target=serve, args=(child, root), daemon=True).start()
+        child.close()
+        return cls(connection)
+
+    @classmethod
+    def connect(cls, root: str, address: str, authkey: bytes) -> Self:
+        connection = Client(address, family="AF_UNIX", authkey=authkey)
+        connection.send(root)
+        return cls(connection)
+
+    def run[T](self, function: Callable[[Analysis], T]) -> T:
+        return self._call(function)
+
+    def index(self, report: Callable[[int, int], None] | None = None) -> int:
+        return self._call(Analysis.index, report=report, background=True)
+
+    def _call[T](
+        self,
+        function: Callable[..., T],
+        *,
+        report: Callable[[int, int], None] | None = None,
+        background: bool = False,
+    ) -> T:
+        future: Future[T] = Future()
+        with self._lock:
+            call_id = next(self._ids)
+            self._pending[call_id] = (future, report)
+            self.connection.send(
+                (call_id, function, report is not None, background)
+            )
+        return future.result()
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                call_id, message, value = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                future, report = self._pending[call_id]
+                if message is not Message.PROGRESS:
+                    del self._pending[call_id]
+            if message is Message.PROGRESS:
+                if report is not None:
+                    report(*value)
+            elif message is Message.RESULT:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(ConnectionError("Analysis connection closed"))
+
+
+def serve(connection: Connection, root: str) -> None:
+    handle(connection, Analysis(root), Lock())
+
+
+def handle(connection: Connection, analysis: Analysis, calls: Lock) -> None:
+    """
+    Answer calls on the Analysis until the connection is closed. Calls
+    other than indexing hold the `calls` lock while they run.
+    """
+    lock = Lock()
+
+    def send(call_id: int, message: Message, value: Any) -> None:
+        with lock:
+            try:
+                connection.send((call_id, message, value))
+            except OSError:
+                logger.debug(f"Dropping {message} for call {call_id}")
+
+    def call(call_id: int, function: Callable[..., Any], reports: bool) -> None:
+        try:
+            if reports:
+                result = function(analysis, partial(progress, send, call_id))
+            else:
+                result = function(analysis)
+        except Exception as e:
+            logger.exception(f"Failed to run {function}")
+            send(call_id, Message.ERROR, e)
+        else:
+            send(call_id, Message.RESULT, result)
+
+    while True:
+        try:
+            call_id, function, reports, background = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        if background:
+            Thread(
+                target=call, args=(call_id, function, reports), daemon=True
+            ).start()
+            continue
+
+        with calls:
+            with analysis.workspace.using():
+                call(call_id, function, reports)
+            analysis.workspace.trim()
+
+
+def progress(
+    send: Callable[[int, Message, Any], None],
+    call_id: int,
+    done: int,
+    total: int,
+) -> None:
+    send(call_id, Message.PROGRESS, (done, total))
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import IntEnum
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition, Thread
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    EDIT = 0
+    NAVIGATION = 1
+    HIGHLIGHT = 2
+    CODE_ACTION = 3
+
+
+@dataclass(order=True, kw_only=True)
+class Job:
+    priority: Priority
+    order: int
+    key: Hashable | None = field(compare=False)
+    function: Callable[[], Any] = field(compare=False)
+    future: Future[Any] = field(compare=False)
+
+
+class Scheduler:
+    """
+    Run analysis jobs one at a time on a worker thread, most urgent first.
+
+    Edits run in the order they were submitted and before anything else, so
+    a job always sees every edit that arrived before it. Other jobs run
+    newest first, and submitting a job with the same key as a job that has
+    not started yet cancels the older one.
+    """
+
+    def __init__(self) -> None:
+        self._queue: list[Job] = []
+        self._pending: dict[Hashable, Job] = {}
+        self._order = count()
+        self._condition = Condition()
+        self._worker: Thread | None = None
+
+    def submit[T](
+        self,
+        function: Callable[[], T],
+        *,
+        priority: Priority,
+        key: Hashable | None = None,
+    ) -> Future[T]:
+        future: Future[T] = Future()
+        with self._condition:
+            order = next(self._order)
+            job = Job(
+                priority=priority,
+                order=order if priority is Priority.EDIT else -order,
+                key=key,
+                function=function,
+                future=future,
+            )
+            if key is not None:
+                if (superseded := self._pending.get(key)) is not None:
+                    superseded.future.cancel()
+                self._pending[key] = job
+            heappush(self._queue, job)
+            if self._worker is None:
+                self._worker = Thread(target=self._work, daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return future
+
+    def _next(self) -> Job:
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            job = heappop(self._queue)
+            if job.key is not None and self._pending.get(job.key) is job:
+                del self._pending[job.key]
+            return job
+
+    def _work(self) -> None:
+        while True:
+            job = self._next()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(job.function())
+            except Exception as e:
+                logger.exception(f"Failed to run {job.function}")
+                job.future.set_exception(e)
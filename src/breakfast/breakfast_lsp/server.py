@@ -1,62 +1,97 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
-from collections.abc import Iterable
-from itertools import groupby
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import asdict
+from functools import partial
+from multiprocessing import AuthenticationError
 from pathlib import Path
+from threading import Thread
+from uuid import uuid4
 
 from lsprotocol.types import (
     INITIALIZE,
+    INITIALIZED,
     TEXT_DOCUMENT_CODE_ACTION,
     TEXT_DOCUMENT_DEFINITION,
+    TEXT_DOCUMENT_DID_CHANGE,
+    TEXT_DOCUMENT_DID_CLOSE,
+    TEXT_DOCUMENT_DID_OPEN,
+    TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT,
     TEXT_DOCUMENT_PREPARE_RENAME,
+    TEXT_DOCUMENT_REFERENCES,
     TEXT_DOCUMENT_RENAME,
-    AnnotatedTextEdit,
+    WORKSPACE_SYMBOL,
     CodeAction,
     CodeActionKind,
     CodeActionOptions,
     CodeActionParams,
-    CreateFile,
     Definition,
     DefinitionLink,
     DefinitionParams,
-    DeleteFile,
+    DidChangeTextDocumentParams,
+    DidCloseTextDocumentParams,
+    DidOpenTextDocumentParams,
+    DocumentHighlight,
+    DocumentHighlightParams,
+    InitializedParams,
     InitializeParams,
     Location,
-    LocationLink,
     MessageType,
-    OptionalVersionedTextDocumentIdentifier,
     Position,
     PrepareRenameParams,
     PrepareRenameResult,
     Range,
-    RenameFile,
+    ReferenceParams,
     RenameParams,
-    TextDocumentEdit,
-    TextEdit,
+    SymbolInformation,
+    TextDocumentSyncKind,
+    WorkDoneProgressBegin,
+    WorkDoneProgressEnd,
+    WorkDoneProgressReport,
     WorkspaceEdit,
+    WorkspaceSymbolParams,
 )
 from pygls.server import LanguageServer
 
 from breakfast import __version__
-from breakfast.project import Project
-from breakfast.refactoring import CodeSelection, Editor
-from breakfast.source import Source, TextRange
-from breakfast.types import Edit, Occurrence
+from breakfast.breakfast_lsp import daemon
+from breakfast.breakfast_lsp.analysis import (
+    Analysis,
+    find_identifier_end,
+    find_identifier_start,
+)
+from breakfast.breakfast_lsp.executors import (
+    Executor,
+    RemoteExecutor,
+    ThreadExecutor,
+)
+from breakfast.breakfast_lsp.scheduler import Priority, Scheduler
 
 logger = logging.getLogger(__name__)
 BREAKFAST_DEBUG = bool(os.environ.get("BREAKFAST_DEBUG", False))
 if BREAKFAST_DEBUG:
     log_file = Path(__file__).parent.parent / "breakfast-lsp.log"
     logging.basicConfig(filename=log_file, filemode="w", level=logging.DEBUG)
+BREAKFAST_EXECUTOR = os.environ.get("BREAKFAST_EXECUTOR", "thread")
 
 MAX_WORKERS = 2
+CODE_ACTION_CACHE_SIZE = 64
+MEMORY_STATISTICS = "breakfast.memoryStatistics"
 LSP_SERVER = LanguageServer(
     name="breakfast",
     version=__version__,
     max_workers=MAX_WORKERS,
+    text_document_sync_kind=TextDocumentSyncKind.Incremental,
 )
+SCHEDULER = Scheduler()
+EXECUTORS: dict[str, Executor] = {}
+CODE_ACTIONS: OrderedDict[
+    tuple[str, int, int, int, int, int], list[CodeAction]
+] = OrderedDict()
 
 
 def find_identifier_range_at(
@@ -89,43 +124,58 @@ def get_line(
         return None
 
 
-def is_valid_identifier_character(character: str) -> bool:
-    return character.isalnum() or character == "_"
-
-
-def is_valid_identifier_start(character: str) -> bool:
-    return character.isalpha() or character == "_"
+def document_version(server: LanguageServer, document_uri: str) -> int | None:
+    document = server.workspace.text_documents.get(document_uri)
+    return document.version if document else None
 
 
-def find_identifier_start(line: str, position: Position) -> int | None:
-    start = position.character
-    if start < 0 or start >= len(line):
-        logger.debug("Invalid position.")
-        return None
-
-    if not is_valid_identifier_character(line[start]):
-        logger.debug("Cursor not at a name.")
-        return None
+def get_executor(server: LanguageServer) -> Executor:
+    root_uri: str = server.workspace.root_uri
+    root = root_uri[len("file://") :]
+    if (executor := EXECUTORS.get(root)) is None:
+        executor = EXECUTORS[root] = new_executor(root)
+    return executor
 
-    while start >= 0 and is_valid_identifier_character(line[start]):
-        start -= 1
 
-    if not is_valid_identifier_start(line[start]):
-        start += 1
+def new_executor(root: str) -> Executor:
+    if BREAKFAST_EXECUTOR == "process":
+        return RemoteExecutor.spawn(root)
 
-    if not is_valid_identifier_start(line[start]):
-        return None
+    if BREAKFAST_EXECUTOR == "daemon":
+        try:
+            address = daemon.socket_address()
+            return RemoteExecutor.connect(root, address, daemon.load_authkey())
+        except (AuthenticationError, daemon.InsecurePathError, OSError):
+            logger.warning("Cannot connect to the daemon, analysing here")
 
-    return start
+    return ThreadExecutor(root)
 
 
-def find_identifier_end(line: str, position: Position) -> int:
-    end = position.character
+def submit(
+    server: LanguageServer,
+    function: Callable[[Analysis], object],
+    *,
+    priority: Priority,
+) -> None:
+    SCHEDULER.submit(
+        partial(get_executor(server).run, function), priority=priority
+    )
 
-    while end < len(line) and is_valid_identifier_character(line[end]):
-        end += 1
 
-    return end
+async def analyse[T](
+    server: LanguageServer,
+    function: Callable[[Analysis], T],
+    *,
+    priority: Priority,
+    key: tuple[str, ...] | None = None,
+) -> T:
+    return await asyncio.wrap_future(
+        SCHEDULER.submit(
+            partial(get_executor(server).run, function),
+            priority=priority,
+            key=key,
+        )
+    )
 
 
 @LSP_SERVER.feature(INITIALIZE)
@@ -133,6 +183,46 @@ def initialize(server: LanguageServer, params: InitializeParams) -> None:
     logger.debug(f"{server.workspace.root_uri=}")
 
 
+@LSP_SERVER.feature(INITIALIZED)
+def initialized(server: LanguageServer, params: InitializedParams) -> None:
+    Thread(
+        target=index_workspace,
+        args=(server, get_executor(server)),
+        daemon=True,
+    ).start()
+
+
+def index_workspace(server: LanguageServer, executor: Executor) -> None:
+    window = server.client_capabilities.window
+    if not (window and window.work_done_progress):
+        executor.index()
+        return
+
+    token = str(uuid4())
+    server.progress.create(token)
+    server.progress.begin(
+        token,
+        WorkDoneProgressBegin(
+            title="breakfast", message="Indexing workspace", percentage=0
+        ),
+    )
+
+    def report(done: int, total: int) -> None:
+        percentage = done * 100 // total
+        if percentage > (done - 1) * 100 // total:
+            server.progress.report(
+                token,
+                WorkDoneProgressReport(
+                    message=f"{done}/{total} modules", percentage=percentage
+                ),
+            )
+
+    indexed = executor.index(report=report)
+    server.progress.end(
+        token, WorkDoneProgressEnd(message=f"Indexed {indexed} modules")
+    )
+
+
 @LSP_SERVER.feature(TEXT_DOCUMENT_PREPARE_RENAME)
 def prepare_rename(
     server: LanguageServer, params: PrepareRenameParams
@@ -142,101 +232,57 @@ def prepare_rename(
     )
 
 
-def get_source(uri: str, project_root: str, lines: Iterable[str]) -> Source:
-    return Source(
-        input_lines=tuple(line for line in lines),
-        path=uri[len("file://") :],
-        project_root=project_root,
+@LSP_SERVER.feature(TEXT_DOCUMENT_DID_OPEN)
+def did_open(server: LanguageServer, params: DidOpenTextDocumentParams) -> None:
+    CODE_ACTIONS.clear()
+    submit(
+        server,
+        partial(Analysis.open_document, document=params.text_document),
+        priority=Priority.EDIT,
     )
 
 
-@LSP_SERVER.feature(TEXT_DOCUMENT_RENAME)
-def rename(
-    server: LanguageServer, params: RenameParams
-) -> WorkspaceEdit | None:
-    document = server.workspace.get_text_document(params.text_document.uri)
-    source_lines = tuple(document.source.split("\n"))
-    line = source_lines[params.position.line]
-
-    start = find_identifier_start(line, params.position)
-    if start is None:
-        return None
-
-    project_root = server.workspace.root_uri[len("file://") :]
-    source = get_source(
-        uri=params.text_document.uri,
-        project_root=project_root,
-        lines=source_lines,
+@LSP_SERVER.feature(TEXT_DOCUMENT_DID_CHANGE)
+def did_change(
+    server: LanguageServer, params: DidChangeTextDocumentParams
+) -> None:
+    CODE_ACTIONS.clear()
+    submit(
+        server,
+        partial(
+            Analysis.change_document,
+            params=params,
+            codec=server.workspace.position_codec,
+        ),
+        priority=Priority.EDIT,
     )
-    position = source.position(row=params.position.line, column=start)
-
-    project = Project(source=source, root=project_root)
-    occurrences = project.get_occurrences(position)
-    if not occurrences:
-        return None
 
-    logger.debug(f"found: {len(occurrences)} occurrences: {occurrences}")
-    old_identifier = source.get_name_at(position)
-    if old_identifier is None:
-        return None
-    document_changes: list[
-        TextDocumentEdit | CreateFile | RenameFile | DeleteFile
-    ] = []
-    client_documents = server.workspace.text_documents
-    for source, source_occurences in groupby(
-        occurrences, lambda o: o.position.source
-    ):
-        document_uri = f"file://{source.path}"
-        logger.debug(f"{document_uri=}")
-        version = (
-            versioned.version
-            if (versioned := client_documents.get(document_uri))
-            else None
-        )
-        document_changes.append(
-            TextDocumentEdit(
-                text_document=OptionalVersionedTextDocumentIdentifier(
-                    uri=document_uri, version=version
-                ),
-                edits=[
-                    TextEdit(
-                        range=Range(
-                            start=Position(
-                                line=o.position.row, character=o.position.column
-                            ),
-                            end=Position(
-                                line=o.position.row,
-                                character=o.position.column
-                                + len(old_identifier),
-                            ),
-                        ),
-                        new_text=params.new_name,
-                    )
-                    for o in source_occurences
-                ],
-            )
-        )
 
-    return WorkspaceEdit(
-        document_changes=document_changes,
+@LSP_SERVER.feature(TEXT_DOCUMENT_DID_CLOSE)
+def did_close(
+    server: LanguageServer, params: DidCloseTextDocumentParams
+) -> None:
+    CODE_ACTIONS.clear()
+    submit(
+        server,
+        partial(Analysis.close_document, uri=params.text_document.uri),
+        priority=Priority.EDIT,
     )
 
 
-def edits_to_text_edits(
-    edits: Iterable[Edit],
-) -> list[TextEdit | AnnotatedTextEdit]:
-    return [
-        TextEdit(
-            range=Range(
-                start=Position(
-                    line=edit.start.row, character=edit.start.column
-                ),
-                end=Position(line=edit.end.row, character=edit.end.column),
-            ),
-            new_text=edit.text,
-        )
-        for edit in edits
-    ]
+@LSP_SERVER.feature(TEXT_DOCUMENT_RENAME)
+async def rename(
+    server: LanguageServer, params: RenameParams
+) -> WorkspaceEdit | None:
+    return await analyse(
+        server,
+        partial(
+            Analysis.rename,
+            params=params,
+            version=document_version(server, params.text_document.uri),
+        ),
+        priority=Priority.NAVIGATION,
+    )
 
 
 @LSP_SERVER.feature(
@@ -249,135 +295,110 @@ def edits_to_text_edits(
         resolve_provider=True,
     ),
 )
-def code_action(
+async def code_action(
     server: LanguageServer, params: CodeActionParams
 ) -> list[CodeAction] | None:
-    actions: list[CodeAction] = []
-    if params.range:
-        logger.debug(f"{params.range=}")
-        document_uri = params.text_document.uri
-        document = server.workspace.get_text_document(document_uri)
-        source_lines = tuple(document.source.split("\n"))
-        project_root = server.workspace.root_uri[len("file://") :]
-        client_documents = server.workspace.text_documents
-        version = (
-            versioned.version
-            if (versioned := client_documents.get(document_uri))
-            else None
-        )
-        source = get_source(
-            uri=document_uri, project_root=project_root, lines=source_lines
-        )
-        project = Project(source=source, root=project_root)
-        extraction_range = params.range
-        start = source.position(
-            row=extraction_range.start.line,
-            column=extraction_range.start.character,
-        )
-        end = source.position(
-            row=extraction_range.end.line,
-            column=max(extraction_range.end.character, 0),
-        )
-
-        selection = CodeSelection(
-            sources=project.sources, text_range=TextRange(start=start, end=end)
-        ).rtrim()
-
-        for name, refactoring in selection.refactorings.items():
-            edits = get_edits(refactoring, document_uri, version)
-            if edits:
-                actions.append(
-                    CodeAction(
-                        title=f"breakfast: {name}",
-                        kind=CodeActionKind.RefactorExtract
-                        if "extract" in name
-                        else CodeActionKind.Refactor,
-                        data=document_uri,
-                        edit=edits,
-                        diagnostics=[],
-                    )
-                )
-
-    logger.debug(f"Found {len(actions)} available refactoring actions.")
-    return actions
-
+    if not params.range:
+        return []
+
+    logger.debug(f"{params.range=}")
+    document_uri = params.text_document.uri
+    version = document_version(server, document_uri)
+    find = partial(
+        analyse,
+        server,
+        partial(
+            Analysis.code_actions,
+            uri=document_uri,
+            selection=params.range,
+            version=version,
+        ),
+        priority=Priority.CODE_ACTION,
+        key=(TEXT_DOCUMENT_CODE_ACTION, document_uri),
+    )
+    if version is None:
+        return await find()
+
+    key = (
+        document_uri,
+        version,
+        params.range.start.line,
+        params.range.start.character,
+        params.range.end.line,
+        params.range.end.character,
+    )
+    if (actions := CODE_ACTIONS.get(key)) is not None:
+        CODE_ACTIONS.move_to_end(key)
+        return actions
 
-def get_edits(
-    editor: Editor, document_uri: str, version: None
-) -> WorkspaceEdit | None:
-    if not editor.edits:
-        logger.debug(f"Refactoring: {editor}. No edits found.")
+    actions = await find()
+    if actions is None:
         return None
 
-    text_edits: list[TextEdit | AnnotatedTextEdit] = edits_to_text_edits(
-        editor.edits
-    )
-
-    document_changes: list[
-        TextDocumentEdit | CreateFile | RenameFile | DeleteFile
-    ] = [
-        TextDocumentEdit(
-            text_document=OptionalVersionedTextDocumentIdentifier(
-                uri=document_uri, version=version
-            ),
-            edits=text_edits,
-        )
-    ]
-    return WorkspaceEdit(document_changes=document_changes)
+    CODE_ACTIONS[key] = actions
+    if len(CODE_ACTIONS) > CODE_ACTION_CACHE_SIZE:
+        CODE_ACTIONS.popitem(last=False)
+    return actions
 
 
 @LSP_SERVER.feature(TEXT_DOCUMENT_DEFINITION)
-def go_to_definition(
+async def go_to_definition(
     server: LanguageServer, params: DefinitionParams
 ) -> Definition | list[DefinitionLink] | None:
-    document = server.workspace.get_text_document(params.text_document.uri)
-    source_lines = tuple(document.source.splitlines())
-    line = source_lines[params.position.line]
-
-    start = find_identifier_start(line, params.position)
-    if start is None:
-        return None
-
-    project_root = server.workspace.root_uri[len("file://") :]
-    source = get_source(
-        uri=params.text_document.uri,
-        project_root=project_root,
-        lines=source_lines,
+    return await analyse(
+        server,
+        partial(Analysis.definitions, params=params),
+        priority=Priority.NAVIGATION,
     )
-    project = Project(source=source, root=project_root)
-    position = source.position(row=params.position.line, column=start)
-    occurrences = project.get_occurrences(position)
-    if not occurrences:
-        return None
 
-    definitions = [o for o in occurrences if o.is_definition]
-    logger.warning(f"{definitions=}")
-    if len(definitions) == 1:
-        return make_location(definitions[0])
 
-    return [make_location_link(o) for o in definitions]
+@LSP_SERVER.feature(TEXT_DOCUMENT_REFERENCES)
+async def references(
+    server: LanguageServer, params: ReferenceParams
+) -> list[Location] | None:
+    return await analyse(
+        server,
+        partial(Analysis.references, params=params),
+        priority=Priority.NAVIGATION,
+    )
 
 
-def make_location(occurrence: Occurrence) -> Location:
-    return Location(
-        uri=f"file://{occurrence.position.source.path}",
-        range=to_range(occurrence),
+@LSP_SERVER.feature(TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT)
+async def document_highlight(
+    server: LanguageServer, params: DocumentHighlightParams
+) -> list[DocumentHighlight] | None:
+    return await analyse(
+        server,
+        partial(Analysis.highlights, params=params),
+        priority=Priority.HIGHLIGHT,
+        key=(TEXT_DOCUMENT_DOCUMENT_HIGHLIGHT, params.text_document.uri),
     )
 
 
-def make_location_link(occurrence: Occurrence) -> LocationLink:
-    return LocationLink(
-        target_uri=f"file://{occurrence.position.source.path}",
-        target_range=to_range(occurrence),
-        target_selection_range=to_range(occurrence),
+@LSP_SERVER.feature(WORKSPACE_SYMBOL)
+async def workspace_symbol(
+    server: LanguageServer, params: WorkspaceSymbolParams
+) -> list[SymbolInformation] | None:
+    if not params.query:
+        return None
+
+    return await analyse(
+        server,
+        partial(Analysis.symbols, query=params.query),
+        priority=Priority.NAVIGATION,
+        key=(WORKSPACE_SYMBOL,),
     )
 
 
-def to_range(occurrence: Occurrence) -> Range:
-    return Range(
-        start=Position(occurrence.position.row, occurrence.position.column),
-        end=Position(occurrence.position.row, occurrence.position.column),
+@LSP_SERVER.command(MEMORY_STATISTICS)
+async def memory_statistics(
+    server: LanguageServer, arguments: list[object]
+) -> dict[str, int | None]:
+    statistics = await analyse(
+        server, Analysis.memory_statistics, priority=Priority.NAVIGATION
     )
+    show_message(f"breakfast: {statistics}")
+    return asdict(statistics)
 
 
 def show_message(message: str) -> None:
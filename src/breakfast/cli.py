@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import argparse
+import difflib
+import keyword
+import logging
+import os
+import sys
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import groupby
+
+from breakfast import __version__
+from breakfast.edits import ConflictingEditsError
+from breakfast.project import Project
+from breakfast.refactoring import CodeSelection
+from breakfast.source import Source
+from breakfast.types import Edit, NotFoundError, TextRange
+
+logger = logging.getLogger(__name__)
+
+RENAME = "rename"
+REFACTOR = "refactor"
+
+
+class TargetError(Exception):
+    pass
+
+
+@dataclass(frozen=True, kw_only=True)
+class Target:
+    path: str
+    start: tuple[int, int]
+    end: tuple[int, int]
+
+    @classmethod
+    def parse(cls, text: str) -> Target:
+        """
+        Parse `path:line:column[-line:column]`, with 1-based lines and columns.
+        """
+        path, separator, span = text.partition(":")
+        if not separator:
+            raise TargetError(f"Expected path:line:column, got {text!r}.")
+
+        start_text, _, end_text = span.partition("-")
+        start = parse_line_and_column(start_text)
+        end = parse_line_and_column(end_text) if end_text else start
+        return cls(path=os.path.abspath(path), start=start, end=end)
+
+
+def parse_target(text: str) -> Target:
+    try:
+        return Target.parse(text)
+    except TargetError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def parse_line_and_column(text: str) -> tuple[int, int]:
+    line, _, column = text.partition(":")
+    try:
+        row, column_offset = int(line) - 1, int(column or 1) - 1
+    except ValueError as e:
+        raise TargetError(f"Expected line:column, got {text!r}.") from e
+
+    if row < 0 or column_offset < 0:
+        raise TargetError(f"Lines and columns start at 1, got {text!r}.")
+
+    return row, column_offset
+
+
+@dataclass(frozen=True, kw_only=True)
+class Job:
+    root: str
+    kind: str
+    target: Target
+    refactoring: str | None = None
+    new_name: str | None = None
+
+
+@dataclass(kw_only=True)
+class JobResult:
+    job: Job
+    changes: dict[str, tuple[str, str]] = field(default_factory=dict)
+    error: str | None = None
+
+
+def run_job(job: Job) -> JobResult:
+    try:
+        project = Project(root=job.root, source=read_source(job))
+        edits = (
+            rename_edits(job, project)
+            if job.kind == RENAME
+            else refactoring_edits(job, project)
+        )
+        if not edits:
+            return JobResult(job=job, error="No edits found.")
+
+        changes = apply_grouped(edits)
+    except (
+        ConflictingEditsError,
+        NotFoundError,
+        KeyError,
+        TargetError,
+        OSError,
+        SyntaxError,
+    ) as e:
+        return JobResult(job=job, error=f"{type(e).__name__}: {e}")
+
+    return JobResult(job=job, changes=changes)
+
+
+def read_source(job: Job) -> Source:
+    with open(job.target.path, encoding="utf-8") as source_file:
+        text = source_file.read()
+    return Source(
+        input_lines=tuple(text.removesuffix("\n").split("\n")),
+        path=job.target.path,
+        project_root=job.root,
+    )
+
+
+def target_range(job: Job, project: Project) -> TextRange:
+    for source in project.sources:
+        if source.path == job.target.path:
+            return source.text_range(
+                start=source.position(*job.target.start),
+                end=source.position(*job.target.end),
+            )
+
+    raise TargetError(f"{job.target.path} is not part of the project.")
+
+
+def rename_edits(job: Job, project: Project) -> list[Edit]:
+    if not job.new_name:
+        raise TargetError("No new name given.")
+    if not job.new_name.isidentifier() or keyword.iskeyword(job.new_name):
+        raise TargetError(f"{job.new_name!r} is not a valid name.")
+
+    position = target_range(job, project).start
+    old_name = position.source.get_name_at(position)
+    if old_name is None:
+        raise TargetError("No name found at position.")
+
+    return [
+        Edit(
+            text_range=occurrence.position.to(
+                occurrence.position + len(old_name)
+            ),
+            text=job.new_name,
+        )
+        for occurrence in project.get_occurrences(position)
+    ]
+
+
+def refactoring_edits(job: Job, project: Project) -> list[Edit]:
+    if job.refactoring not in CodeSelection._refactorings:
+        raise TargetError(f"Unknown refactoring: {job.refactoring!r}.")
+
+    selection = CodeSelection(
+        sources=project.sources, text_range=target_range(job, project)
+    ).rtrim()
+    editor = CodeSelection._refactorings[job.refactoring].from_selection(
+        selection
+    )
+    if editor is None:
+        raise TargetError(
+            f"{job.refactoring!r} does not apply to the selected code."
+        )
+
+    return list(editor.edits)
+
+
+def apply_grouped(edits: Iterable[Edit]) -> dict[str, tuple[str, str]]:
+    changes = {}
+    for source, source_edits in groupby(
+        sorted(edits, key=lambda e: e.source.path), key=lambda e: e.source
+    ):
+        with open(source.path, encoding="utf-8") as source_file:
+            old_text = source_file.read()
+        new_text = apply_edits(source, source_edits)
+        if old_text.endswith("\n"):
+            new_text += "\n"
+        changes[source.path] = (old_text, new_text)
+    return changes
+
+
+def apply_edits(source: Source, edits: Iterable[Edit]) -> str:
+    full_range = source.text_range(
+        start=source.position(0, 0), end=source.position(len(source.lines), 0)
+    )
+    return "\n".join(full_range.text_with_substitutions(list(edits)))
+
+
+def run_jobs(jobs: Sequence[Job], number_of_jobs: int) -> list[JobResult]:
+    if number_of_jobs <= 1 or len(jobs) <= 1:
+        return [run_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=number_of_jobs) as executor:
+        return list(executor.map(run_job, jobs))
+
+
+def merge(
+    results: Iterable[JobResult],
+) -> tuple[dict[str, tuple[str, str]], list[str]]:
+    merged: dict[str, tuple[str, str]] = {}
+    changed_by: dict[str, Job] = {}
+    errors = []
+    for result in results:
+        if result.error:
+            errors.append(f"{describe(result.job)}: {result.error}")
+            continue
+
+        for path, change in result.changes.items():
+            if path in changed_by:
+                errors.append(
+                    f"{describe(result.job)}: conflicts with "
+                    f"{describe(changed_by[path])} in {path}."
+                )
+                continue
+            changed_by[path] = result.job
+            merged[path] = change
+
+    return merged, errors
+
+
+def describe(job: Job) -> str:
+    line, column = job.target.start
+    action = (
+        f"rename to {job.new_name}" if job.kind == RENAME else job.refactoring
+    )
+    return f"{job.target.path}:{line + 1}:{column + 1} ({action})"
+
+
+def diff(path: str, old_text: str, new_text: str, root: str) -> str:
+    relative = os.path.relpath(path, root)
+    return "".join(
+        difflib.unified_diff(
+            old_text.splitlines(keepends=True),
+            new_text.splitlines(keepends=True),
+            fromfile=f"a/{relative}",
+            tofile=f"b/{relative}",
+        )
+    )
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="breakfast",
+        description="Apply breakfast refactorings to files on disk.",
+        epilog=(
+            "Targets are path:line:column or path:line:column-line:column, "
+            "with lines and columns starting at 1. Each target is processed "
+            "as an independent job against the files as they are on disk."
+        ),
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    parser.add_argument(
+        "--root",
+        default=os.getcwd(),
+        help="project root used to find other modules (default: cwd)",
+    )
+    parser.add_argument(
+        "-i",
+        "--in-place",
+        action="store_true",
+        help="write changes to the files instead of printing a diff",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of targets to process in parallel",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the available refactorings")
+    rename = commands.add_parser(RENAME, help="rename a name everywhere")
+    rename.add_argument("new_name")
+    rename.add_argument("targets", nargs="+", type=parse_target)
+    refactor = commands.add_parser(
+        REFACTOR, help="apply a refactoring to a selection"
+    )
+    refactor.add_argument("refactoring", help="e.g. 'extract function'")
+    refactor.add_argument("targets", nargs="+", type=parse_target)
+    return parser
+
+
+def run(argv: Sequence[str]) -> int:
+    arguments = make_parser().parse_args(argv)
+    if arguments.command == "list":
+        for name in sorted(CodeSelection._refactorings):
+            print(name)
+        return 0
+
+    root = os.path.abspath(arguments.root)
+    jobs = [
+        Job(
+            root=root,
+            kind=arguments.command,
+            target=target,
+            refactoring=getattr(arguments, "refactoring", None),
+            new_name=getattr(arguments, "new_name", None),
+        )
+        for target in arguments.targets
+    ]
+    changes, errors = merge(run_jobs(jobs, arguments.jobs))
+    for path, (old_text, new_text) in sorted(changes.items()):
+        if arguments.in_place:
+            with open(path, "w", encoding="utf-8") as source_file:
+                source_file.write(new_text)
+        else:
+            sys.stdout.write(diff(path, old_text, new_text, root))
+
+    for error in errors:
+        print(error, file=sys.stderr)
+
+    return 1 if errors else 0
+
+
+def main() -> None:
+    sys.exit(run(sys.argv[1:]))
@@ -0,0 +1,105 @@
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from enum import Enum
+from itertools import accumulate
+
+from breakfast import types
+
+
+class ConflictingEditsError(Exception):
+    pass
+
+
+class Buffer(Enum):
+    ORIGINAL = "original"
+    ADDED = "added"
+
+
+@dataclass(frozen=True, slots=True)
+class Piece:
+    buffer: Buffer
+    start: int
+    end: int
+
+
+@dataclass(kw_only=True, slots=True)
+class PieceTable:
+    original: str
+    added: str
+    pieces: Sequence[Piece]
+
+    @classmethod
+    def from_edits(
+        cls,
+        lines: Sequence[str],
+        edits: Iterable[types.Edit],
+        *,
+        first_row: int = 0,
+    ) -> "PieceTable":
+        """Build the table for `edits` applied to `lines`.
+
+        Each edit is turned into character offsets once, so applying k edits
+        to an n-character text takes O(n + k log k). Insertions at the same
+        position keep their order in `edits`. Overlapping edits raise
+        ConflictingEditsError.
+        """
+        original = "\n".join(lines)
+        line_starts = (0, *accumulate(len(line) + 1 for line in lines))
+
+        def offset(position: types.Position) -> int:
+            row = position.row - first_row
+            if row < 0:
+                return 0
+            if row >= len(lines):
+                return len(original)
+            return line_starts[row] + min(position.column, len(lines[row]))
+
+        replacements = sorted(
+            (offset(edit.start), offset(edit.end), index, edit.text)
+            for index, edit in enumerate(edits)
+        )
+        pieces = []
+        added = []
+        added_length = 0
+        current = 0
+        for start, end, _, text in replacements:
+            if start < current:
+                raise ConflictingEditsError(
+                    f"Edit at offset {start} overlaps a previous edit ending "
+                    f"at offset {current}."
+                )
+            if start > current:
+                pieces.append(
+                    Piece(buffer=Buffer.ORIGINAL, start=current, end=start)
+                )
+            if text:
+                pieces.append(
+                    Piece(
+                        buffer=Buffer.ADDED,
+                        start=added_length,
+                        end=added_length + len(text),
+                    )
+                )
+                added.append(text)
+                added_length += len(text)
+            current = max(current, end)
+        if current < len(original):
+            pieces.append(
+                Piece(buffer=Buffer.ORIGINAL, start=current, end=len(original))
+            )
+
+        return cls(original=original, added="".join(added), pieces=pieces)
+
+    @property
+    def text(self) -> str:
+        buffers = {Buffer.ORIGINAL: self.original, Buffer.ADDED: self.added}
+        return "".join(
+            buffers[piece.buffer][piece.start : piece.end]
+            for piece in self.pieces
+        )
+
+
+def apply_edits(
+    lines: Sequence[str], edits: Iterable[types.Edit], *, first_row: int = 0
+) -> str:
+    return PieceTable.from_edits(lines, edits, first_row=first_row).text
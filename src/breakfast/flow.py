@@ -0,0 +1,655 @@
+from __future__ import annotations
+
+import ast
+from collections import OrderedDict
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from functools import singledispatch
+
+from breakfast import types
+from breakfast.visitor import generic_apply
+
+FLOW_CACHE_SIZE = 128
+
+Location = tuple[int, int, int | None, int | None]
+ScopeNode = ast.Module | ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef
+
+flows: OrderedDict[tuple[str, Location, str], Flow] = OrderedDict()
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Step:
+    index: int
+    uses: frozenset[str]
+    definitions: frozenset[str]
+
+
+@dataclass(eq=False, kw_only=True, slots=True)
+class Block:
+    steps: list[Step] = field(default_factory=list)
+    successors: list[Block] = field(default_factory=list)
+    predecessors: list[Block] = field(default_factory=list)
+
+    def link(self, successor: Block) -> None:
+        self.successors.append(successor)
+        successor.predecessors.append(self)
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Point:
+    block: Block | None
+    step: int
+
+
+@dataclass(kw_only=True, slots=True)
+class Loop:
+    header: Block
+    after: Block
+
+
+@dataclass(kw_only=True)
+class Builder:
+    blocks: list[Block] = field(default_factory=list)
+    steps: list[Step] = field(default_factory=list)
+    loops: list[Loop] = field(default_factory=list)
+    handlers: set[int] = field(default_factory=set)
+    before: dict[Location, Point] = field(default_factory=dict)
+    after: dict[Location, Point] = field(default_factory=dict)
+    step_ranges: dict[Location, range] = field(default_factory=dict)
+    siblings: dict[Location, tuple[Sequence[ast.stmt], int]] = field(
+        default_factory=dict
+    )
+    exit: Block = field(default_factory=Block)
+
+    def new_block(self) -> Block:
+        block = Block()
+        self.blocks.append(block)
+        return block
+
+    def add_step(
+        self, block: Block, uses: Iterable[str], definitions: Iterable[str]
+    ) -> None:
+        step = Step(
+            index=len(self.steps),
+            uses=frozenset(uses),
+            definitions=frozenset(definitions),
+        )
+        self.steps.append(step)
+        block.steps.append(step)
+
+    def add_statements(
+        self, statements: Sequence[ast.stmt], block: Block | None
+    ) -> Block | None:
+        for index, statement in enumerate(statements):
+            key = location(statement)
+            self.siblings[key] = (statements, index)
+            if block is None:
+                block = self.new_block()
+            self.before[key] = Point(block=block, step=len(block.steps))
+            first_step = len(self.steps)
+            block = add_statement(statement, self, block)
+            self.step_ranges[key] = range(first_step, len(self.steps))
+            self.after[key] = Point(
+                block=block, step=len(block.steps) if block else 0
+            )
+
+        return block
+
+    def add_guarded(
+        self, statements: Sequence[ast.stmt], block: Block
+    ) -> tuple[Block | None, list[Block]]:
+        first_block = len(self.blocks)
+        entry = self.new_block()
+        block.link(entry)
+        end = self.add_statements(statements, entry)
+        return end, self.blocks[first_block:]
+
+
+@dataclass(kw_only=True)
+class Flow:
+    builder: Builder
+    live_in: list[frozenset[str]]
+    live_out: dict[int, frozenset[str]]
+    reaching_in: dict[int, frozenset[tuple[str, int]]]
+    assigned_in: dict[int, frozenset[str]]
+
+    @classmethod
+    def from_scope(cls, node: ScopeNode) -> Flow:
+        builder = Builder()
+        entry = builder.new_block()
+        if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef):
+            builder.add_step(
+                entry, uses=(), definitions=argument_names(node.args)
+            )
+        end = builder.add_statements(node.body, entry)
+        if end is not None:
+            end.link(builder.exit)
+        builder.blocks.append(builder.exit)
+
+        live_in, live_out = liveness(builder)
+        return cls(
+            builder=builder,
+            live_in=live_in,
+            live_out=live_out,
+            reaching_in=reaching_definitions(builder),
+            assigned_in=definite_assignments(builder),
+        )
+
+    def live_before(self, statement: ast.stmt) -> frozenset[str]:
+        return self.live_at(self.builder.before.get(location(statement)))
+
+    def live_after(self, statement: ast.stmt) -> frozenset[str]:
+        return self.live_at(self.builder.after.get(location(statement)))
+
+    def live_at(self, point: Point | None) -> frozenset[str]:
+        if point is None or point.block is None:
+            return frozenset()
+
+        if point.step < len(point.block.steps):
+            return self.live_in[point.block.steps[point.step].index]
+
+        return self.live_out[id(point.block)]
+
+    def defined_before(self, statement: ast.stmt) -> frozenset[str]:
+        point = self.builder.before.get(location(statement))
+        if point is None or point.block is None:
+            return frozenset()
+
+        reaching = set(self.reaching_in[id(point.block)])
+        for step in point.block.steps[: point.step]:
+            reaching = {d for d in reaching if d[0] not in step.definitions}
+            reaching.update((name, step.index) for name in step.definitions)
+        return frozenset(name for name, _ in reaching)
+
+    def assigned_before(self, statement: ast.stmt) -> frozenset[str]:
+        point = self.builder.before.get(location(statement))
+        if point is None or point.block is None:
+            return frozenset()
+
+        return self.assigned_in[id(point.block)].union(
+            *(step.definitions for step in point.block.steps[: point.step])
+        )
+
+    def maybe_unassigned_before(self, statement: ast.stmt) -> frozenset[str]:
+        """
+        The names that may be read from statement on, and that are bound on
+        some, but not all, paths to it.
+        """
+        return (
+            self.live_before(statement) & self.defined_before(statement)
+        ) - self.assigned_before(statement)
+
+    def uses(self, statement: ast.stmt) -> frozenset[str]:
+        return frozenset(
+            name
+            for index in self.builder.step_ranges.get(location(statement), ())
+            for name in self.builder.steps[index].uses
+        )
+
+    def definitions(self, statement: ast.stmt) -> frozenset[str]:
+        return frozenset(
+            name
+            for index in self.builder.step_ranges.get(location(statement), ())
+            for name in self.builder.steps[index].definitions
+        )
+
+    def names(self, statement: ast.stmt) -> frozenset[str]:
+        return self.uses(statement) | self.definitions(statement)
+
+    def siblings_before(self, statement: ast.stmt) -> Sequence[ast.stmt]:
+        statements, index = self.builder.siblings.get(
+            location(statement), ((), 0)
+        )
+        return statements[:index]
+
+    def siblings_after(self, statement: ast.stmt) -> Sequence[ast.stmt]:
+        statements, index = self.builder.siblings.get(
+            location(statement), ((), -1)
+        )
+        return statements[index + 1 :]
+
+
+def analyze(source: types.Source, node: ScopeNode) -> Flow:
+    if isinstance(node, ast.Module):
+        text = "\n".join(source.text)
+    else:
+        text = (
+            node_range.text if (node_range := source.node_range(node)) else ""
+        )
+    key = (source.path, location(node), text)
+
+    if (flow := flows.get(key)) is not None:
+        flows.move_to_end(key)
+        return flow
+
+    flow = flows[key] = Flow.from_scope(node)
+    if len(flows) > FLOW_CACHE_SIZE:
+        flows.popitem(last=False)
+    return flow
+
+
+def location(node: ast.stmt | ScopeNode) -> Location:
+    if isinstance(node, ast.Module):
+        return (0, 0, None, None)
+
+    return (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+
+
+def liveness(
+    builder: Builder,
+) -> tuple[list[frozenset[str]], dict[int, frozenset[str]]]:
+    live_in_block = {id(block): frozenset[str]() for block in builder.blocks}
+    live_out = dict(live_in_block)
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(builder.blocks):
+            out = frozenset[str]().union(
+                *(live_in_block[id(s)] for s in block.successors)
+            )
+            live = out
+            for step in reversed(block.steps):
+                live = step.uses | (live - step.definitions)
+            if out != live_out[id(block)] or live != live_in_block[id(block)]:
+                live_out[id(block)] = out
+                live_in_block[id(block)] = live
+                changed = True
+
+    live_in = [frozenset[str]()] * len(builder.steps)
+    for block in builder.blocks:
+        live = live_out[id(block)]
+        for step in reversed(block.steps):
+            live = step.uses | (live - step.definitions)
+            live_in[step.index] = live
+
+    return live_in, live_out
+
+
+def reaching_definitions(
+    builder: Builder,
+) -> dict[int, frozenset[tuple[str, int]]]:
+    reaching_in = {
+        id(block): frozenset[tuple[str, int]]() for block in builder.blocks
+    }
+    reaching_out = dict(reaching_in)
+    changed = True
+    while changed:
+        changed = False
+        for block in builder.blocks:
+            incoming = frozenset[tuple[str, int]]().union(
+                *(reaching_out[id(p)] for p in block.predecessors)
+            )
+            reaching = set(incoming)
+            for step in block.steps:
+                reaching = {d for d in reaching if d[0] not in step.definitions}
+                reaching.update((name, step.index) for name in step.definitions)
+            outgoing = frozenset(reaching)
+            if outgoing != reaching_out[id(block)]:
+                reaching_out[id(block)] = outgoing
+                changed = True
+            reaching_in[id(block)] = incoming
+
+    return reaching_in
+
+
+def definite_assignments(builder: Builder) -> dict[int, frozenset[str]]:
+    """
+    The names bound on every path to the start of each block. An exception
+    can leave a guarded block before any of its steps ran, so a handler only
+    gets the names bound on entry to the blocks it guards.
+    """
+    everything = frozenset(
+        name for step in builder.steps for name in step.definitions
+    )
+    entry = builder.blocks[0]
+    assigned_in = {id(block): everything for block in builder.blocks}
+    assigned_in[id(entry)] = frozenset()
+    assigned_out = {id(block): everything for block in builder.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in builder.blocks:
+            incoming = assigned_in[id(block)]
+            if block is not entry and block.predecessors:
+                exits = (
+                    assigned_in
+                    if id(block) in builder.handlers
+                    else assigned_out
+                )
+                incoming = everything.intersection(
+                    *(exits[id(p)] for p in block.predecessors)
+                )
+            outgoing = incoming.union(
+                *(step.definitions for step in block.steps)
+            )
+            if (
+                incoming != assigned_in[id(block)]
+                or outgoing != assigned_out[id(block)]
+            ):
+                assigned_in[id(block)] = incoming
+                assigned_out[id(block)] = outgoing
+                changed = True
+
+    return assigned_in
+
+
+@singledispatch
+def add_statement(
+    node: ast.stmt, builder: Builder, block: Block
+) -> Block | None:
+    uses, definitions = names_in(node)
+    builder.add_step(block, uses=uses, definitions=definitions)
+    return block
+
+
+@add_statement.register
+def add_if(node: ast.If, builder: Builder, block: Block) -> Block | None:
+    uses, definitions = names_in(node.test)
+    builder.add_step(block, uses=uses, definitions=definitions)
+    return join(
+        builder,
+        [
+            builder.add_statements(node.body, branch(block, builder)),
+            builder.add_statements(node.orelse, branch(block, builder)),
+        ],
+    )
+
+
+@add_statement.register
+def add_while(node: ast.While, builder: Builder, block: Block) -> Block | None:
+    header = branch(block, builder)
+    uses, definitions = names_in(node.test)
+    builder.add_step(header, uses=uses, definitions=definitions)
+    return add_loop_body(node, builder, header, header)
+
+
+@add_statement.register
+def add_for(
+    node: ast.For | ast.AsyncFor, builder: Builder, block: Block
+) -> Block | None:
+    uses, definitions = names_in(node.iter)
+    builder.add_step(block, uses=uses, definitions=definitions)
+    header = branch(block, builder)
+    body = branch(header, builder)
+    uses, definitions = names_in(node.target)
+    builder.add_step(body, uses=uses, definitions=definitions)
+    return add_loop_body(node, builder, header, body)
+
+
+def add_loop_body(
+    node: ast.While | ast.For | ast.AsyncFor,
+    builder: Builder,
+    header: Block,
+    body: Block,
+) -> Block | None:
+    after = builder.new_block()
+    builder.loops.append(Loop(header=header, after=after))
+    end = builder.add_statements(node.body, body)
+    builder.loops.pop()
+    if end is not None:
+        end.link(header)
+    orelse_end = builder.add_statements(node.orelse, branch(header, builder))
+    if orelse_end is not None:
+        orelse_end.link(after)
+    return after
+
+
+@add_statement.register
+def add_with(
+    node: ast.With | ast.AsyncWith, builder: Builder, block: Block
+) -> Block | None:
+    uses, definitions = names_in(*node.items)
+    builder.add_step(block, uses=uses, definitions=definitions)
+    return builder.add_statements(node.body, block)
+
+
+@add_statement.register
+def add_try(
+    node: ast.Try | ast.TryStar, builder: Builder, block: Block
+) -> Block | None:
+    body_end, body_blocks = builder.add_guarded(node.body, block)
+    ends = [builder.add_statements(node.orelse, body_end)]
+    for handler in node.handlers:
+        handler_block = builder.new_block()
+        builder.handlers.add(id(handler_block))
+        for guarded in (block, *body_blocks):
+            guarded.link(handler_block)
+        uses, definitions = names_in(*([handler.type] if handler.type else []))
+        builder.add_step(
+            handler_block,
+            uses=uses,
+            definitions=(
+                *definitions,
+                *([handler.name] if handler.name else []),
+            ),
+        )
+        ends.append(builder.add_statements(handler.body, handler_block))
+
+    after = join(builder, ends)
+    if not node.finalbody:
+        return after
+
+    return builder.add_statements(
+        node.finalbody, after if after else builder.new_block()
+    )
+
+
+@add_statement.register
+def add_match(node: ast.Match, builder: Builder, block: Block) -> Block | None:
+    uses, definitions = names_in(node.subject)
+    builder.add_step(block, uses=uses, definitions=definitions)
+    last = node.cases[-1]
+    exhaustive = last.guard is None and irrefutable(last.pattern)
+    ends: list[Block | None] = [] if exhaustive else [block]
+    for case in node.cases:
+        case_block = branch(block, builder)
+        uses, definitions = names_in(
+            case.pattern, *([case.guard] if case.guard else [])
+        )
+        builder.add_step(case_block, uses=uses, definitions=definitions)
+        ends.append(builder.add_statements(case.body, case_block))
+
+    return join(builder, ends)
+
+
+def irrefutable(pattern: ast.pattern) -> bool:
+    if isinstance(pattern, ast.MatchAs):
+        return pattern.pattern is None or irrefutable(pattern.pattern)
+    if isinstance(pattern, ast.MatchOr):
+        return any(irrefutable(p) for p in pattern.patterns)
+    return False
+
+
+@add_statement.register
+def add_return(node: ast.Return, builder: Builder, block: Block) -> None:
+    uses, definitions = names_in(*([node.value] if node.value else []))
+    builder.add_step(block, uses=uses, definitions=definitions)
+    block.link(builder.exit)
+
+
+@add_statement.register
+def add_raise(node: ast.Raise, builder: Builder, block: Block) -> None:
+    uses, definitions = names_in(node)
+    builder.add_step(block, uses=uses, definitions=definitions)
+
+
+@add_statement.register
+def add_break(node: ast.Break, builder: Builder, block: Block) -> None:
+    if builder.loops:
+        block.link(builder.loops[-1].after)
+
+
+@add_statement.register
+def add_continue(node: ast.Continue, builder: Builder, block: Block) -> None:
+    if builder.loops:
+        block.link(builder.loops[-1].header)
+
+
+def branch(block: Block, builder: Builder) -> Block:
+    new_block = builder.new_block()
+    block.link(new_block)
+    return new_block
+
+
+def join(builder: Builder, ends: Iterable[Block | None]) -> Block | None:
+    reachable = [end for end in ends if end is not None]
+    if not reachable:
+        return None
+
+    after = builder.new_block()
+    for end in reachable:
+        end.link(after)
+    return after
+
+
+@dataclass(kw_only=True, slots=True)
+class Names:
+    uses: set[str] = field(default_factory=set)
+    definitions: set[str] = field(default_factory=set)
+    local: frozenset[str] = frozenset()
+
+    def use(self, name: str) -> None:
+        if name not in self.local:
+            self.uses.add(name)
+
+    def define(self, name: str) -> None:
+        if name not in self.local:
+            self.definitions.add(name)
+
+    def nested(self, local: Iterable[str]) -> Names:
+        return Names(
+            uses=self.uses,
+            definitions=set(),
+            local=self.local | frozenset(local),
+        )
+
+
+def names_in(*nodes: ast.AST) -> tuple[set[str], set[str]]:
+    names = Names()
+    for node in nodes:
+        collect(node, names)
+    return names.uses, names.definitions
+
+
+@singledispatch
+def collect(node: ast.AST, names: Names) -> None:
+    generic_apply(collect, node, names)
+
+
+@collect.register
+def collect_name(node: ast.Name, names: Names) -> None:
+    if isinstance(node.ctx, ast.Load):
+        names.use(node.id)
+    else:
+        names.define(node.id)
+
+
+@collect.register
+def collect_aug_assign(node: ast.AugAssign, names: Names) -> None:
+    collect(node.value, names)
+    if isinstance(node.target, ast.Name):
+        names.use(node.target.id)
+    collect(node.target, names)
+
+
+@collect.register
+def collect_assign(node: ast.Assign, names: Names) -> None:
+    collect(node.value, names)
+    for target in node.targets:
+        collect(target, names)
+
+
+@collect.register
+def collect_alias(node: ast.alias, names: Names) -> None:
+    names.define(node.asname or node.name.split(".")[0])
+
+
+@collect.register
+def collect_capture(node: ast.MatchAs | ast.MatchStar, names: Names) -> None:
+    generic_apply(collect, node, names)
+    if node.name:
+        names.define(node.name)
+
+
+@collect.register
+def collect_match_mapping(node: ast.MatchMapping, names: Names) -> None:
+    generic_apply(collect, node, names)
+    if node.rest:
+        names.define(node.rest)
+
+
+@collect.register
+def collect_function(
+    node: ast.FunctionDef | ast.AsyncFunctionDef, names: Names
+) -> None:
+    for decorator in node.decorator_list:
+        collect(decorator, names)
+    for default in (*node.args.defaults, *node.args.kw_defaults):
+        if default:
+            collect(default, names)
+    names.define(node.name)
+    body = names.nested((*argument_names(node.args), *stored_names(node.body)))
+    for statement in node.body:
+        collect(statement, body)
+
+
+@collect.register
+def collect_class(node: ast.ClassDef, names: Names) -> None:
+    for expression in (*node.decorator_list, *node.bases, *node.keywords):
+        collect(expression, names)
+    names.define(node.name)
+    body = names.nested(stored_names(node.body))
+    for statement in node.body:
+        collect(statement, body)
+
+
+@collect.register
+def collect_lambda(node: ast.Lambda, names: Names) -> None:
+    for default in (*node.args.defaults, *node.args.kw_defaults):
+        if default:
+            collect(default, names)
+    collect(node.body, names.nested(argument_names(node.args)))
+
+
+@collect.register
+def collect_comprehension(
+    node: ast.ListComp | ast.SetComp | ast.GeneratorExp | ast.DictComp,
+    names: Names,
+) -> None:
+    collect(node.generators[0].iter, names)
+    inner = names.nested(
+        name
+        for generator in node.generators
+        for name in stored_names([generator.target])
+    )
+    for child in ast.iter_child_nodes(node):
+        if child is not node.generators[0]:
+            collect(child, inner)
+    collect(node.generators[0].target, inner)
+    for condition in node.generators[0].ifs:
+        collect(condition, inner)
+
+
+@collect.register
+def collect_global(node: ast.Global | ast.Nonlocal, names: Names) -> None:
+    return
+
+
+def argument_names(arguments: ast.arguments) -> list[str]:
+    return [
+        argument.arg
+        for argument in (
+            *arguments.posonlyargs,
+            *arguments.args,
+            *arguments.kwonlyargs,
+            *([arguments.vararg] if arguments.vararg else []),
+            *([arguments.kwarg] if arguments.kwarg else []),
+        )
+    ]
+
+
+def stored_names(nodes: Iterable[ast.AST]) -> set[str]:
+    names = Names()
+    for node in nodes:
+        collect(node, names)
+    return names.definitions
@@ -2,27 +2,43 @@ from __future__ import annotations
 
 import ast
 import logging
+import sys
 
 try:
     from ast import TypeVar
 except ImportError:  # pragma: nocover
     TypeVar = None  # type: ignore[assignment,misc]
 
-from collections import deque
-from collections.abc import Iterable, Iterator, Sequence
-from dataclasses import dataclass
-from functools import singledispatch
-from typing import Protocol, Self
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Executor
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from functools import partial, singledispatch
+from heapq import merge
+from typing import Any, Protocol, Self, overload
 
 from breakfast import types
+from breakfast.source import Source, identifiers
 from breakfast.types import Occurrence, Position
-from breakfast.visitor import generic_visit
+from breakfast.visitor import generic_apply
 
 STATIC_METHOD = "staticmethod"
+INDEXED_NODE_TYPES = (ast.Name, ast.arg, ast.FunctionDef, ast.AsyncFunctionDef)
+STATEMENT_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+LOCAL_COLLECTOR_CACHE_SIZE = 32
+EXPORT_SUMMARY_CACHE_SIZE = 4096
+COMPILED_MODULE_CACHE_SIZE = 256
 logger = logging.getLogger(__name__)
 
 
-@dataclass(frozen=True, kw_only=True)
+class PartialCollectionError(Exception):
+    pass
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
 class NameOccurrence:
     name: str
     position: types.Position
@@ -30,12 +46,7 @@ class NameOccurrence:
     is_definition: bool
 
 
-@dataclass(frozen=True, kw_only=True)
-class SuperCall:
-    occurrence: NameOccurrence
-
-
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, kw_only=True, slots=True)
 class Nonlocal:
     name: str
     position: types.Position
@@ -43,7 +54,7 @@ class Nonlocal:
     is_definition: bool = False
 
 
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, kw_only=True, slots=True)
 class Global:
     name: str
     position: types.Position
@@ -51,9 +62,73 @@ class Global:
     is_definition: bool = False
 
 
-@dataclass(kw_only=True)
-class Delay:
-    delayed: Iterator[object]
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ExportedName:
+    name: str
+    row: int
+    column: int
+    types: tuple[tuple[str, ...], ...] = ()
+    bases: tuple[tuple[str, ...], ...] = ()
+    attributes: tuple[ExportedName, ...] = ()
+    instance_attributes: tuple[ExportedName, ...] = ()
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ImportedName:
+    name: str
+    row: int
+    column: int
+    module: tuple[str, ...] | None
+    level: int = 0
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class ExportSummary:
+    """
+    What other modules can see of a module: its top-level names, class and
+    instance attributes, imports and re-exports, with the references their
+    types come from.
+    """
+
+    names: tuple[ExportedName | ImportedName, ...]
+    imported_modules: frozenset[tuple[str, ...]]
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CompiledOccurrence:
+    kind: type[NameOccurrence | Nonlocal | Global]
+    name: str
+    row: int
+    column: int
+    is_definition: bool
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CompiledAttribute:
+    value: CompiledOccurrence | CompiledAttribute
+    attribute: CompiledOccurrence
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CompiledBody:
+    names: frozenset[str]
+    instructions: tuple[tuple[Callable[..., None], tuple[Any, ...]], ...]
+    bindings: tuple[tuple[Callable[..., None], tuple[Any, ...]], ...]
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CompiledModule:
+    """
+    The collector calls made while walking one module, with occurrences
+    reduced to their rows and columns. Nothing outside the module is
+    resolved, so it can be compiled in another process and cached for as
+    long as the module's text stays the same. Each function body is kept
+    whole and as just its binding statements, so linking can choose per
+    query.
+    """
+
+    instructions: tuple[tuple[Callable[..., None], tuple[Any, ...]], ...]
+    bodies: tuple[CompiledBody, ...]
 
 
 @singledispatch
@@ -123,18 +198,88 @@ class Namespace(Protocol):
     attributes: dict[str, Name]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True, eq=False)
+class Occurrences(Sequence[Occurrence]):
+    by_source: dict[types.Source, list[Occurrence]] = field(
+        default_factory=dict
+    )
+    sources: list[types.Source] = field(default_factory=list)
+    length: int = 0
+
+    def add(self, occurrence: Occurrence) -> None:
+        source = occurrence.position.source
+        if (bucket := self.by_source.get(source)) is None:
+            bucket = self.by_source[source] = []
+            insort(self.sources, source, key=source_path)
+        key = row_and_column(occurrence)
+        start = bisect_left(bucket, key, key=row_and_column)
+        end = bisect_right(bucket, key, lo=start, key=row_and_column)
+        if occurrence in bucket[start:end]:
+            return
+
+        bucket.insert(end, occurrence)
+        self.length += 1
+
+    def in_source(self, source: types.Source) -> Sequence[Occurrence]:
+        return self.by_source.get(source, ())
+
+    def __contains__(self, other: object) -> bool:
+        if not isinstance(other, NameOccurrence | Nonlocal | Global):
+            return False
+
+        bucket = self.in_source(other.position.source)
+        key = row_and_column(other)
+        start = bisect_left(bucket, key, key=row_and_column)
+        end = bisect_right(bucket, key, lo=start, key=row_and_column)
+        return other in bucket[start:end]
+
+    def __iter__(self) -> Iterator[Occurrence]:
+        for source in self.sources:
+            yield from self.by_source[source]
+
+    def __reversed__(self) -> Iterator[Occurrence]:
+        for source in reversed(self.sources):
+            yield from reversed(self.by_source[source])
+
+    def __len__(self) -> int:
+        return self.length
+
+    @overload
+    def __getitem__(self, index: int) -> Occurrence: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Occurrence]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> Occurrence | Sequence[Occurrence]:
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        if index < 0:
+            index += self.length
+        if 0 <= index < self.length:
+            for source in self.sources:
+                bucket = self.by_source[source]
+                if index < len(bucket):
+                    return bucket[index]
+                index -= len(bucket)
+
+        raise IndexError(index)
+
+
+@dataclass(kw_only=True, slots=True)
 class Name:
     attributes: dict[str, Name]
     types: list[Namespace]
-    occurrences: set[Occurrence]
+    occurrences: Occurrences
 
     @classmethod
     def new(cls) -> Self:
-        return cls(attributes={}, types=[], occurrences=set())
+        return cls(attributes={}, types=[], occurrences=Occurrences())
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Scope:
     module: tuple[str, ...]
     attributes: dict[str, Name]
@@ -144,6 +289,7 @@ class Scope:
     is_class: bool = False
     parent: Scope | None = None
     name: str | None = None
+    occurrences: list[NameOccurrence] = field(default_factory=list)
 
     def lookup(self, name: str) -> Name | None:
         if name in self.attributes:
@@ -187,114 +333,547 @@ class Scope:
         self.children.append(child)
         return child
 
+    def walk(self) -> Iterator[Scope]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def index(self, occurrence: NameOccurrence) -> None:
+        key = row_and_column(occurrence)
+        index = bisect_left(self.occurrences, key, key=row_and_column)
+        if (
+            index < len(self.occurrences)
+            and self.occurrences[index] == occurrence
+        ):
+            return
 
-@dataclass(frozen=True, kw_only=True)
-class EnterScope:
-    name: str | None = None
-    is_class: bool = False
+        insort(self.occurrences, occurrence, key=row_and_column)
 
+    def occurrences_in(
+        self, text_range: types.TextRange
+    ) -> Sequence[NameOccurrence]:
+        start = bisect_left(
+            self.occurrences,
+            (text_range.start.row, text_range.start.column),
+            key=row_and_column,
+        )
+        end = bisect_right(
+            self.occurrences,
+            (text_range.end.row, text_range.end.column),
+            key=row_and_column,
+        )
+        return self.occurrences[start:end]
 
-@dataclass(frozen=True, kw_only=True)
-class EnterFunctionScope:
-    occurrence: NameOccurrence
 
+def row_and_column(occurrence: Occurrence) -> tuple[int, int]:
+    return (occurrence.position.row, occurrence.position.column)
 
-@dataclass(frozen=True, kw_only=True)
-class MoveToScope:
-    event: NameOccurrence | Attribute
 
+def source_path(source: types.Source) -> str:
+    return source.path
 
-class ReturnFromScope: ...
 
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Attribute:
+    value: NameOccurrence | Attribute
+    attribute: NameOccurrence
 
-@dataclass(frozen=True, kw_only=True)
-class MoveToModule:
-    name: tuple[str, ...]
 
+class Access(Enum):
+    LOAD = "load"
+    STORE = "store"
+    CALL = "call"
 
-class ReturnFromModule: ...
 
+@dataclass(frozen=True, kw_only=True, slots=True)
+class AttributeAccess:
+    access: Access
+    attribute: types.NodeWithRange[ast.Attribute]
+    call: types.NodeWithRange[ast.Call] | None = None
 
-class LeaveScope: ...
 
+def all_occurrences(
+    position: types.Position,
+    *,
+    sources: Sequence[types.Source],
+) -> list[Occurrence]:
+    collector = NameCollector.from_sources(
+        sources, query=position.source.get_name_at(position)
+    )
+    return list(collector.all_occurrences_for(position))
+
+
+local_collectors: OrderedDict[str, tuple[ast.AST, NameCollector]] = (
+    OrderedDict()
+)
+
+
+def local_occurrences(position: types.Position) -> Occurrences:
+    """
+    Find the occurrences of the name at position in its own module only,
+    without loading any other module.
+    """
+    collector = local_collector(position.source)
+    if name := collector.positions.get(position):
+        return name.occurrences
+
+    return Occurrences()
+
+
+def local_collector(source: types.Source) -> NameCollector:
+    """
+    Collect the names of a single module, reusing the result until the
+    module's tree changes.
+    """
+    tree = source.ast
+    cached = local_collectors.get(source.path)
+    if cached is not None and cached[0] is tree:
+        local_collectors.move_to_end(source.path)
+        return cached[1]
+
+    collector = NameCollector.from_sources([source])
+    local_collectors[source.path] = (tree, collector)
+    if len(local_collectors) > LOCAL_COLLECTOR_CACHE_SIZE:
+        local_collectors.popitem(last=False)
+    return collector
+
+
+export_summaries: OrderedDict[str, tuple[int, ExportSummary]] = OrderedDict()
+
+
+def export_summary(source: types.Source) -> ExportSummary:
+    """
+    Summarize what a module exports, reusing the summary for as long as the
+    module's text stays the same, even when its text has been evicted.
+    """
+    key = source.fingerprint
+    cached = export_summaries.get(source.path)
+    if cached is not None and cached[0] == key:
+        export_summaries.move_to_end(source.path)
+        return cached[1]
+
+    tree = source.ast
+    summary = ExportSummary(
+        names=tuple(
+            exported
+            for node in module_statements(tree)
+            for exported in exports(node, source)
+        ),
+        imported_modules=frozenset(imported_modules(source)),
+    )
+    export_summaries[source.path] = (key, summary)
+    if len(export_summaries) > EXPORT_SUMMARY_CACHE_SIZE:
+        export_summaries.popitem(last=False)
+    return summary
 
-@dataclass(frozen=True, kw_only=True)
-class Attribute:
-    value: NameOccurrence | Attribute
-    attribute: NameOccurrence
 
+def mentions(source: types.Source, name: str) -> bool:
+    return name in source.identifiers
 
-@dataclass(frozen=True, kw_only=True)
-class ClassAttribute:
-    class_occurrence: NameOccurrence
-    attribute: NameOccurrence
 
+compiled_modules: OrderedDict[str, tuple[int, CompiledModule]] = OrderedDict()
 
-@dataclass(frozen=True, kw_only=True)
-class Bind:
-    target: NameOccurrence | Attribute
-    value: NameOccurrence | Attribute
 
+def compiled_module(source: types.Source) -> CompiledModule:
+    key = source.fingerprint
+    cached = compiled_modules.get(source.path)
+    if cached is not None and cached[0] == key:
+        compiled_modules.move_to_end(source.path)
+        return cached[1]
 
-@dataclass(frozen=True, kw_only=True)
-class BindImportFrom:
-    occurrence: NameOccurrence
-    module: tuple[str, ...]
-    level: int
+    compiled = compile_module(source)
+    cache_compiled_module(source.path, key, compiled)
+    return compiled
 
 
-@dataclass(frozen=True, kw_only=True)
-class BindImport:
-    occurrence: NameOccurrence | Attribute
+loaded_modules: OrderedDict[
+    str, tuple[CompiledModule, types.Source, CompiledModule]
+] = OrderedDict()
 
 
-@dataclass(frozen=True, kw_only=True)
-class BaseClass:
-    class_occurrence: NameOccurrence | Attribute
-    base: NameOccurrence | Attribute
+def loaded_module(source: types.Source) -> CompiledModule:
+    """
+    The compiled module with its occurrences decoded against source, ready
+    to be replayed. Decoding is kept for as long as both stay the same.
+    """
+    compiled = compiled_module(source)
+    cached = loaded_modules.get(source.path)
+    if cached is not None and cached[0] is compiled and cached[1] is source:
+        loaded_modules.move_to_end(source.path)
+        return cached[2]
 
+    loaded = CompiledModule(
+        instructions=decoded_instructions(compiled.instructions, source),
+        bodies=tuple(
+            replace(
+                body,
+                instructions=decoded_instructions(body.instructions, source),
+                bindings=decoded_instructions(body.bindings, source),
+            )
+            for body in compiled.bodies
+        ),
+    )
+    loaded_modules[source.path] = (compiled, source, loaded)
+    if len(loaded_modules) > COMPILED_MODULE_CACHE_SIZE:
+        loaded_modules.popitem(last=False)
+    return loaded
 
-@dataclass(kw_only=True)
-class FirstArgument:
-    arg: NameOccurrence
 
+def decoded_instructions(
+    instructions: Iterable[tuple[Callable[..., None], tuple[Any, ...]]],
+    source: types.Source,
+) -> tuple[tuple[Callable[..., None], tuple[Any, ...]], ...]:
+    return tuple(
+        (function, tuple(decoded(a, source) for a in arguments))
+        for function, arguments in instructions
+    )
 
-def all_occurrences(
-    position: types.Position,
+
+def cache_compiled_module(
+    path: str, key: int, compiled: CompiledModule
+) -> None:
+    compiled_modules[path] = (key, compiled)
+    if len(compiled_modules) > COMPILED_MODULE_CACHE_SIZE:
+        compiled_modules.popitem(last=False)
+
+
+def compile_modules(
+    sources: Iterable[types.Source],
     *,
-    sources: Sequence[types.Source],
-) -> list[Occurrence]:
-    collector = NameCollector.from_sources(sources)
-    return sorted(
-        collector.all_occurrences_for(position), key=lambda o: o.position
+    query: str | None = None,
+    executor: Executor | None = None,
+) -> None:
+    """
+    Compile the modules that are not cached yet, or only those that mention
+    the query, on the executor when there is one.
+    """
+    missing = [
+        (source, key)
+        for source in sources
+        if (query is None or mentions(source, query))
+        and compiled_modules.get(source.path, (None,))[0]
+        != (key := source.fingerprint)
+    ]
+    if executor is None or len(missing) < 2:
+        for source, key in missing:
+            cache_compiled_module(source.path, key, compile_module(source))
+        return
+
+    for (source, key), compiled in zip(
+        missing,
+        executor.map(
+            compile_lines,
+            [source.path for source, _ in missing],
+            [source.project_root for source, _ in missing],
+            [source.text for source, _ in missing],
+        ),
+        strict=True,
+    ):
+        cache_compiled_module(source.path, key, compiled)
+
+
+def compile_lines(
+    path: str, project_root: str, lines: tuple[str, ...]
+) -> CompiledModule:
+    return compile_module(
+        Source(path=path, project_root=project_root, input_lines=lines)
+    )
+
+
+def compile_module(source: types.Source) -> CompiledModule:
+    compiler = ModuleCompiler(
+        positions={},
+        delays=deque([]),
+        previous_scopes=[],
+        name_scopes={},
+        current_scope=Scope(
+            module=tuple(source.module_name),
+            attributes={},
+            blocks={},
+            children=[],
+        ),
+        modules={},
+    )
+    collect_names(source.ast, source, compiler)
+    instructions = compiler.instructions
+    while compiler.delays:
+        scope, delayed = compiler.delays.popleft()
+        compiler.current_scope = scope
+        delayed()
+
+    return CompiledModule(
+        instructions=tuple(instructions),
+        bodies=tuple(compiler.bodies[i] for i in range(len(compiler.bodies))),
+    )
+
+
+def exported_occurrence(
+    exported: ExportedName | ImportedName, source: types.Source
+) -> NameOccurrence:
+    return NameOccurrence(
+        name=exported.name,
+        position=source.position(exported.row, exported.column),
+        ast=None,
+        is_definition=isinstance(exported, ExportedName),
+    )
+
+
+def module_statements(node: ast.AST) -> Iterator[ast.AST]:
+    for statement in sub_statements(node):
+        yield statement
+        if not isinstance(statement, DEFINITIONS):
+            yield from module_statements(statement)
+
+
+def sub_statements(node: ast.AST) -> Iterator[ast.AST]:
+    for field_name in STATEMENT_FIELDS:
+        children = getattr(node, field_name, None)
+        if isinstance(children, list):
+            yield from children
+
+
+def exported_name(
+    occurrence: NameOccurrence,
+    *,
+    types: tuple[tuple[str, ...], ...] = (),
+    bases: tuple[tuple[str, ...], ...] = (),
+    attributes: tuple[ExportedName, ...] = (),
+    instance_attributes: tuple[ExportedName, ...] = (),
+) -> ExportedName:
+    return ExportedName(
+        name=occurrence.name,
+        row=occurrence.position.row,
+        column=occurrence.position.column,
+        types=types,
+        bases=bases,
+        attributes=attributes,
+        instance_attributes=instance_attributes,
     )
 
 
+@singledispatch
+def exports(
+    node: ast.AST, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    yield from ()
+
+
+@exports.register
+def export_assignment(
+    node: ast.Assign, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    values = node.value.elts if isinstance(node.value, ast.Tuple) else None
+    for target in node.targets:
+        pairs: list[tuple[ast.expr, ast.expr | None]] = [(target, node.value)]
+        if isinstance(target, ast.Tuple):
+            pairs = [(element, None) for element in target.elts]
+            if values is not None and len(values) == len(target.elts):
+                pairs = list(zip(target.elts, values, strict=True))
+        for element, value in pairs:
+            if isinstance(element, ast.Name) and (
+                target_occurrence := occurrence(element, source)
+            ):
+                found = reference(value) if value else None
+                yield exported_name(
+                    target_occurrence, types=(found,) if found else ()
+                )
+
+
+@exports.register
+def export_annotated_assignment(
+    node: ast.AnnAssign, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    if target_occurrence := occurrence(node, source):
+        yield exported_name(target_occurrence)
+
+
+@exports.register
+def export_function(
+    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    if not (function_occurrence := occurrence(node, source)):
+        return
+
+    found = reference(node.returns) if node.returns else None
+    yield exported_name(function_occurrence, types=(found,) if found else ())
+
+
+@exports.register
+def export_class(
+    node: ast.ClassDef, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    if not (class_occurrence := occurrence(node, source)):
+        return
+
+    yield exported_name(
+        class_occurrence,
+        bases=tuple(
+            base for base in (reference(b) for b in node.bases) if base
+        ),
+        attributes=tuple(
+            exported_name(member)
+            for statement in node.body
+            if (member := occurrence(statement, source))
+        ),
+        instance_attributes=tuple(
+            attribute
+            for statement in node.body
+            if isinstance(statement, ast.FunctionDef | ast.AsyncFunctionDef)
+            and not is_static_method(statement)
+            for attribute in instance_attributes(statement, source)
+        ),
+    )
+
+
+def instance_attributes(
+    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
+) -> Iterator[ExportedName]:
+    all_arguments = (*node.args.posonlyargs, *node.args.args)
+    if not all_arguments:
+        return
+
+    first = all_arguments[0].arg
+    annotations = {a.arg: a.annotation for a in all_arguments if a.annotation}
+    for statement in function_statements(node):
+        if isinstance(statement, ast.Assign):
+            targets, value = statement.targets, statement.value
+        elif isinstance(statement, ast.AnnAssign | ast.AugAssign):
+            targets, value = [statement.target], None
+        else:
+            continue
+        for target in targets:
+            if not (
+                isinstance(target, ast.Attribute)
+                and isinstance(target.value, ast.Name)
+                and target.value.id == first
+                and (end := source.node_end_position(target.value))
+            ):
+                continue
+
+            if isinstance(value, ast.Name) and value.id in annotations:
+                found = reference(annotations[value.id])
+            else:
+                found = reference(value) if value else None
+            yield ExportedName(
+                name=target.attr,
+                row=end.row,
+                column=end.column + 1,
+                types=(found,) if found else (),
+            )
+
+
+def function_statements(node: ast.AST) -> Iterator[ast.AST]:
+    for statement in sub_statements(node):
+        if isinstance(statement, DEFINITIONS):
+            continue
+        yield statement
+        yield from function_statements(statement)
+
+
+@exports.register
+def export_import(
+    node: ast.Import, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    imported = alias(node.names[-1], source)
+    yield ImportedName(
+        name=imported.name,
+        row=imported.position.row,
+        column=imported.position.column,
+        module=None,
+    )
+
+
+@exports.register
+def export_import_from(
+    node: ast.ImportFrom, source: types.Source
+) -> Iterator[ExportedName | ImportedName]:
+    if node.module is None:
+        return
+
+    module = tuple(sys.intern(part) for part in node.module.split("."))
+    for name in node.names:
+        imported = alias(name, source)
+        yield ImportedName(
+            name=imported.name,
+            row=imported.position.row,
+            column=imported.position.column,
+            module=module,
+            level=node.level,
+        )
+
+
+@singledispatch
+def reference(node: ast.AST) -> tuple[str, ...] | None:
+    return None
+
+
+@reference.register
+def name_reference(node: ast.Name) -> tuple[str, ...] | None:
+    return (node.id,)
+
+
+@reference.register
+def attribute_reference(node: ast.Attribute) -> tuple[str, ...] | None:
+    if value := reference(node.value):
+        return (*value, node.attr)
+
+    return None
+
+
+@reference.register
+def call_reference(node: ast.Call) -> tuple[str, ...] | None:
+    return reference(node.func)
+
+
+@reference.register
+def subscript_reference(node: ast.Subscript) -> tuple[str, ...] | None:
+    return reference(node.value)
+
+
+@reference.register
+def binary_reference(node: ast.BinOp) -> tuple[str, ...] | None:
+    return reference(node.right) or reference(node.left)
+
+
 def all_occurrence_positions(
     position: Position,
     *,
     sources: Sequence[types.Source],
 ) -> list[types.Position]:
-    result = sorted(
-        o.position for o in all_occurrences(position, sources=sources)
-    )
-    return result
+    return [o.position for o in all_occurrences(position, sources=sources)]
 
 
 @dataclass(kw_only=True)
 class NameCollector:
     positions: dict[types.Position, Name | None]
-    delays: deque[tuple[Scope, Iterator[object]]]
+    delays: deque[tuple[Scope, Callable[[], None]]]
     current_scope: Scope
     previous_scopes: list[Scope]
     name_scopes: dict[int, Scope]
     modules: dict[tuple[str, ...], Scope]
+    calls: dict[types.Position, ast.Call] = field(default_factory=dict)
+    # Every collected event bumps the counter, so that after visiting a
+    # sub-node callers can ask which reference (if any) it ended with.
+    events: int = 0
+    last_reference: NameOccurrence | Attribute | None = None
+    last_reference_at: int = 0
+    last_name: NameOccurrence | None = None
+    last_name_at: int = 0
+    query: str | None = None
 
     @classmethod
-    def from_sources(cls, sources: Sequence[types.Source]) -> Self:
+    def from_sources(
+        cls, sources: Sequence[types.Source], *, query: str | None = None
+    ) -> Self:
+        """
+        With a query, only the occurrences of names spelled that way are
+        complete: modules that mention it are linked from their compiled
+        form, without the bodies of functions that do not mention it, and
+        the other modules from their export summaries.
+        """
         instance = None
         for source in import_ordered(sources):
-            module = tuple(source.module_name)
+            module = tuple(sys.intern(part) for part in source.module_name)
             scope = Scope(module=module, attributes={}, blocks={}, children=[])
             if instance is None:
                 instance = cls(
@@ -304,36 +883,225 @@ class NameCollector:
                     name_scopes={},
                     current_scope=scope,
                     modules={module: scope},
+                    query=query,
                 )
             else:
                 instance.enter_module(module)
 
-            for event in find_names(source.ast, source):
-                process(event, instance)
+            if query is None:
+                collect_names(source.ast, source, instance)
+            elif mentions(source, query):
+                loaded = loaded_module(source)
+                instance.replay(loaded.instructions, loaded, source)
+            else:
+                instance.link(export_summary(source), source)
+
             while instance.delays:
-                scope, iterator = instance.delays.popleft()
+                scope, delayed = instance.delays.popleft()
                 old_current = instance.current_scope
                 instance.current_scope = scope
-                for event in iterator:
-                    process(event, instance)
+                delayed()
                 instance.current_scope = old_current
 
         if instance is None:
             raise types.NotFoundError()
         return instance
 
-    def all_occurrences_for(self, position: types.Position) -> set[Occurrence]:
+    def replay(
+        self,
+        instructions: Iterable[tuple[Callable[..., None], tuple[Any, ...]]],
+        loaded: CompiledModule,
+        source: types.Source,
+    ) -> None:
+        for function, arguments in instructions:
+            if function is NameCollector.delay_compiled_body:
+                self.delay_compiled_body(
+                    loaded.bodies[arguments[0]], loaded, source
+                )
+            else:
+                function(self, *arguments)
+
+    def delay_compiled_body(
+        self, body: CompiledBody, loaded: CompiledModule, source: types.Source
+    ) -> None:
+        instructions = body.instructions
+        if self.query is not None and self.query not in body.names:
+            instructions = body.bindings
+        if instructions:
+            self.delay(partial(self.replay, instructions, loaded, source))
+
+    def link(self, summary: ExportSummary, source: types.Source) -> None:
+        """
+        Bind the names of a module from its export summary, the way
+        collecting them would. Instance attribute types are bound last, as
+        method bodies are.
+        """
+        delayed: list[tuple[Name, ExportedName]] = []
+        for exported in summary.names:
+            occurrence = exported_occurrence(exported, source)
+            if isinstance(exported, ImportedName):
+                if exported.module is None:
+                    self.bind_import(occurrence)
+                else:
+                    self.bind_import_from(
+                        occurrence, exported.module, exported.level
+                    )
+                continue
+
+            name = self.current_scope.get_or_create(occurrence)
+            self.positions[occurrence.position] = name
+            for base in exported.bases:
+                if base_name := self.lookup_reference(base):
+                    name.types.append(base_name)
+            self.bind_references(name, exported.types)
+            for attribute in exported.attributes:
+                self.add_attribute_occurrence(
+                    value=name,
+                    attribute_occurrence=exported_occurrence(attribute, source),
+                )
+            for attribute in exported.instance_attributes:
+                occurrence = exported_occurrence(attribute, source)
+                attribute_name = name.attributes.setdefault(
+                    attribute.name, Name.new()
+                )
+                attribute_name.occurrences.add(occurrence)
+                self.positions[occurrence.position] = attribute_name
+                delayed.append((attribute_name, attribute))
+
+        for name, attribute in delayed:
+            self.bind_references(name, attribute.types)
+
+    def bind_references(
+        self, name: Name, references: Iterable[tuple[str, ...]]
+    ) -> None:
+        for reference in references:
+            if value := self.lookup_reference(reference):
+                name.types.extend([value, *value.types])
+
+    def lookup_reference(self, reference: tuple[str, ...]) -> Name | None:
+        first, *rest = reference
+        name = self.current_scope.lookup(first)
+        for attribute in rest:
+            if name is None:
+                return None
+            name = lookup_attribute(value=name, attribute=attribute)
+        return name
+
+    def all_occurrences_for(self, position: types.Position) -> Occurrences:
         name = self.positions[position]
         if name:
             return name.occurrences
 
-        return set()
+        return Occurrences()
+
+    def occurrences_in(
+        self, text_range: types.TextRange
+    ) -> list[NameOccurrence]:
+        module = self.modules.get(tuple(text_range.source.module_name))
+        if module is None:
+            return []
+
+        return list(
+            merge(
+                *(scope.occurrences_in(text_range) for scope in module.walk()),
+                key=row_and_column,
+            )
+        )
+
+    def call_sites(
+        self, position: types.Position
+    ) -> list[types.NodeWithRange[ast.Call]]:
+        """
+        The calls of the name at position. Only full collections know them:
+        compiled modules keep neither calls nor nodes.
+        """
+        self.check_full()
+        result = []
+        for occurrence in self.all_occurrences_for(position):
+            if (call := self.calls.get(occurrence.position)) is None:
+                continue
+            if (
+                call_range := occurrence.position.source.node_range(call)
+            ) is None:
+                continue
+            result.append(types.NodeWithRange(node=call, range=call_range))
+
+        return result
+
+    def attribute_accesses(
+        self, position: types.Position
+    ) -> list[AttributeAccess]:
+        """
+        How the attribute at position is used. Like call_sites, only full
+        collections know this.
+        """
+        self.check_full()
+        result = []
+        for occurrence in self.all_occurrences_for(position):
+            if not isinstance(node := occurrence.ast, ast.Attribute):
+                continue
+            source = occurrence.position.source
+            if (attribute_range := source.node_range(node)) is None:
+                continue
+            attribute = types.NodeWithRange(node=node, range=attribute_range)
+            if isinstance(node.ctx, ast.Store | ast.Del):
+                result.append(
+                    AttributeAccess(access=Access.STORE, attribute=attribute)
+                )
+            elif (call := self.calls.get(occurrence.position)) and (
+                call_range := source.node_range(call)
+            ):
+                result.append(
+                    AttributeAccess(
+                        access=Access.CALL,
+                        attribute=attribute,
+                        call=types.NodeWithRange(node=call, range=call_range),
+                    )
+                )
+            else:
+                result.append(
+                    AttributeAccess(access=Access.LOAD, attribute=attribute)
+                )
+
+        return result
+
+    def check_full(self) -> None:
+        if self.query is not None:
+            raise PartialCollectionError(
+                f"collected for {self.query!r} only, without calls or nodes"
+            )
+
+    def add_call(
+        self, function: NameOccurrence | Attribute, call: ast.Call
+    ) -> None:
+        occurrence = (
+            function.attribute if isinstance(function, Attribute) else function
+        )
+        self.calls[occurrence.position] = call
+
+    def reference_since(self, start: int) -> NameOccurrence | Attribute | None:
+        return self.last_reference if self.last_reference_at > start else None
+
+    def name_since(self, start: int) -> NameOccurrence | None:
+        return self.last_name if self.last_name_at > start else None
+
+    def last_event_since(self, start: int) -> NameOccurrence | Attribute | None:
+        if start < self.last_reference_at == self.events:
+            return self.last_reference
+
+        return None
 
     def add_occurrence(self, occurrence: NameOccurrence) -> None:
+        self.events += 1
+        self.last_reference = self.last_name = occurrence
+        self.last_reference_at = self.last_name_at = self.events
+        if isinstance(occurrence.ast, INDEXED_NODE_TYPES):
+            self.current_scope.index(occurrence)
         if not self.positions.get(occurrence.position):
             self.add_name(occurrence)
 
     def add_nonlocal(self, occurrence: Occurrence) -> None:
+        self.events += 1
         name = self.current_scope.lookup(occurrence.name)
         if name is None:
             return
@@ -341,6 +1109,7 @@ class NameCollector:
         self.current_scope.attributes[occurrence.name] = name
 
     def add_global(self, occurrence: Occurrence) -> None:
+        self.events += 1
         global_scope = self.modules[self.current_scope.module]
         if global_scope is None:
             return
@@ -367,22 +1136,22 @@ class NameCollector:
         attribute: NameOccurrence,
         class_occurrence: NameOccurrence,
     ) -> None:
+        self.events += 1
         if self.current_scope.parent is None:
             return
 
         cls = self.current_scope.parent.attributes[class_occurrence.name]
         self.add_attribute_occurrence(value=cls, attribute_occurrence=attribute)
 
-    def add_attribute(
-        self,
-        value: Occurrence | Attribute,
-        occurrence: NameOccurrence,
-    ) -> None:
-        current = self.lookup(value)
+    def add_attribute(self, attribute: Attribute) -> None:
+        self.events += 1
+        self.last_reference = attribute
+        self.last_reference_at = self.events
+        current = self.lookup(attribute.value)
         if current is None:
             return
         self.add_attribute_occurrence(
-            value=current, attribute_occurrence=occurrence
+            value=current, attribute_occurrence=attribute.attribute
         )
 
     def add_attribute_occurrence(
@@ -395,12 +1164,12 @@ class NameCollector:
             if value.types:
                 result = value.types[0].attributes.setdefault(
                     attribute_occurrence.name,
-                    Name(attributes={}, types=[], occurrences=set()),
+                    Name.new(),
                 )
             else:
                 result = value.attributes.setdefault(
                     attribute_occurrence.name,
-                    Name(attributes={}, types=[], occurrences=set()),
+                    Name.new(),
                 )
         result = result
         found_attribute = result
@@ -416,9 +1185,11 @@ class NameCollector:
     def enter_scope(
         self, name: str | None = None, is_class: bool = False
     ) -> None:
+        self.events += 1
         self.current_scope = self.current_scope.add_child(name, is_class)
 
     def enter_function_scope(self, occurrence: NameOccurrence) -> None:
+        self.events += 1
         if occurrence.position in self.positions:
             name = self.positions[occurrence.position]
         else:
@@ -429,6 +1200,7 @@ class NameCollector:
         self.name_scopes[id(name)] = self.current_scope
 
     def move_to_scope(self, event: NameOccurrence | Attribute) -> None:
+        self.events += 1
         self.previous_scopes.append(self.current_scope)
 
         name = self.lookup(event)
@@ -443,21 +1215,30 @@ class NameCollector:
 
         self.current_scope = scope
 
-    def move_to_module(self, module: tuple[str, ...]) -> None:
-        self.previous_scopes.append(self.current_scope)
-        self.enter_module(module)
-
     def return_from_scope(self) -> None:
+        self.events += 1
         self.current_scope = self.previous_scopes.pop()
 
     def leave_scope(self) -> None:
+        self.events += 1
         if self.current_scope.parent:
             self.current_scope = self.current_scope.parent
 
-    def delay(self, delayed: Iterator[object]) -> None:
+    def delay(self, delayed: Callable[[], None]) -> None:
+        self.events += 1
         self.delays.append((self.current_scope, delayed))
 
+    def delay_body(
+        self, node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
+    ) -> None:
+        def process_body() -> None:
+            for statement in node.body:
+                collect_names(statement, source, self)
+
+        self.delay(process_body)
+
     def add_first_argument(self, arg: NameOccurrence) -> None:
+        self.events += 1
         if not (
             self.current_scope.parent and self.current_scope.parent.is_class
         ):
@@ -476,13 +1257,14 @@ class NameCollector:
             target.types.append(value)
 
     def add_super_call(self, occurrence: NameOccurrence) -> None:
+        self.events += 1
         if not (
             self.current_scope.parent and self.current_scope.parent.is_class
         ):
             return
 
         target: Name | None = self.current_scope.attributes.setdefault(
-            occurrence.name, Name(attributes={}, types=[], occurrences=set())
+            occurrence.name, Name.new()
         )
         self.current_scope.attributes[occurrence.name].occurrences.add(
             occurrence
@@ -506,6 +1288,7 @@ class NameCollector:
         class_occurrence: NameOccurrence | Attribute,
         base: NameOccurrence | Attribute,
     ) -> None:
+        self.events += 1
         class_name = self.lookup(class_occurrence)
         base_name = self.lookup(base)
         if class_name and base_name:
@@ -516,6 +1299,7 @@ class NameCollector:
         target: NameOccurrence | Attribute,
         value: NameOccurrence | Attribute,
     ) -> None:
+        self.events += 1
         target_name = self.lookup(target)
         value_name = self.lookup(value)
         if target_name and value_name:
@@ -524,21 +1308,23 @@ class NameCollector:
     def bind_import_from(
         self, occurrence: NameOccurrence, module: tuple[str, ...], level: int
     ) -> None:
+        self.events += 1
         if level:
             module = (*self.current_scope.module[:-level], *module)
+        if module not in self.modules:
+            return
+
         if occurrence.name == "*":
             for key, value in self.modules[module].attributes.items():
                 self.current_scope.attributes[key] = value
             return
 
-        if module not in self.modules:
-            return
-
         imported_name = self.modules[module].get_or_create(occurrence)
         self.current_scope.attributes[occurrence.name] = imported_name
         self.positions[occurrence.position] = imported_name
 
     def bind_import(self, occurrence: NameOccurrence | Attribute) -> None:
+        self.events += 1
         module = self.modules.get(module_name(occurrence))
         name = self.lookup_or_create(occurrence)
         if module is None:
@@ -570,113 +1356,209 @@ class NameCollector:
             return self.current_scope.lookup(occurrence.name)
 
 
-@singledispatch
-def process(event: object, collector: NameCollector) -> None:
-    raise NotImplementedError(f"{event=}")
-
-
-@process.register
-def _(event: NameOccurrence, collector: NameCollector) -> None:
-    if not collector.positions.get(event.position):
-        collector.add_name(event)
-
+@dataclass(kw_only=True)
+class ModuleCompiler(NameCollector):
+    """
+    Record the calls a NameCollector would get for one module instead of
+    making them. Only the scopes are tracked, so that method bodies can be
+    told apart.
+    """
+
+    instructions: list[tuple[Callable[..., None], tuple[Any, ...]]] = field(
+        default_factory=list
+    )
+    bodies: dict[int, CompiledBody] = field(default_factory=dict)
+    body_count: int = 0
 
-@process.register
-def _(event: EnterScope, collector: NameCollector) -> None:
-    collector.enter_scope(event.name, event.is_class)
+    def record(self, function: Callable[..., None], *arguments: Any) -> None:
+        self.events += 1
+        self.instructions.append(
+            (function, tuple(compiled(a) for a in arguments))
+        )
 
+    def add_occurrence(self, occurrence: NameOccurrence) -> None:
+        self.record(NameCollector.add_occurrence, occurrence)
+        self.last_reference = self.last_name = occurrence
+        self.last_reference_at = self.last_name_at = self.events
 
-@process.register
-def _(event: EnterFunctionScope, collector: NameCollector) -> None:
-    collector.enter_function_scope(event.occurrence)
+    def add_nonlocal(self, occurrence: Occurrence) -> None:
+        self.record(NameCollector.add_nonlocal, occurrence)
 
+    def add_global(self, occurrence: Occurrence) -> None:
+        self.record(NameCollector.add_global, occurrence)
 
-@process.register
-def _(event: MoveToScope, collector: NameCollector) -> None:
-    collector.move_to_scope(event=event.event)
+    def add_class_attribute(
+        self,
+        attribute: NameOccurrence,
+        class_occurrence: NameOccurrence,
+    ) -> None:
+        self.record(
+            NameCollector.add_class_attribute, attribute, class_occurrence
+        )
 
+    def add_attribute(self, attribute: Attribute) -> None:
+        self.record(NameCollector.add_attribute, attribute)
+        self.last_reference = attribute
+        self.last_reference_at = self.events
 
-@process.register
-def _(
-    event: ReturnFromScope | ReturnFromModule, collector: NameCollector
-) -> None:
-    collector.return_from_scope()
+    def add_base_class(
+        self,
+        class_occurrence: NameOccurrence | Attribute,
+        base: NameOccurrence | Attribute,
+    ) -> None:
+        self.record(NameCollector.add_base_class, class_occurrence, base)
 
+    def add_call(
+        self, function: NameOccurrence | Attribute, call: ast.Call
+    ) -> None:
+        # Calls are not compiled: only collections made with a query replay
+        # compiled modules, and those refuse call_sites.
+        pass
 
-@process.register
-def _(event: LeaveScope, collector: NameCollector) -> None:
-    collector.leave_scope()
+    def bind(
+        self,
+        target: NameOccurrence | Attribute,
+        value: NameOccurrence | Attribute,
+    ) -> None:
+        self.record(NameCollector.bind, target, value)
 
+    def bind_import_from(
+        self, occurrence: NameOccurrence, module: tuple[str, ...], level: int
+    ) -> None:
+        self.record(NameCollector.bind_import_from, occurrence, module, level)
 
-@process.register
-def _(event: MoveToModule, collector: NameCollector) -> None:
-    collector.move_to_module(module=event.name)
+    def bind_import(self, occurrence: NameOccurrence | Attribute) -> None:
+        self.record(NameCollector.bind_import, occurrence)
 
+    def enter_scope(
+        self, name: str | None = None, is_class: bool = False
+    ) -> None:
+        self.record(NameCollector.enter_scope, name, is_class)
+        self.current_scope = self.current_scope.add_child(name, is_class)
 
-@process.register
-def _(event: ReturnFromModule, collector: NameCollector) -> None:
-    collector.return_from_scope()
+    def enter_function_scope(self, occurrence: NameOccurrence) -> None:
+        self.record(NameCollector.enter_function_scope, occurrence)
+        self.current_scope = self.current_scope.add_child(occurrence.name)
 
+    def move_to_scope(self, event: NameOccurrence | Attribute) -> None:
+        self.record(NameCollector.move_to_scope, event)
+        self.previous_scopes.append(self.current_scope)
+        self.current_scope = self.current_scope.add_child()
 
-@process.register
-def _(event: Attribute, collector: NameCollector) -> None:
-    collector.add_attribute(occurrence=event.attribute, value=event.value)
+    def return_from_scope(self) -> None:
+        self.record(NameCollector.return_from_scope)
+        self.current_scope = self.previous_scopes.pop()
 
+    def leave_scope(self) -> None:
+        self.record(NameCollector.leave_scope)
+        if self.current_scope.parent:
+            self.current_scope = self.current_scope.parent
 
-@process.register
-def _(event: ClassAttribute, collector: NameCollector) -> None:
-    collector.add_class_attribute(
-        attribute=event.attribute, class_occurrence=event.class_occurrence
-    )
+    def add_first_argument(self, arg: NameOccurrence) -> None:
+        self.record(NameCollector.add_first_argument, arg)
 
+    def add_super_call(self, occurrence: NameOccurrence) -> None:
+        self.record(NameCollector.add_super_call, occurrence)
 
-@process.register
-def _(event: BaseClass, collector: NameCollector) -> None:
-    collector.add_base_class(
-        class_occurrence=event.class_occurrence, base=event.base
-    )
+    def delay_body(
+        self, node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
+    ) -> None:
+        index = self.body_count
+        self.body_count += 1
+        self.record(NameCollector.delay_compiled_body, index)
+        self.delay(partial(self.compile_body, index, node, source))
 
+    def compile_body(
+        self,
+        index: int,
+        node: ast.FunctionDef | ast.AsyncFunctionDef,
+        source: types.Source,
+    ) -> None:
+        scope = self.current_scope
+        self.instructions = []
+        for statement in node.body:
+            collect_names(statement, source, self)
+        instructions = self.instructions
 
-@process.register
-def _(event: Bind, collector: NameCollector) -> None:
-    collector.bind(target=event.target, value=event.value)
+        self.current_scope = scope
+        self.instructions = []
+        for binding in binding_statements(node, scope):
+            collect_names(binding, source, self)
+        self.bodies[index] = CompiledBody(
+            names=identifiers(
+                source.text[node.lineno - 1 : node.end_lineno or node.lineno]
+            ),
+            instructions=tuple(instructions),
+            bindings=tuple(self.instructions),
+        )
 
 
-@process.register
-def _(event: BindImportFrom, collector: NameCollector) -> None:
-    collector.bind_import_from(
-        occurrence=event.occurrence, module=event.module, level=event.level
+@singledispatch
+def compiled(argument: Any) -> Any:
+    return argument
+
+
+@compiled.register
+def compiled_occurrence(
+    argument: NameOccurrence | Nonlocal | Global,
+) -> CompiledOccurrence:
+    return CompiledOccurrence(
+        kind=type(argument),
+        name=argument.name,
+        row=argument.position.row,
+        column=argument.position.column,
+        is_definition=argument.is_definition,
     )
 
 
-@process.register
-def _(event: BindImport, collector: NameCollector) -> None:
-    collector.bind_import(occurrence=event.occurrence)
-
-
-@process.register
-def _(event: FirstArgument, collector: NameCollector) -> None:
-    collector.add_first_argument(event.arg)
-
-
-@process.register
-def _(event: Delay, collector: NameCollector) -> None:
-    collector.delay(delayed=event.delayed)
+@compiled.register
+def compiled_attribute(argument: Attribute) -> CompiledAttribute:
+    return CompiledAttribute(
+        value=compiled_occurrence(argument.value)
+        if not isinstance(argument.value, Attribute)
+        else compiled_attribute(argument.value),
+        attribute=compiled_occurrence(argument.attribute),
+    )
 
 
-@process.register
-def _(event: SuperCall, collector: NameCollector) -> None:
-    collector.add_super_call(occurrence=event.occurrence)
+@singledispatch
+def decoded(argument: Any, source: types.Source) -> Any:
+    return argument
+
+
+@decoded.register
+def decoded_occurrence(
+    argument: CompiledOccurrence, source: types.Source
+) -> NameOccurrence | Nonlocal | Global:
+    return argument.kind(
+        name=argument.name,
+        position=source.position(argument.row, argument.column),
+        ast=None,
+        is_definition=argument.is_definition,
+    )
 
 
-@process.register
-def _(event: Nonlocal, collector: NameCollector) -> None:
-    collector.add_nonlocal(occurrence=event)
+@decoded.register
+def decoded_attribute(
+    argument: CompiledAttribute, source: types.Source
+) -> Attribute:
+    return Attribute(
+        value=decoded_attribute(argument.value, source)
+        if isinstance(argument.value, CompiledAttribute)
+        else decoded_name(argument.value, source),
+        attribute=decoded_name(argument.attribute, source),
+    )
 
 
-@process.register
-def _(event: Global, collector: NameCollector) -> None:
-    collector.add_global(occurrence=event)
+def decoded_name(
+    argument: CompiledOccurrence, source: types.Source
+) -> NameOccurrence:
+    return NameOccurrence(
+        name=argument.name,
+        position=source.position(argument.row, argument.column),
+        ast=None,
+        is_definition=argument.is_definition,
+    )
 
 
 def lookup_attribute(value: Name, attribute: str) -> Name:
@@ -684,54 +1566,67 @@ def lookup_attribute(value: Name, attribute: str) -> Name:
         if result := parent_type.attributes.get(attribute):
             break
     else:
-        result = value.attributes.setdefault(
-            attribute, Name(attributes={}, types=[], occurrences=set())
-        )
+        result = value.attributes.setdefault(attribute, Name.new())
     return result
 
 
 @singledispatch
-def find_names(node: ast.AST, source: types.Source) -> Iterator[object]:
-    yield from generic_visit(find_names, node, source)
+def collect_names(
+    node: ast.AST, source: types.Source, collector: NameCollector
+) -> None:
+    generic_apply(collect_names, node, source, collector)
 
 
-@find_names.register
-def name(node: ast.Name, source: types.Source) -> Iterator[object]:
+@collect_names.register
+def name(
+    node: ast.Name, source: types.Source, collector: NameCollector
+) -> None:
     if name_occurrence := occurrence(node, source):
-        yield name_occurrence
+        collector.add_occurrence(name_occurrence)
 
 
-@find_names.register
-def type_var(node: ast.TypeVar, source: types.Source) -> Iterator[object]:
-    yield NameOccurrence(
-        name=node.name,
-        position=source.node_position(node),
-        ast=node,
-        is_definition=True,
+@collect_names.register
+def type_var(
+    node: ast.TypeVar, source: types.Source, collector: NameCollector
+) -> None:
+    collector.add_occurrence(
+        NameOccurrence(
+            name=node.name,
+            position=source.node_position(node),
+            ast=node,
+            is_definition=True,
+        )
     )
     if node.bound:
-        yield from find_names(node.bound, source)
+        collect_names(node.bound, source, collector)
 
 
-@find_names.register
+@collect_names.register
 def function_definition(
-    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
-) -> Iterator[object]:
-    yield from decorators(node=node, source=source)
+    node: ast.FunctionDef | ast.AsyncFunctionDef,
+    source: types.Source,
+    collector: NameCollector,
+) -> None:
+    decorators(node=node, source=source, collector=collector)
 
     if not (definition := occurrence(node, source)):
         return
 
-    yield definition
-    yield from defaults(node=node, source=source)
-    yield EnterFunctionScope(occurrence=definition)
-    yield from type_parameters(node=node, source=source)
-    yield from returns(node=node, source=source, definition=definition)
-    yield from arguments(
-        node.args, source, in_static_method=is_static_method(node)
+    collector.add_occurrence(definition)
+    defaults(node=node, source=source, collector=collector)
+    collector.enter_function_scope(definition)
+    type_parameters(node=node, source=source, collector=collector)
+    returns(
+        node=node, source=source, collector=collector, definition=definition
     )
-    yield from body(node=node, source=source)
-    yield LeaveScope()
+    arguments(
+        node.args,
+        source,
+        collector,
+        in_static_method=is_static_method(node),
+    )
+    body(node=node, source=source, collector=collector)
+    collector.leave_scope()
 
 
 def is_static_method(node: ast.FunctionDef | ast.AsyncFunctionDef) -> bool:
@@ -743,146 +1638,167 @@ def is_static_method(node: ast.FunctionDef | ast.AsyncFunctionDef) -> bool:
 
 
 def body(
-    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
-) -> Iterator[object]:
-    def process_body() -> Iterator[object]:
-        for statement in node.body:
-            yield from find_names(statement, source)
+    node: ast.FunctionDef | ast.AsyncFunctionDef,
+    source: types.Source,
+    collector: NameCollector,
+) -> None:
+    collector.delay_body(node, source)
+
+
+def binding_statements(
+    node: ast.FunctionDef | ast.AsyncFunctionDef, scope: Scope
+) -> Sequence[ast.AST]:
+    """
+    The statements of a skipped function body that still bind names outside
+    of it: the assignments in methods, which type instance attributes, and
+    in functions that declare global or nonlocal names.
+    """
+    kept = [
+        statement
+        for statement in function_statements(node)
+        if isinstance(statement, ast.Assign | ast.Global | ast.Nonlocal)
+    ]
+    if (scope.parent and scope.parent.is_class) or any(
+        isinstance(statement, ast.Global | ast.Nonlocal) for statement in kept
+    ):
+        return kept
 
-    yield Delay(delayed=process_body())
+    return []
 
 
 def returns(
     node: ast.FunctionDef | ast.AsyncFunctionDef,
     source: types.Source,
+    collector: NameCollector,
     definition: NameOccurrence,
-) -> Iterator[object]:
-    return_event = None
-    if node.returns:
-        for event in annotation(node.returns, source):
-            if isinstance(event, NameOccurrence | Attribute):
-                return_event = event
-            yield event
-    if return_event:
-        yield Bind(target=definition, value=return_event)
+) -> None:
+    if not node.returns:
+        return
+
+    start = collector.events
+    annotation(node.returns, source, collector)
+    if return_event := collector.reference_since(start):
+        collector.bind(target=definition, value=return_event)
 
 
 def type_parameters(
-    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
-) -> Iterator[object]:
+    node: ast.FunctionDef | ast.AsyncFunctionDef,
+    source: types.Source,
+    collector: NameCollector,
+) -> None:
     for type_parameter in node.type_params:
-        yield from find_names(type_parameter, source)
+        collect_names(type_parameter, source, collector)
 
 
 def defaults(
-    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
-) -> Iterator[object]:
-    for default in node.args.defaults:
-        yield from find_names(default, source)
+    node: ast.FunctionDef | ast.AsyncFunctionDef,
+    source: types.Source,
+    collector: NameCollector,
+) -> None:
+    for default in (*node.args.defaults, *node.args.kw_defaults):
+        if default:
+            collect_names(default, source, collector)
 
 
 def decorators(
-    node: ast.FunctionDef | ast.AsyncFunctionDef, source: types.Source
-) -> Iterator[object]:
+    node: ast.FunctionDef | ast.AsyncFunctionDef,
+    source: types.Source,
+    collector: NameCollector,
+) -> None:
     for decorator in node.decorator_list:
-        yield from find_names(decorator, source)
+        collect_names(decorator, source, collector)
 
 
-@find_names.register
+@collect_names.register
 def class_definition(
-    node: ast.ClassDef, source: types.Source
-) -> Iterator[object]:
+    node: ast.ClassDef, source: types.Source, collector: NameCollector
+) -> None:
     for decorator in node.decorator_list:
-        yield from find_names(decorator, source)
+        collect_names(decorator, source, collector)
     if not (class_occurrence := occurrence(node, source)):
         return
 
-    yield class_occurrence
+    collector.add_occurrence(class_occurrence)
     for base in node.bases:
-        last_event = None
-        for event in find_names(base, source):
-            if isinstance(event, NameOccurrence | Attribute):
-                last_event = event
-            yield event
-        if last_event:
-            yield BaseClass(class_occurrence=class_occurrence, base=last_event)
-
-    yield EnterScope(name=class_occurrence.name, is_class=True)
+        start = collector.events
+        collect_names(base, source, collector)
+        if last_event := collector.reference_since(start):
+            collector.add_base_class(
+                class_occurrence=class_occurrence, base=last_event
+            )
+
+    collector.enter_scope(name=class_occurrence.name, is_class=True)
     for type_parameter in node.type_params:
-        yield from find_names(type_parameter, source)
-    yield from class_body(node, source, class_occurrence)
-    yield LeaveScope()
+        collect_names(type_parameter, source, collector)
+    class_body(node, source, collector, class_occurrence)
+    collector.leave_scope()
 
 
-@find_names.register
-def call(node: ast.Call, source: types.Source) -> Iterator[object]:
+@collect_names.register
+def call(
+    node: ast.Call, source: types.Source, collector: NameCollector
+) -> None:
     for arg in node.args:
-        yield from find_names(arg, source)
+        collect_names(arg, source, collector)
     for keyword in node.keywords:
-        yield from find_names(keyword.value, source)
-    last_event = None
-    for event in find_names(node.func, source):
-        last_event = event
-        yield event
-
-    if not isinstance(last_event, NameOccurrence | Attribute):
+        collect_names(keyword.value, source, collector)
+    start = collector.events
+    collect_names(node.func, source, collector)
+    if not (last_event := collector.last_event_since(start)):
         return
 
+    if isinstance(node.func, ast.Name | ast.Attribute):
+        collector.add_call(last_event, node)
     if isinstance(last_event, NameOccurrence) and last_event.name == "super":
-        yield SuperCall(occurrence=last_event)
+        collector.add_super_call(occurrence=last_event)
 
-    yield MoveToScope(event=last_event)
-    yield from process_keywords(node, source)
-    yield ReturnFromScope()
+    collector.move_to_scope(event=last_event)
+    process_keywords(node, source, collector)
+    collector.return_from_scope()
 
 
-@find_names.register
+@collect_names.register
 def comprehension(
     node: ast.GeneratorExp | ast.SetComp | ast.ListComp | ast.DictComp,
     source: types.Source,
-) -> Iterator[object]:
-    yield EnterScope()
+    collector: NameCollector,
+) -> None:
+    collector.enter_scope()
     for generator in node.generators:
-        yield from find_names(generator, source)
+        collect_names(generator, source, collector)
     for sub_node in sub_nodes(node):
-        yield from find_names(sub_node, source)
-    yield LeaveScope()
+        collect_names(sub_node, source, collector)
+    collector.leave_scope()
 
 
-@find_names.register
-def import_from(node: ast.ImportFrom, source: types.Source) -> Iterator[object]:
+@collect_names.register
+def import_from(
+    node: ast.ImportFrom, source: types.Source, collector: NameCollector
+) -> None:
     if node.module is None:
         return
 
-    module = tuple(node.module.split("."))
+    module = tuple(sys.intern(part) for part in node.module.split("."))
     for name in node.names:
-        last_event = None
-        for event in find_names(name, source):
-            if isinstance(event, NameOccurrence):
-                last_event = event
-        if last_event:
-            yield BindImportFrom(
-                occurrence=last_event, module=module, level=node.level
-            )
+        collector.bind_import_from(
+            occurrence=alias(name, source), module=module, level=node.level
+        )
 
 
-@find_names.register
-def import_node(node: ast.Import, source: types.Source) -> Iterator[object]:
-    for name in node.names:
-        last_event = None
-        for event in find_names(name, source):
-            if isinstance(event, NameOccurrence | Attribute):
-                last_event = event
+@collect_names.register
+def import_node(
+    node: ast.Import, source: types.Source, collector: NameCollector
+) -> None:
+    collector.bind_import(occurrence=alias(node.names[-1], source))
 
-    if last_event is None:
-        return
 
-    yield BindImport(occurrence=last_event)
+@collect_names.register
+def arg(node: ast.arg, source: types.Source, collector: NameCollector) -> None:
+    collector.add_occurrence(argument_occurrence(node, source))
 
 
-@find_names.register
-def arg(node: ast.arg, source: types.Source) -> Iterator[object]:
-    yield NameOccurrence(
+def argument_occurrence(node: ast.arg, source: types.Source) -> NameOccurrence:
+    return NameOccurrence(
         name=node.arg,
         position=source.node_position(node),
         ast=node,
@@ -890,14 +1806,13 @@ def arg(node: ast.arg, source: types.Source) -> Iterator[object]:
     )
 
 
-@find_names.register
-def attribute(node: ast.Attribute, source: types.Source) -> Iterator[object]:
-    last_event = None
-    for event in find_names(node.value, source):
-        if isinstance(event, Attribute | NameOccurrence):
-            last_event = event
-        yield event
-    if last_event is None:
+@collect_names.register
+def attribute(
+    node: ast.Attribute, source: types.Source, collector: NameCollector
+) -> None:
+    start = collector.events
+    collect_names(node.value, source, collector)
+    if (last_event := collector.reference_since(start)) is None:
         return
     end = source.node_end_position(node.value)
     attribute = NameOccurrence(
@@ -906,15 +1821,15 @@ def attribute(node: ast.Attribute, source: types.Source) -> Iterator[object]:
         ast=node,
         is_definition=isinstance(node.ctx, ast.Store),
     )
-    yield Attribute(value=last_event, attribute=attribute)
+    collector.add_attribute(Attribute(value=last_event, attribute=attribute))
 
 
-@find_names.register
-def assignment(node: ast.Assign, source: types.Source) -> Iterator[object]:
-    targets: list[list[NameOccurrence | Attribute]] = []
-    yield from get_targets(node, source, targets)
-    value_events: list[NameOccurrence | Attribute] = []
-    yield from get_values(node, source, value_events)
+@collect_names.register
+def assignment(
+    node: ast.Assign, source: types.Source, collector: NameCollector
+) -> None:
+    targets = get_targets(node, source, collector)
+    value_events = get_values(node, source, collector)
     if not value_events:
         return
 
@@ -924,74 +1839,95 @@ def assignment(node: ast.Assign, source: types.Source) -> Iterator[object]:
         for target_event, value_event in zip(
             target_events, value_events, strict=True
         ):
-            yield Bind(target=target_event, value=value_event)
+            collector.bind(target=target_event, value=value_event)
 
 
-@find_names.register
-def slice_node(node: ast.Subscript, source: types.Source) -> Iterator[object]:
-    yield from find_names(node.slice, source)
-    yield from find_names(node.value, source)
+@collect_names.register
+def slice_node(
+    node: ast.Subscript, source: types.Source, collector: NameCollector
+) -> None:
+    collect_names(node.slice, source, collector)
+    collect_names(node.value, source, collector)
 
 
-@find_names.register
-def alias(node: ast.alias, source: types.Source) -> Iterator[object]:
-    yield NameOccurrence(
-        name=node.name,
+def alias(node: ast.alias, source: types.Source) -> NameOccurrence:
+    return NameOccurrence(
+        name=sys.intern(node.name),
         position=source.node_position(node),
         ast=node,
         is_definition=False,
     )
 
 
-@find_names.register
-def match_case(node: ast.match_case, source: types.Source) -> Iterator[object]:
-    yield EnterScope()
-    yield from find_names(node.pattern, source)
+@collect_names.register
+def match_case(
+    node: ast.match_case, source: types.Source, collector: NameCollector
+) -> None:
+    collector.enter_scope()
+    collect_names(node.pattern, source, collector)
     if node.guard:
-        yield from find_names(node.guard, source)
+        collect_names(node.guard, source, collector)
     for statement in node.body:
-        yield from find_names(statement, source)
-    yield LeaveScope()
+        collect_names(statement, source, collector)
+    collector.leave_scope()
 
 
-@find_names.register
-def match_as(node: ast.MatchAs, source: types.Source) -> Iterator[object]:
+@collect_names.register
+def match_as(
+    node: ast.MatchAs, source: types.Source, collector: NameCollector
+) -> None:
+    if node.pattern:
+        collect_names(node.pattern, source, collector)
     if node.name:
-        yield NameOccurrence(
-            name=node.name,
-            position=source.node_position(node),
-            ast=node,
-            is_definition=True,
+        collector.add_occurrence(
+            NameOccurrence(
+                name=node.name,
+                position=source.node_position(node),
+                ast=node,
+                is_definition=True,
+            )
         )
 
 
-@find_names.register
-def nonlocal_node(node: ast.Nonlocal, source: types.Source) -> Iterator[object]:
+@collect_names.register
+def nonlocal_node(
+    node: ast.Nonlocal, source: types.Source, collector: NameCollector
+) -> None:
     position = source.node_position(node)
     for name in node.names:
         position = source.find_after(name, position)
-        yield Nonlocal(
-            name=name,
-            position=position,
-            ast=node,
+        collector.add_nonlocal(
+            Nonlocal(
+                name=name,
+                position=position,
+                ast=node,
+            )
         )
 
 
-@find_names.register
-def global_node(node: ast.Global, source: types.Source) -> Iterator[object]:
+@collect_names.register
+def global_node(
+    node: ast.Global, source: types.Source, collector: NameCollector
+) -> None:
     position = source.node_position(node)
     for name in node.names:
         position = source.find_after(name, position)
-        yield Global(
-            name=name,
-            position=position,
-            ast=node,
+        collector.add_global(
+            Global(
+                name=name,
+                position=position,
+                ast=node,
+            )
         )
 
 
 def arguments(
-    arguments: ast.arguments, source: types.Source, *, in_static_method: bool
-) -> Iterator[object]:
+    arguments: ast.arguments,
+    source: types.Source,
+    collector: NameCollector,
+    *,
+    in_static_method: bool,
+) -> None:
     for i, arg in enumerate(
         (
             *arguments.posonlyargs,
@@ -1001,43 +1937,39 @@ def arguments(
             *([arguments.kwarg] if arguments.kwarg else []),
         )
     ):
-        name_event = type_event = None
-        for event in find_names(arg, source):
-            yield event
-            if isinstance(event, NameOccurrence):
-                name_event = event
+        name_event = argument_occurrence(arg, source)
+        collector.add_occurrence(name_event)
         if arg.annotation:
-            for event in annotation(arg.annotation, source):
-                yield event
-                if isinstance(event, NameOccurrence):
-                    type_event = event
-            if name_event and type_event:
-                yield Bind(target=name_event, value=type_event)
-        if i == 0:
-            if name_event and not in_static_method:
-                yield FirstArgument(arg=name_event)
+            start = collector.events
+            annotation(arg.annotation, source, collector)
+            if type_event := collector.name_since(start):
+                collector.bind(target=name_event, value=type_event)
+        if i == 0 and not in_static_method:
+            collector.add_first_argument(name_event)
 
 
 def annotation(
-    annotation: ast.AST | None, source: types.Source
-) -> Iterator[object]:
+    annotation: ast.AST | None, source: types.Source, collector: NameCollector
+) -> None:
     if not annotation:
         return
 
-    yield from find_names(annotation, source)
+    collect_names(annotation, source, collector)
 
 
 def class_body(
-    node: ast.ClassDef, source: types.Source, class_occurrence: NameOccurrence
-) -> Iterator[object]:
+    node: ast.ClassDef,
+    source: types.Source,
+    collector: NameCollector,
+    class_occurrence: NameOccurrence,
+) -> None:
     for statement in node.body:
-        attribute_occurrence = None
         if attribute_occurrence := occurrence(statement, source):
-            yield ClassAttribute(
+            collector.add_class_attribute(
                 class_occurrence=class_occurrence,
                 attribute=attribute_occurrence,
             )
-        yield from find_names(statement, source)
+        collect_names(statement, source, collector)
 
 
 @singledispatch
@@ -1057,65 +1989,61 @@ def sub_nodes_dictionary_comprehension(node: ast.DictComp) -> Iterable[ast.AST]:
     return (node.key, node.value)
 
 
-def process_keywords(node: ast.Call, source: types.Source) -> Iterator[object]:
+def process_keywords(
+    node: ast.Call, source: types.Source, collector: NameCollector
+) -> None:
     for keyword in node.keywords:
         if keyword.arg is not None:
-            yield NameOccurrence(
-                name=keyword.arg,
-                position=source.node_position(keyword),
-                ast=keyword,
-                is_definition=False,
+            collector.add_occurrence(
+                NameOccurrence(
+                    name=keyword.arg,
+                    position=source.node_position(keyword),
+                    ast=keyword,
+                    is_definition=False,
+                )
             )
 
 
 def get_targets(
-    node: ast.Assign,
-    source: types.Source,
-    targets: list[list[NameOccurrence | Attribute]],
-) -> Iterator[object]:
+    node: ast.Assign, source: types.Source, collector: NameCollector
+) -> list[list[NameOccurrence | Attribute]]:
+    targets = []
     for target in node.targets:
         match target:
             case ast.Tuple(elts=elements):
                 element_targets = []
                 for element in elements:
-                    last_target = None
-                    for event in find_names(element, source):
-                        if isinstance(event, NameOccurrence | Attribute):
-                            last_target = event
-                        yield event
-                    if last_target:
+                    start = collector.events
+                    collect_names(element, source, collector)
+                    if last_target := collector.reference_since(start):
                         element_targets.append(last_target)
                 targets.append(element_targets)
             case _:
-                last_target = None
-                for event in find_names(target, source):
-                    if isinstance(event, NameOccurrence | Attribute):
-                        last_target = event
-                    yield event
-                if last_target:
+                start = collector.events
+                collect_names(target, source, collector)
+                if last_target := collector.reference_since(start):
                     targets.append([last_target])
+    return targets
 
 
 def get_values(
-    node: ast.Assign,
-    source: types.Source,
-    value_events: list[NameOccurrence | Attribute],
-) -> Iterator[object]:
+    node: ast.Assign, source: types.Source, collector: NameCollector
+) -> list[NameOccurrence | Attribute]:
     match node.value:
         case ast.Tuple(elts=elements):
+            value_events = []
             for element in elements:
-                last_event = None
-                for event in find_names(element, source):
-                    if isinstance(event, NameOccurrence | Attribute):
-                        last_event = event
-                    yield event
-                if last_event:
+                start = collector.events
+                collect_names(element, source, collector)
+                if last_event := collector.reference_since(start):
                     value_events.append(last_event)
+            return value_events
         case _:
-            for event in find_names(node.value, source):
-                if isinstance(event, NameOccurrence | Attribute):
-                    value_events[:] = [event]
-                yield event
+            start = collector.events
+            collect_names(node.value, source, collector)
+            if last_event := collector.reference_since(start):
+                return [last_event]
+            return []
 
 
 def import_ordered(sources: Sequence[types.Source]) -> Sequence[types.Source]:
@@ -1126,9 +2054,14 @@ def import_ordered(sources: Sequence[types.Source]) -> Sequence[types.Source]:
     processed: set[tuple[str, ...]] = set()
     encountered: dict[tuple[str, ...], int] = {}
     queue = deque(sources)
+    available = {module(source) for source in sources}
+    imports_by_source: dict[int, frozenset[tuple[str, ...]]] = {}
     while queue:
         source = queue.popleft()
-        imports = imported_modules(source)
+        if (imports := imports_by_source.get(id(source))) is None:
+            imports = imports_by_source[id(source)] = (
+                export_summary(source).imported_modules & available
+            )
         if not imports - processed:
             result.append(source)
             processed.add(module(source))
@@ -1142,7 +2075,23 @@ def import_ordered(sources: Sequence[types.Source]) -> Sequence[types.Source]:
 
 
 def imported_modules(source: types.Source) -> set[tuple[str, ...]]:
-    return set(find_imported_modules(source.ast, source))
+    return {
+        module
+        for node in statements(source.ast)
+        if isinstance(node, ast.Import | ast.ImportFrom)
+        for module in find_imported_modules(node, source)
+    }
+
+
+def statements(node: ast.AST) -> Iterator[ast.AST]:
+    to_visit = [node]
+    while to_visit:
+        node = to_visit.pop()
+        yield node
+        for field_name in STATEMENT_FIELDS:
+            children = getattr(node, field_name, None)
+            if isinstance(children, list):
+                to_visit.extend(children)
 
 
 def module(source: types.Source) -> tuple[str, ...]:
@@ -1160,7 +2109,7 @@ def module_name(occurrence: NameOccurrence | Attribute) -> tuple[str, ...]:
 def find_imported_modules(
     node: ast.AST, source: types.Source
 ) -> Iterator[tuple[str, ...]]:
-    yield from generic_visit(find_imported_modules, node, source)
+    yield from ()
 
 
 @find_imported_modules.register
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import logging
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 from functools import cached_property
 from glob import iglob
 from pathlib import Path
@@ -14,16 +14,26 @@ logger = logging.getLogger(__name__)
 
 
 class Project:
-    def __init__(self, root: str, source: Source | None = None) -> None:
+    def __init__(
+        self,
+        root: str,
+        source: Source | None = None,
+        known_sources: Iterable[Source] | None = None,
+    ) -> None:
         self._root = root
         self._initial_source = source
+        self._known_sources = known_sources
 
     @cached_property
     def sources(self) -> tuple[Source]:
         return tuple(
             {
                 *((self._initial_source,) if self._initial_source else ()),
-                *self.find_sources(),
+                *(
+                    self.find_sources()
+                    if self._known_sources is None
+                    else self._known_sources
+                ),
             }
         )
 
@@ -31,11 +41,7 @@ class Project:
         self, position: Position, known_sources: list[Source] | None = None
     ) -> list[Occurrence]:
         logger.debug(f"{self.sources=}")
-        return sorted(
-            all_occurrences(position, sources=self.sources),
-            key=lambda o: o.position,
-            reverse=True,
-        )
+        return all_occurrences(position, sources=self.sources)[::-1]
 
     def find_sources(self) -> tuple[Source, ...]:
         sources = tuple(
@@ -4,24 +4,25 @@ import ast
 import logging
 from collections import defaultdict
 from collections.abc import (
+    Collection,
     Iterable,
     Iterator,
     Mapping,
     MutableMapping,
     Sequence,
 )
-from dataclasses import dataclass, replace
+from dataclasses import dataclass
 from functools import cached_property, singledispatch
 from itertools import dropwhile, takewhile
 from typing import ClassVar, Protocol, Self
 
 from breakfast.code_generation import unparse
 from breakfast.configuration import configuration
-from breakfast.names import NameCollector
+from breakfast.flow import Flow, analyze
+from breakfast.names import Access, AttributeAccess, NameCollector
 from breakfast.rewrites import ArgumentMapper, rewrite_body
 from breakfast.search import (
     NodeFilter,
-    find_names,
     find_other_nodes,
     find_returns,
     find_statements,
@@ -33,6 +34,7 @@ from breakfast.source import has_node_type
 from breakfast.types import (
     DEFAULT,
     Edit,
+    Line,
     NodeWithRange,
     NotFoundError,
     Occurrence,
@@ -47,6 +49,7 @@ from breakfast.types import (
 logger = logging.getLogger(__name__)
 
 FunctionDefinition = ast.FunctionDef | ast.AsyncFunctionDef
+FUNCTION_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
 INDENTATION = " " * configuration["code_generation"]["indentation"]
 NEWLINE = "\n"
 STATIC_METHOD = "staticmethod"
@@ -99,9 +102,36 @@ class CodeSelection:
         return {
             refactoring.name: refactoring_instance
             for refactoring in self._refactorings.values()
-            if (refactoring_instance := refactoring.from_selection(self))
+            if refactoring.requirements.met_by(self)
+            and (refactoring_instance := refactoring.from_selection(self))
         }
 
+    @cached_property
+    def flow(self) -> Flow:
+        return analyze(self.source, self.text_range.enclosing_scope.node)
+
+    @cached_property
+    def reads_unassigned(self) -> bool:
+        """
+        Whether the selected statements may read a name that is not bound
+        on every path into them, so that passing it to an extracted
+        function could fail where the original code would not.
+        """
+        statements = self.text_range.statements
+        if not statements:
+            return False
+
+        used = frozenset[str]().union(*(self.flow.uses(s) for s in statements))
+        return bool(used & self.flow.maybe_unassigned_before(statements[0]))
+
+    @cached_property
+    def enclosing_node_types(self) -> frozenset[type[ast.AST]]:
+        return frozenset(
+            node_type
+            for enclosing_node in self.text_range.enclosing_nodes
+            for node_type in type(enclosing_node.node).__mro__
+        )
+
     @cached_property
     def in_method(self) -> bool:
         return len(self.text_range.enclosing_scopes) > 1 and isinstance(
@@ -164,9 +194,17 @@ class CodeSelection:
         return definitions[0]
 
     def all_occurrences(self, position: Position) -> Sequence[Occurrence]:
-        return sorted(
-            self.names.all_occurrences_for(position), key=lambda o: o.position
-        )
+        return self.names.all_occurrences_for(position)
+
+    def call_sites(
+        self, position: Position
+    ) -> Sequence[NodeWithRange[ast.Call]]:
+        return self.names.call_sites(position)
+
+    def attribute_accesses(
+        self, position: Position
+    ) -> Sequence[AttributeAccess]:
+        return self.names.attribute_accesses(position)
 
     def rtrim(self) -> CodeSelection:
         lines = self.text_range.text.rstrip().split("\n")
@@ -181,7 +219,7 @@ class CodeSelection:
 
         return CodeSelection(
             sources=self.sources,
-            text_range=replace(self.text_range, end=self.end - offset),
+            text_range=self.start.to(self.end - offset),
         )
 
 
@@ -191,10 +229,12 @@ class UsageCollector:
         text_range: TextRange,
         enclosing_scope: ScopeWithRange,
         in_static_method: bool,
+        names: NameCollector,
     ) -> None:
         self.in_static_method = in_static_method
         self.range = text_range
         self.enclosing_scope = enclosing_scope
+        self.names = names
         self._defined_before: dict[str, list[Occurrence]] = defaultdict(list)
         self._used_in: dict[str, list[Occurrence]] = defaultdict(list)
         self._modified_in: dict[str, list[Occurrence]] = defaultdict(list)
@@ -230,14 +270,17 @@ class UsageCollector:
         return self._used_after or {}
 
     def _collect(self) -> None:
-        for i, occurrence in enumerate(
-            find_names(self.enclosing_scope.node, self.range.source)
-        ):
+        first_argument = (
+            None
+            if self.in_static_method
+            else first_positional_argument(self.enclosing_scope.node)
+        )
+        for occurrence in self.names.occurrences_in(self.enclosing_scope.range):
             if (
                 occurrence.position < self.range.start
                 and occurrence.is_definition
             ):
-                if i == 1 and not (self.in_static_method):
+                if first_argument and occurrence.ast is first_argument:
                     self.self_or_cls = occurrence
                 self._defined_before[occurrence.name].append(occurrence)
             if occurrence.position in self.range:
@@ -247,21 +290,13 @@ class UsageCollector:
             if occurrence.position > self.range.end:
                 self._used_after[occurrence.name].append(occurrence)
 
-    def get_subsequent_usage(
-        self,
-        names_defined_in_range: Iterable[Occurrence],
-    ) -> Position | None:
-        occurrences_after_range = sorted(
-            [
-                o.position
-                for n in names_defined_in_range
-                for o in self.used_after_selection.get(n.name, [])
-            ]
-        )
-        first_usage_after_range = (
-            occurrences_after_range[0] if occurrences_after_range else None
-        )
-        return first_usage_after_range
+
+def first_positional_argument(node: ast.AST) -> ast.arg | None:
+    if not isinstance(node, FunctionDefinition):
+        return None
+
+    arguments = [*node.args.posonlyargs, *node.args.args]
+    return arguments[0] if arguments else None
 
 
 class Editor(Protocol):
@@ -269,8 +304,28 @@ class Editor(Protocol):
     def edits(self) -> Iterable[Edit]: ...
 
 
+@dataclass(frozen=True, kw_only=True)
+class Requirements:
+    enclosing_nodes: tuple[type[ast.AST], ...] = ()
+    non_empty: bool = False
+    in_method: bool = False
+
+    def met_by(self, selection: CodeSelection) -> bool:
+        if self.non_empty and selection.end <= selection.start:
+            return False
+
+        if self.in_method and not selection.in_method:
+            return False
+
+        return not self.enclosing_nodes or any(
+            node_type in selection.enclosing_node_types
+            for node_type in self.enclosing_nodes
+        )
+
+
 class Refactoring(Protocol):
     name: str
+    requirements: Requirements
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None: ...
@@ -280,6 +335,7 @@ class Refactoring(Protocol):
 @dataclass(kw_only=True)
 class ExtractFunction:
     name = "extract function"
+    requirements = Requirements(non_empty=True)
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -295,7 +351,7 @@ class ExtractFunctionEditor:
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Self | None:
-        if selection.end <= selection.start:
+        if selection.end <= selection.start or selection.reads_unassigned:
             return None
         match selection.text_range.enclosing_scopes:
             case (
@@ -401,6 +457,7 @@ def make_body(
 @dataclass(kw_only=True)
 class ExtractMethod:
     name = "extract method"
+    requirements = Requirements(non_empty=True, in_method=True)
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -417,6 +474,9 @@ class ExtractMethodEditor:
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Self | None:
+        if selection.reads_unassigned:
+            return None
+
         enclosing_scope = selection.text_range.enclosing_scopes[-1]
         new_level = enclosing_scope.start.column // 4
 
@@ -493,9 +553,15 @@ def make_extract_callable_edits(
         refactoring.range,
         enclosing_scope,
         in_static_method=refactoring.selection.in_static_method,
+        names=refactoring.selection.names,
     )
+    flow = refactoring.selection.flow
+    statements = refactoring.range.statements
     return_node = make_return_node(
-        usages.modified_in_selection, usages.used_after_selection
+        usages.modified_in_selection,
+        flow.live_after(statements[-1])
+        if statements
+        else usages.used_after_selection,
     )
     body = make_body(text_range=refactoring.range, return_node=return_node)
 
@@ -599,11 +665,11 @@ def make_call(
 
 def make_return_node(
     modified_in_extraction: Mapping[str, Sequence[Occurrence]],
-    used_after_extraction: Mapping[str, Sequence[Occurrence]],
+    live_after_extraction: Collection[str],
 ) -> ast.Return | None:
     returns = []
     for name, occurrences in modified_in_extraction.items():
-        if name in used_after_extraction:
+        if name in live_after_extraction:
             returns.append(occurrences[0])
     if not returns:
         return None
@@ -642,6 +708,7 @@ def make_argument(occurrence: Occurrence) -> ast.arg:
 @dataclass(kw_only=True)
 class ExtractVariable:
     name = "extract variable"
+    requirements = Requirements(non_empty=True)
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -753,6 +820,7 @@ def get_body_range(enclosing_scope: ScopeWithRange) -> TextRange:
 @dataclass(kw_only=True)
 class InlineVariable:
     name = "inline variable"
+    requirements = Requirements(enclosing_nodes=(ast.Name,))
     selection: CodeSelection
 
     @classmethod
@@ -856,6 +924,7 @@ class InlineVariableEditor:
 @dataclass(kw_only=True)
 class InlineCall:
     name = "inline call"
+    requirements = Requirements(enclosing_nodes=(ast.Call,))
     selection: CodeSelection
 
     @classmethod
@@ -1027,7 +1096,7 @@ class InlineCall:
             arguments=definition_ast.args,
             body_range=body_range,
             returned_names=returned_names,
-            sources=self.selection.sources,
+            names=self.selection.names,
             static_method=static_method,
         )
         arg_mapper.add_substitutions(call, substitutions)
@@ -1043,6 +1112,7 @@ class InlineCall:
 @dataclass(kw_only=True)
 class SlideStatementsUp:
     name = "slide statements up"
+    requirements = Requirements()
     selection: CodeSelection
 
     @classmethod
@@ -1063,38 +1133,35 @@ class SlideStatementsUp:
 
     def find_slide_target_before(self) -> Position | None:
         first, last = (self.selection.start.line, self.selection.end.line)
-        line = first
-        while line.previous and line.previous.start.level >= first.start.level:
-            line = line.previous
-        if line == first:
+        statements = first.start.through(last.end).statements
+        if not statements:
             return None
 
-        scope_before = line.start.to(
-            first.previous.end if first.previous else first.start
-        )
+        flow = self.selection.flow
+        siblings = flow.siblings_before(statements[0])
+        if not siblings:
+            return None
 
-        text_range = first.start.to(last.end)
-        names_in_range = {occurrence.name for occurrence in text_range.names}
-        target = max(
-            [
-                line.start,
-                *(
-                    occurrence.position.line.next.start
-                    if occurrence.position.line.next
-                    else occurrence.position.line.end
-                    for occurrence in scope_before.names
-                    if occurrence.name in names_in_range
-                ),
-            ]
-        )
+        used = frozenset().union(*(flow.uses(s) for s in statements))
+        defined = frozenset().union(*(flow.definitions(s) for s in statements))
+        source = self.selection.source
+        target = first_line(siblings[0], source).start
+        for sibling in reversed(siblings):
+            if flow.definitions(sibling) & (used | defined) or (
+                flow.uses(sibling) & defined
+            ):
+                end = source.lines[(sibling.end_lineno or sibling.lineno) - 1]
+                target = end.next.start if end.next else end.end
+                break
 
-        return target
+        return target if target < first.start else None
 
 
 @register
 @dataclass(kw_only=True)
 class SlideStatementsDown:
     name = "slide statements down"
+    requirements = Requirements()
     selection: CodeSelection
 
     @classmethod
@@ -1115,44 +1182,35 @@ class SlideStatementsDown:
 
     def find_slide_target_after(self) -> Position | None:
         first, last = (self.selection.start.line, self.selection.end.line)
-        lines = first.start.to(last.end)
-        names_defined_in_range = lines.definitions
-        enclosing_scope = self.selection.text_range.enclosing_scopes[-1]
-        usages = UsageCollector(
-            self.selection.text_range,
-            enclosing_scope,
-            in_static_method=self.selection.in_static_method,
-        )
-        first_usage_after_range = usages.get_subsequent_usage(
-            names_defined_in_range=names_defined_in_range
-        )
-        if not first_usage_after_range:
+        statements = first.start.through(last.end).statements
+        if not statements:
             return None
 
-        enclosing_nodes = first_usage_after_range.as_range.enclosing_nodes
-        origin_nodes = lines.enclosing_nodes
-        index = 0
-        while (
-            index < len(origin_nodes)
-            and origin_nodes[index].range == enclosing_nodes[index].range
-        ):
-            index += 1
+        flow = self.selection.flow
+        used = frozenset().union(*(flow.uses(s) for s in statements))
+        defined = frozenset().union(*(flow.definitions(s) for s in statements))
+        for sibling in flow.siblings_after(statements[-1]):
+            if (
+                flow.names(sibling) & defined
+                or flow.definitions(sibling) & used
+            ):
+                target = first_line(sibling, self.selection.source).start
+                return target if target.row > last.row + 1 else None
 
-        first_usage_after_range = enclosing_nodes[index].start
+        return None
 
-        if (
-            first_usage_after_range
-            and first_usage_after_range.row > last.row + 1
-        ):
-            return first_usage_after_range.start_of_line
 
-        return None
+def first_line(statement: ast.stmt, source: Source) -> Line:
+    decorators: list[ast.expr] = getattr(statement, "decorator_list", [])
+    row = min([statement.lineno, *(d.lineno for d in decorators)]) - 1
+    return source.lines[row]
 
 
 @register
 @dataclass(kw_only=True)
 class MoveFunctionToParentScope:
     name = "move function to parent scope"
+    requirements = Requirements(enclosing_nodes=FUNCTION_DEFINITIONS)
     selection: CodeSelection
 
     @classmethod
@@ -1208,6 +1266,7 @@ class MoveFunctionToParentScope:
 @dataclass(kw_only=True)
 class RemoveParameter:
     name = "remove parameter"
+    requirements = Requirements(enclosing_nodes=(ast.arg,))
     selection: CodeSelection
 
     @classmethod
@@ -1255,26 +1314,18 @@ class RemoveParameter:
     def call_edits(self) -> Sequence[Edit]:
         call_edits = []
         index = self.function_definition.node.args.args.index(self.arg.node)
-        for occurrence in self.selection.all_occurrences(
+        for call_site in self.selection.call_sites(
             self.selection.source.node_position(self.function_definition.node)
             + len("def ")
         ):
-            if occurrence.is_definition:
-                continue
-            if not (
-                calls := occurrence.position.as_range.enclosing_nodes_by_type(
-                    ast.Call
-                )
-            ):
-                continue
-            call = calls[-1].node
+            call = call_site.node
             if call.args:
                 new_call = ast.Call(
                     func=call.func,
                     args=call.args[:index] + call.args[index + 1 :],
                     keywords=call.keywords,
                 )
-                call_edits.append(replace_range(calls[-1].range, new_call))
+                call_edits.append(replace_range(call_site.range, new_call))
             elif call.keywords:
                 new_call = ast.Call(
                     func=call.func,
@@ -1285,7 +1336,7 @@ class RemoveParameter:
                         if kw.arg != self.arg.node.arg
                     ],
                 )
-                call_edits.append(replace_range(calls[-1].range, new_call))
+                call_edits.append(replace_range(call_site.range, new_call))
         return call_edits
 
     @property
@@ -1309,6 +1360,7 @@ class RemoveParameter:
 @dataclass(kw_only=True)
 class AddParameter:
     name = "add parameter"
+    requirements = Requirements(enclosing_nodes=(ast.FunctionDef,))
     selection: CodeSelection
 
     @classmethod
@@ -1337,19 +1389,11 @@ class AddParameter:
 
     def call_edits(self, arg_name: str) -> Sequence[Edit]:
         call_edits = []
-        for occurrence in self.selection.all_occurrences(
+        for call_site in self.selection.call_sites(
             self.selection.source.node_position(self.function_definition.node)
             + len("def ")
         ):
-            if occurrence.is_definition:
-                continue
-            if not (
-                calls := occurrence.position.as_range.enclosing_nodes_by_type(
-                    ast.Call
-                )
-            ):
-                continue
-            call = calls[-1].node
+            call = call_site.node
             new_call = ast.Call(
                 func=call.func,
                 args=call.args,
@@ -1358,7 +1402,7 @@ class AddParameter:
                     ast.keyword(arg=arg_name, value=ast.Constant(value=None)),
                 ],
             )
-            call_edits.append(replace_range(calls[-1].range, new_call))
+            call_edits.append(replace_range(call_site.range, new_call))
         return call_edits
 
     def function_definition_edit(self, arg_name: str) -> Edit:
@@ -1379,6 +1423,9 @@ class AddParameter:
 @dataclass(kw_only=True)
 class EncapsulateField:
     name = "encapsulate field"
+    requirements = Requirements(
+        enclosing_nodes=(ast.Assign, ast.AnnAssign, ast.Attribute)
+    )
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -1533,6 +1580,7 @@ class EncapsulateFieldEditor:
 @dataclass(kw_only=True)
 class EncapsulateRecord:
     name = "encapsulate record"
+    requirements = Requirements(enclosing_nodes=(ast.Dict,))
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -1663,6 +1711,7 @@ class EncapsulateRecordEditor:
 @dataclass(kw_only=True)
 class MethodToProperty:
     name = "convert method to property"
+    requirements = Requirements(in_method=True)
     selection: CodeSelection
 
     @classmethod
@@ -1686,21 +1735,14 @@ class MethodToProperty:
                 ],
             ),
         )
-        for occurrence in self.selection.all_occurrences(
+        for access in self.selection.attribute_accesses(
             self.selection.source.node_position(self.function_definition.node)
             + len("def ")
         ):
-            if occurrence.is_definition:
-                continue
-            if not (
-                calls := occurrence.position.as_range.enclosing_nodes_by_type(
-                    ast.Call
-                )
-            ):
+            if access.call is None:
                 continue
-            node = calls[-1].node
 
-            yield replace_range(calls[-1].range, node.func)
+            yield replace_range(access.call.range, access.call.node.func)
 
     @property
     def function_definition(self) -> NodeWithRange[ast.FunctionDef]:
@@ -1713,6 +1755,7 @@ class MethodToProperty:
 @dataclass(kw_only=True)
 class PropertyToMethod:
     name = "convert property to method"
+    requirements = Requirements(in_method=True)
     selection: CodeSelection
 
     @classmethod
@@ -1735,24 +1778,16 @@ class PropertyToMethod:
             start = start.line.previous.start if start.line.previous else start
         range_with_decorators = start.through(self.function_definition.end)
         yield replace_range(range_with_decorators, new_function)
-        for occurrence in self.selection.all_occurrences(
+        for access in self.selection.attribute_accesses(
             self.selection.source.node_position(self.function_definition.node)
             + len("def ")
         ):
-            if occurrence.is_definition:
+            if access.access is not Access.LOAD:
                 continue
-            if not (
-                attributes
-                := occurrence.position.as_range.enclosing_nodes_by_type(
-                    ast.Attribute
-                )
-            ):
-                continue
-            node = attributes[-1].node
 
             yield replace_range(
-                attributes[-1].range,
-                ast.Call(func=node, args=[], keywords=[]),
+                access.attribute.range,
+                ast.Call(func=access.attribute.node, args=[], keywords=[]),
             )
 
     @property
@@ -1766,6 +1801,7 @@ class PropertyToMethod:
 @dataclass(kw_only=True)
 class ExtractClass:
     name = "extract class"
+    requirements = Requirements(in_method=True)
     selection: CodeSelection
 
     @classmethod
@@ -1804,18 +1840,14 @@ class ExtractClass:
             if isinstance(assignment.targets[0], ast.Attribute) and isinstance(
                 assignment.targets[0].value, ast.Name
             ):
-                for occurrence in self.selection.all_occurrences(
+                for access in self.selection.attribute_accesses(
                     self.selection.source.node_position(assignment.targets[0])
                     + len(assignment.targets[0].value.id)
                     + 1
                 ):
-                    if occurrence.is_definition:
+                    if access.access is Access.STORE:
                         continue
-                    attribute = (
-                        occurrence.position.as_range.enclosing_nodes_by_type(
-                            ast.Attribute
-                        )[0]
-                    )
+                    attribute = access.attribute
                     yield replace_range(
                         attribute.range,
                         ast.Attribute(
@@ -1916,6 +1948,7 @@ def make_dataclass(
 @dataclass(kw_only=True)
 class ReplaceWithMethodObject:
     name = "replace with method object"
+    requirements = Requirements(non_empty=True, in_method=True)
     selection: CodeSelection
 
     @classmethod
@@ -2076,6 +2109,7 @@ class ReplaceWithMethodObject:
 @dataclass(kw_only=True)
 class ConvertToIfExpression:
     name = "convert if statement to if expression"
+    requirements = Requirements(enclosing_nodes=(ast.If,))
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -2174,6 +2208,7 @@ class MakeIfExpression:
 @dataclass(kw_only=True)
 class ConvertToIfStatement:
     name = "convert if expression to if statement"
+    requirements = Requirements(enclosing_nodes=(ast.Assign, ast.AnnAssign))
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -2255,6 +2290,7 @@ class MakeIfStatement:
 @dataclass(kw_only=True)
 class ReplaceLoopWithComprehension:
     name = "replace loop with comprehension"
+    requirements = Requirements(enclosing_nodes=(ast.For,))
 
     @classmethod
     def from_selection(cls, selection: CodeSelection) -> Editor | None:
@@ -9,10 +9,8 @@ from functools import singledispatch
 from itertools import chain, repeat
 from typing import Any
 
-from breakfast.names import (
-    all_occurrences,
-)
-from breakfast.types import Occurrence, Source, TextRange
+from breakfast.names import NameCollector
+from breakfast.types import Occurrence, TextRange
 from breakfast.visitor import generic_transform
 
 logger = logging.getLogger(__name__)
@@ -267,7 +265,7 @@ class ArgumentMapper:
     arguments: ast.arguments
     body_range: TextRange
     returned_names: Container[str]
-    sources: Sequence[Source]
+    names: NameCollector
     static_method: bool
 
     def get_occurrences(
@@ -278,7 +276,7 @@ class ArgumentMapper:
         arg_position = self.body_range.start.source.node_position(argument)
         return [
             o
-            for o in all_occurrences(arg_position, sources=self.sources)
+            for o in self.names.all_occurrences_for(arg_position)
             if o.position in body_range and o.ast
         ]
 
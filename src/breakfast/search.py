@@ -14,7 +14,7 @@ from breakfast.visitor import generic_visit
 logger = logging.getLogger(__name__)
 
 
-@dataclass(frozen=True, kw_only=True)
+@dataclass(frozen=True, kw_only=True, slots=True)
 class Occurrence:
     name: str
     position: Position
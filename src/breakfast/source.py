@@ -6,14 +6,18 @@ import os
 import re
 import sys
 from ast import AST, parse
-from collections import deque
+from bisect import bisect_right
+from collections import OrderedDict, deque
 from collections.abc import Iterable, Sequence
+from copy import copy
 from dataclasses import InitVar, dataclass, replace
 from functools import cached_property
+from itertools import count
 from typing import Protocol, TypeGuard
 
 from breakfast import types
 from breakfast.configuration import configuration
+from breakfast.edits import apply_edits
 from breakfast.search import (
     find_names,
     find_statements,
@@ -24,13 +28,21 @@ from breakfast.search import (
 logger = logging.getLogger(__name__)
 
 WORD = re.compile(r"\w+|\W+")
+IDENTIFIER = re.compile(r"\w+")
 INDENTATION = re.compile(r"^(\s+)")
+TEXT_RANGE_CACHE_SIZE = 4096
+# Measured on the standard library: lines plus tree, per character of code.
+RESIDENT_BYTES_PER_CHARACTER = 34
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
 
 
 class IllegalPositionError(Exception):
     pass
 
 
+uses = count(1)
+
+
 class PositionalNode(Protocol):
     lineno: int
     col_offset: int
@@ -53,7 +65,7 @@ def has_position(node: AST) -> TypeGuard[PositionalNode]:
     )
 
 
-@dataclass(order=True, frozen=True, kw_only=True)
+@dataclass(order=True, frozen=True, kw_only=True, slots=True)
 class Position:
     source: types.Source
     row: int
@@ -112,19 +124,19 @@ class Position:
 
     @property
     def as_range(self) -> types.TextRange:
-        return TextRange(start=self, end=self)
+        return self.source.text_range(start=self, end=self)
 
     def to(self, end: types.Position) -> types.TextRange:
-        return TextRange(start=self, end=end)
+        return self.source.text_range(start=self, end=end)
 
     def through(self, end: types.Position) -> types.TextRange:
-        return TextRange(start=self, end=end + 1)
+        return self.source.text_range(start=self, end=end + 1)
 
     def _add_offset(self, offset: int) -> types.Position:
         return replace(self, column=self.column + offset)
 
     def insert(self, text: str) -> types.Edit:
-        return types.Edit(text_range=TextRange(start=self, end=self), text=text)
+        return types.Edit(text_range=self.as_range, text=text)
 
     def __contains__(self, other: types.Ranged) -> bool:
         return types.contains(self, other)
@@ -260,7 +272,7 @@ class TextRange:
                 scopes.append(
                     types.NodeWithRange(
                         node=node,
-                        range=TextRange(
+                        range=source.text_range(
                             start=source.position(0, 0),
                             end=source.lines[-1].end,
                         ),
@@ -360,34 +372,21 @@ class TextRange:
     def text_with_substitutions(
         self, substitutions: Iterable[types.Edit]
     ) -> Sequence[str]:
-        row_offset = self.start.row
-        text = [
-            line.text
-            for line in self.source.lines[self.start.row : self.end.row + 1]
-        ]
-
-        for substitution in sorted(substitutions, reverse=True):
-            if substitution.end < self.start:
-                continue
-            if substitution.start > self.end:
-                break
-            row_index = substitution.start.row - row_offset
-            rows = substitution.end.row - substitution.start.row
-            new_lines = substitution.text.split("\n")
-            new_lines[0] = (
-                text[row_index][: substitution.start.column] + new_lines[0]
-            )
-            new_lines[-1] = (
-                new_lines[-1]
-                + text[row_index + rows][substitution.end.column :]
-            )
-            text[row_index : row_index + rows + 1] = new_lines
-        return text
+        return apply_edits(
+            self.source.text[self.start.row : self.end.row + 1],
+            (
+                substitution
+                for substitution in substitutions
+                if not (
+                    substitution.end < self.start
+                    or substitution.start > self.end
+                )
+            ),
+            first_row=self.start.row,
+        ).split("\n")
 
     def replace(self, new_text: str) -> types.Edit:
-        return types.Edit(
-            text_range=TextRange(start=self.start, end=self.end), text=new_text
-        )
+        return types.Edit(text_range=self, text=new_text)
 
     def __and__(self, other: types.Ranged) -> types.Ranged:
         if (
@@ -403,13 +402,13 @@ class TextRange:
         if other in self:
             return other
 
-        return TextRange(
+        return self.source.text_range(
             start=max(self.start, other.start),
             end=min(self.end, other.end),
         )
 
 
-@dataclass(order=True, frozen=True, kw_only=True)
+@dataclass(order=True, frozen=True, kw_only=True, slots=True)
 class Line:
     source: types.Source
     row: int
@@ -428,7 +427,7 @@ class Line:
 
     @property
     def text_range(self) -> types.TextRange:
-        return TextRange(start=self.start, end=self.end)
+        return self.source.text_range(start=self.start, end=self.end)
 
     def __contains__(self, other: types.Ranged) -> bool:
         return types.contains(self, other)
@@ -449,6 +448,91 @@ class Line:
         return self.source.lines[self.row + 1]
 
 
+def first_row(node: ast.stmt) -> int:
+    if isinstance(node, DEFINITIONS) and node.decorator_list:
+        return node.decorator_list[0].lineno - 1
+    return node.lineno - 1
+
+
+def reparse_definition(
+    tree: ast.Module,
+    lines: Sequence[str],
+    *,
+    start_row: int,
+    end_row: int,
+    row_delta: int,
+) -> ast.Module | None:
+    """
+    Return a new module with only the top-level definition containing rows
+    start_row through end_row reparsed, or None when the edit is structural.
+    """
+    body = tree.body
+    index = bisect_right(body, start_row, key=first_row) - 1
+    if index < 0:
+        return None
+
+    old = body[index]
+    if not isinstance(old, DEFINITIONS) or old.end_lineno is None:
+        return None
+
+    first, last = first_row(old), old.end_lineno - 1
+    if end_row > last:
+        return None
+    if index > 0 and (body[index - 1].end_lineno or 0) > first:
+        return None
+    if index + 1 < len(body) and first_row(body[index + 1]) <= last:
+        return None
+
+    try:
+        parsed = parse("\n".join(lines[first : last + row_delta + 1]))
+    except SyntaxError:
+        return None
+    if len(parsed.body) != 1 or not isinstance(parsed.body[0], DEFINITIONS):
+        return None
+
+    new = ast.increment_lineno(parsed.body[0], first)
+    following = (
+        [shifted(node, row_delta) for node in body[index + 1 :]]
+        if row_delta
+        else body[index + 1 :]
+    )
+    return ast.Module(
+        body=[*body[:index], new, *following],
+        type_ignores=tree.type_ignores,
+    )
+
+
+def shifted[T: AST](node: T, row_delta: int) -> T:
+    """
+    Copy node and its descendants, moved down by row_delta rows. The
+    original nodes are left alone, since caches still hold the previous
+    tree.
+    """
+    root = copy(node)
+    to_visit: list[AST] = [root]
+    while to_visit:
+        current = to_visit.pop()
+        for name, value in ast.iter_fields(current):
+            if isinstance(value, AST):
+                child = copy(value)
+                setattr(current, name, child)
+                to_visit.append(child)
+            elif isinstance(value, list):
+                children = [copy(v) if isinstance(v, AST) else v for v in value]
+                setattr(current, name, children)
+                to_visit.extend(c for c in children if isinstance(c, AST))
+        for attribute in ("lineno", "end_lineno"):
+            if isinstance(row := getattr(current, attribute, None), int):
+                setattr(current, attribute, row + row_delta)
+    return root
+
+
+def identifiers(lines: Iterable[str]) -> frozenset[str]:
+    return frozenset(
+        word for line in lines for word in IDENTIFIER.findall(line)
+    )
+
+
 @dataclass(order=True, kw_only=True)
 class Source:
     path: str
@@ -460,6 +544,16 @@ class Source:
 
     def __post_init__(self, input_lines: tuple[str, ...] | None) -> None:
         self._lines = input_lines
+        self._on_disk = input_lines is None
+        self._tree: AST | None = None
+        self.last_used = 0
+        self.loads = 0
+        self._size: int | None = None
+        self._fingerprint: int | None = None
+        self._identifiers: frozenset[str] | None = None
+        self._text_ranges: OrderedDict[
+            tuple[int, int, int, int], types.TextRange
+        ] = OrderedDict()
 
     def __repr__(self) -> str:
         return f"Source(path={self.path})"
@@ -488,27 +582,139 @@ class Source:
         if self._lines is None:
             with open(self.path, encoding="utf-8") as source_file:
                 self._lines = tuple(
-                    line[:-1] for line in source_file.readlines()
+                    line.removesuffix("\n") for line in source_file.readlines()
                 )
+            self.loads += 1
         return self._lines
 
     @cached_property
     def lines(self) -> tuple[types.Line, ...]:
         return tuple(Line(source=self, row=i) for i in range(len(self.text)))
 
-    @cached_property
+    @property
     def ast(self) -> AST:
-        return parse("\n".join(self.text))
+        self.last_used = next(uses)
+        if self._tree is None:
+            self._tree = parse("\n".join(self.text))
+        return self._tree
+
+    @property
+    def fingerprint(self) -> int:
+        """
+        A hash of the text that is kept when the text is evicted, so caches
+        can be checked without reading the module again.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = hash(self.text)
+        return self._fingerprint
+
+    @property
+    def identifiers(self) -> frozenset[str]:
+        if self._identifiers is None:
+            self._identifiers = identifiers(self.text)
+        return self._identifiers
+
+    @property
+    def resident(self) -> bool:
+        return self._lines is not None
+
+    @property
+    def resident_size(self) -> int:
+        if self._lines is None:
+            return 0
+        if self._size is None:
+            self._size = RESIDENT_BYTES_PER_CHARACTER * sum(
+                len(line) + 1 for line in self._lines
+            )
+        return self._size
+
+    def evict(self) -> bool:
+        """
+        Drop the text and tree of a module that is unchanged since it was
+        read from disk. Both are read and parsed again when next needed.
+        """
+        if not self._on_disk or self._lines is None:
+            return False
+
+        self._fingerprint = self.fingerprint
+        self._identifiers = self.identifiers
+        self.__dict__.pop("text", None)
+        self.__dict__.pop("lines", None)
+        self._lines = None
+        self._tree = None
+        self._size = None
+        self._text_ranges.clear()
+        return True
 
     def position(self, row: int, column: int) -> types.Position:
         return Position(source=self, row=row, column=column)
 
+    def apply_edit(self, edit: types.Edit) -> None:
+        """
+        Splice the edit into the lines in place. Only the edited rows are
+        replaced. An edit inside a single top-level definition reparses just
+        that definition; anything else drops the AST so it is rebuilt lazily
+        the next time it is asked for.
+        """
+        text = self.text
+        start, end = edit.start, edit.end
+        before = (
+            text[start.row][: start.column] if start.row < len(text) else ""
+        )
+        after = text[end.row][end.column :] if end.row < len(text) else ""
+        new_text = before + edit.text + after
+        new_lines = new_text.split("\n")
+        self._lines = (*text[: start.row], *new_lines, *text[end.row + 1 :])
+        self._on_disk = False
+        self._size = None
+        self._fingerprint = None
+        self._identifiers = None
+        self.__dict__["text"] = self._lines
+
+        if (lines := self.__dict__.get("lines")) is not None:
+            count = len(self._lines)
+            self.__dict__["lines"] = lines[:count] + tuple(
+                Line(source=self, row=i) for i in range(len(lines), count)
+            )
+        tree, self._tree = self._tree, None
+        if isinstance(tree, ast.Module) and (
+            reparsed := reparse_definition(
+                tree,
+                self._lines,
+                start_row=start.row,
+                end_row=end.row,
+                row_delta=len(new_lines) - (end.row - start.row + 1),
+            )
+        ):
+            self._tree = reparsed
+        self._text_ranges.clear()
+
     def get_name_at(self, position: types.Position) -> str | None:
         match = WORD.search(self.get_string_starting_at(position))
         if not match:
             return None
         return match.group()
 
+    def text_range(
+        self, *, start: types.Position, end: types.Position
+    ) -> types.TextRange:
+        """
+        Return the canonical range for the span, so that analysis cached on
+        it is shared by everyone asking for the same span.
+        """
+        if start.source is not self or end.source is not self:
+            return TextRange(start=start, end=end)
+
+        key = (start.row, start.column, end.row, end.column)
+        if (text_range := self._text_ranges.get(key)) is not None:
+            self._text_ranges.move_to_end(key)
+            return text_range
+
+        text_range = self._text_ranges[key] = TextRange(start=start, end=end)
+        if len(self._text_ranges) > TEXT_RANGE_CACHE_SIZE:
+            self._text_ranges.popitem(last=False)
+        return text_range
+
     def get_text(self, *, start: types.Position, end: types.Position) -> str:
         if start.source != end.source or end <= start:
             raise ValueError(f"Could not get text from {start=} to {end=}")
@@ -544,7 +750,12 @@ class Source:
     def module_name(self) -> tuple[str, ...]:
         path = self.path
 
-        prefixes = [p for p in sys.path if self.path.startswith(p)]
+        roots = (
+            (*sys.path, self.project_root)
+            if os.path.isabs(self.project_root)
+            else sys.path
+        )
+        prefixes = [p for p in roots if self.path.startswith(p)]
         if prefixes:
             prefix = max(prefixes)
             if prefix:
@@ -608,4 +819,4 @@ class Source:
         if not end:
             return None
         start = self.node_position(node)
-        return TextRange(start=start, end=end)
+        return self.text_range(start=start, end=end)
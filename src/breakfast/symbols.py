@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import ast
+from collections import Counter
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from enum import Enum
+from heapq import nsmallest
+from itertools import chain, count
+from threading import Lock
+
+from breakfast import types
+from breakfast.names import Name, local_collector
+
+PADDING = "^^"
+
+
+class Kind(Enum):
+    CLASS = "class"
+    FUNCTION = "function"
+    METHOD = "method"
+    VARIABLE = "variable"
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class Symbol:
+    name: str
+    container: str
+    kind: Kind
+    position: types.Position
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.container}.{self.name}"
+
+
+def definitions(source: types.Source) -> Iterator[Symbol]:
+    collector = local_collector(source)
+    if (module := collector.modules.get(tuple(source.module_name))) is None:
+        return
+
+    yield from name_definitions(
+        module.attributes, ".".join(source.module_name), source
+    )
+
+
+def name_definitions(
+    names: dict[str, Name],
+    container: str,
+    source: types.Source,
+    *,
+    in_class: bool = False,
+) -> Iterator[Symbol]:
+    for name, value in names.items():
+        definition = next(
+            (o for o in value.occurrences.in_source(source) if o.is_definition),
+            None,
+        )
+        if definition is None:
+            continue
+
+        kind = symbol_kind(definition.ast, in_class=in_class)
+        yield Symbol(
+            name=name,
+            container=container,
+            kind=kind,
+            position=definition.position,
+        )
+        if kind is Kind.CLASS:
+            yield from name_definitions(
+                value.attributes, f"{container}.{name}", source, in_class=True
+            )
+
+
+def symbol_kind(node: ast.AST | None, *, in_class: bool) -> Kind:
+    match node:
+        case ast.ClassDef():
+            return Kind.CLASS
+        case ast.FunctionDef() | ast.AsyncFunctionDef():
+            return Kind.METHOD if in_class else Kind.FUNCTION
+        case _:
+            return Kind.VARIABLE
+
+
+def trigrams(name: str) -> set[str]:
+    padded = PADDING + name.lower()
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(kw_only=True)
+class SymbolIndex:
+    symbols: dict[int, Symbol] = field(default_factory=dict)
+    folded: dict[int, str] = field(default_factory=dict)
+    postings: dict[str, set[int]] = field(default_factory=dict)
+    by_path: dict[str, list[int]] = field(default_factory=dict)
+    ids: Iterator[int] = field(default_factory=count)
+    lock: Lock = field(default_factory=Lock)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def update(self, path: str, symbols: Iterable[Symbol]) -> None:
+        with self.lock:
+            self._remove(path)
+            ids = []
+            for symbol in symbols:
+                symbol_id = next(self.ids)
+                self.symbols[symbol_id] = symbol
+                self.folded[symbol_id] = symbol.name.lower()
+                for trigram in trigrams(symbol.name):
+                    self.postings.setdefault(trigram, set()).add(symbol_id)
+                ids.append(symbol_id)
+            if ids:
+                self.by_path[path] = ids
+
+    def remove(self, path: str) -> None:
+        with self.lock:
+            self._remove(path)
+
+    def _remove(self, path: str) -> None:
+        for symbol_id in self.by_path.pop(path, ()):
+            del self.symbols[symbol_id]
+            for trigram in trigrams(self.folded.pop(symbol_id)):
+                posting = self.postings[trigram]
+                posting.discard(symbol_id)
+                if not posting:
+                    del self.postings[trigram]
+
+    def search(self, query: str, limit: int = 100) -> list[Symbol]:
+        """
+        Find symbols whose name has all the trigrams of the last part of the
+        query, topped up with names that share at least half of them, so
+        that partial and slightly misspelled names still match. Anything
+        before the last dot has to appear in the qualified name.
+        """
+        container, _, name = query.lower().rpartition(".")
+        if not name:
+            return []
+
+        wanted = trigrams(name)
+        folded = self.folded
+        with self.lock:
+            postings = sorted(
+                (self.postings.get(t, set()) for t in wanted), key=len
+            )
+            exact = self.in_container(
+                postings[0].intersection(*postings[1:]), container
+            )
+            found = nsmallest(
+                limit,
+                exact,
+                key=lambda i: (name not in folded[i], len(folded[i])),
+            )
+            if len(found) < limit and len(name) >= 3:
+                found.extend(
+                    self.close_matches(
+                        postings, exact, container, limit - len(found)
+                    )
+                )
+            return [self.symbols[i] for i in found]
+
+    def close_matches(
+        self,
+        postings: Sequence[set[int]],
+        exact: set[int],
+        container: str,
+        limit: int,
+    ) -> list[int]:
+        # A name sharing at least `threshold` trigrams with the query has to
+        # be in one of the smallest postings, so the largest ones are only
+        # used for scoring.
+        threshold = max(2, len(postings) // 2)
+        pool = self.in_container(
+            set[int]().union(*postings[: len(postings) - threshold + 1]),
+            container,
+        )
+        pool -= exact
+        shared = Counter(chain.from_iterable(p & pool for p in postings))
+        folded = self.folded
+        return nsmallest(
+            limit,
+            (i for i, count in shared.items() if count >= threshold),
+            key=lambda i: (-shared[i], len(folded[i])),
+        )
+
+    def in_container(self, ids: set[int], container: str) -> set[int]:
+        if not container:
+            return ids
+        return {
+            i for i in ids if container in self.symbols[i].container.lower()
+        }
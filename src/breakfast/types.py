@@ -9,7 +9,7 @@ from __future__ import annotations
 
 import ast
 from ast import AST
-from collections.abc import Iterable, Sequence
+from collections.abc import Sequence
 from dataclasses import dataclass
 from enum import Enum
 from typing import Protocol
@@ -126,7 +126,7 @@ class TextRange(Protocol):
     ) -> NodeWithRange[ast.AnnAssign] | None: ...
 
     @property
-    def statements(self) -> Iterable[ast.stmt]: ...
+    def statements(self) -> Sequence[ast.stmt]: ...
 
     @property
     def expression(self) -> ast.expr | None: ...
@@ -202,12 +202,21 @@ class Source(Protocol):  # pragma: nocover
     @property
     def path(self) -> str: ...
 
+    @property
+    def project_root(self) -> str: ...
+
     @property
     def lines(self) -> tuple[Line, ...]: ...
 
     @property
     def text(self) -> tuple[str, ...]: ...
 
+    @property
+    def fingerprint(self) -> int: ...
+
+    @property
+    def identifiers(self) -> frozenset[str]: ...
+
     @property
     def module_name(self) -> tuple[str, ...]: ...
 
@@ -230,6 +239,8 @@ class Source(Protocol):  # pragma: nocover
 
     def node_range(self, node: AST) -> TextRange | None: ...
 
+    def text_range(self, *, start: Position, end: Position) -> TextRange: ...
+
 
 @dataclass(order=True, frozen=True, kw_only=True)
 class Edit:
@@ -23,6 +23,22 @@ def generic_visit(
             yield from f(value, *args, **kwargs)
 
 
+def generic_apply(
+    f: Callable[Concatenate[ast.AST, P], object],
+    node: ast.AST,
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> None:
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, list):
+            for child in value:
+                if isinstance(child, ast.AST):
+                    f(child, *args, **kwargs)
+        elif isinstance(value, ast.AST):
+            f(value, *args, **kwargs)
+
+
 def generic_transform(
     f: Callable[Concatenate[ast.AST, P], Iterator[ast.AST]],
     node: ast.AST,
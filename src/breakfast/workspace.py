@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import ast
+import logging
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+from pathlib import Path
+from threading import Event, Lock
+
+from breakfast import source
+from breakfast.names import find_imported_modules, local_collectors, statements
+from breakfast.project import get_module_paths
+from breakfast.symbols import Symbol, SymbolIndex, definitions
+from breakfast.types import Source
+
+logger = logging.getLogger(__name__)
+
+TRIM_INTERVAL = 100
+
+
+@dataclass(frozen=True, kw_only=True)
+class MemoryStatistics:
+    budget: int | None
+    resident_bytes: int
+    resident_modules: int
+    evicted_modules: int
+    evictions: int
+    rehydrations: int
+
+
+@dataclass
+class ImportGraph:
+    """
+    The modules every indexed module imports, and the reverse, kept up to
+    date as modules are indexed, changed and reloaded.
+    """
+
+    modules: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    paths: dict[tuple[str, ...], set[str]] = field(default_factory=dict)
+    imports: dict[str, frozenset[tuple[str, ...]]] = field(default_factory=dict)
+    importers: dict[tuple[str, ...], set[str]] = field(default_factory=dict)
+    lock: Lock = field(default_factory=Lock)
+
+    def update(self, updated: Source) -> None:
+        imports = frozenset(module_imports(updated))
+        with self.lock:
+            self._remove(updated.path)
+            module = tuple(updated.module_name)
+            self.modules[updated.path] = module
+            self.paths.setdefault(module, set()).add(updated.path)
+            self.imports[updated.path] = imports
+            for imported in imports:
+                self.importers.setdefault(imported, set()).add(updated.path)
+
+    def remove(self, path: str) -> None:
+        with self.lock:
+            self._remove(path)
+
+    def _remove(self, path: str) -> None:
+        if (module := self.modules.pop(path, None)) is not None:
+            self.paths[module].discard(path)
+            if not self.paths[module]:
+                del self.paths[module]
+        for imported in self.imports.pop(path, ()):
+            self.importers[imported].discard(path)
+            if not self.importers[imported]:
+                del self.importers[imported]
+
+    def importers_of(self, paths: Iterable[str]) -> set[str]:
+        """
+        The modules that import any of paths, directly or through modules
+        that import them, which includes re-exports.
+        """
+        with self.lock:
+            return closure(
+                paths,
+                lambda path: self.importers.get(self.modules.get(path, ()), ()),
+            )
+
+    def paths_of(self, module: tuple[str, ...]) -> set[str]:
+        with self.lock:
+            return set(self.paths.get(module, ()))
+
+
+def closure(
+    paths: Iterable[str], edges: Callable[[str], Iterable[str]]
+) -> set[str]:
+    found: set[str] = set()
+    queue = deque(paths)
+    while queue:
+        for path in edges(queue.popleft()):
+            if path not in found:
+                found.add(path)
+                queue.append(path)
+    return found
+
+
+def module_imports(imported_from: Source) -> set[tuple[str, ...]]:
+    """
+    The modules a source imports, including the submodules that `from
+    package import name` may refer to.
+    """
+    result = set()
+    for node in statements(imported_from.ast):
+        if not isinstance(node, ast.Import | ast.ImportFrom):
+            continue
+        for module in find_imported_modules(node, imported_from):
+            result.add(module)
+            if isinstance(node, ast.ImportFrom):
+                result.update((*module, alias.name) for alias in node.names)
+    return result
+
+
+class Workspace:
+    def __init__(
+        self,
+        root: str,
+        memory_budget: int | None = None,
+        compile_workers: int | None = None,
+    ) -> None:
+        self.root = root
+        self.memory_budget = memory_budget
+        self.compile_workers = compile_workers
+        self.evictions = 0
+        self.indexed = Event()
+        self.symbols = SymbolIndex()
+        self.imports = ImportGraph()
+        self._sources: dict[str, source.Source] = {}
+        self._changed: dict[str, Source] = {}
+        self._changed_imports: dict[str, Source] = {}
+        self._compilers: ProcessPoolExecutor | None = None
+        self._lock = Lock()
+        self._indexing = Lock()
+        self._in_use = Lock()
+
+    @property
+    def sources(self) -> tuple[Source, ...]:
+        with self._lock:
+            return tuple(self._sources.values())
+
+    @property
+    def compilers(self) -> ProcessPoolExecutor | None:
+        """
+        The processes that compile modules for cross-module queries, shared
+        by everything that uses the workspace and started on first use.
+        """
+        if not self.compile_workers:
+            return None
+
+        with self._lock:
+            if self._compilers is None:
+                self._compilers = ProcessPoolExecutor(
+                    self.compile_workers, mp_context=get_context("spawn")
+                )
+            return self._compilers
+
+    def close(self) -> None:
+        with self._lock:
+            compilers, self._compilers = self._compilers, None
+        if compilers is not None:
+            compilers.shutdown(cancel_futures=True)
+
+    def index(self, report: Callable[[int, int], None] | None = None) -> None:
+        """
+        Read and parse every module under the root, making each one
+        available as soon as it is parsed, so that requests arriving during
+        indexing can use what is already there. A workspace is only indexed
+        once; later calls wait for that to finish.
+        """
+        with self._indexing:
+            if self.indexed.is_set():
+                return
+
+            paths = list(get_module_paths(Path(self.root)))
+            for done, path in enumerate(paths, start=1):
+                with self.using():
+                    if (loaded := self.load(str(path))) is not None:
+                        with self._lock:
+                            self._sources.setdefault(loaded.path, loaded)
+                        self.symbols.update(loaded.path, definitions(loaded))
+                        self.imports.update(loaded)
+                if done % TRIM_INTERVAL == 0:
+                    self.trim()
+                if report:
+                    report(done, len(paths))
+            self.trim()
+            self.indexed.set()
+
+    def reload(self, path: str) -> None:
+        with self._lock:
+            self._sources.pop(path, None)
+            self._changed.pop(path, None)
+            self._changed_imports.pop(path, None)
+        if (loaded := self.load(path)) is None:
+            self.symbols.remove(path)
+            self.imports.remove(path)
+            return
+
+        with self._lock:
+            self._sources[path] = loaded
+        self.symbols.update(path, definitions(loaded))
+        self.imports.update(loaded)
+
+    def changed(self, changed_source: Source) -> None:
+        with self._lock:
+            self._changed[changed_source.path] = changed_source
+            self._changed_imports[changed_source.path] = changed_source
+
+    def importers(self, paths: Iterable[str]) -> set[str]:
+        self.update_imports()
+        return self.imports.importers_of(paths)
+
+    def module_paths(self, module: tuple[str, ...]) -> set[str]:
+        self.update_imports()
+        return self.imports.paths_of(module)
+
+    def update_imports(self) -> None:
+        with self._lock:
+            changed, self._changed_imports = self._changed_imports, {}
+        for changed_source in changed.values():
+            try:
+                self.imports.update(changed_source)
+            except SyntaxError:
+                logger.debug(f"Keeping old imports for {changed_source.path}")
+
+    def search(self, query: str, limit: int = 100) -> list[Symbol]:
+        """
+        Search the symbol index, first bringing it up to date with the
+        sources that changed since the last search.
+        """
+        with self._lock:
+            changed, self._changed = self._changed, {}
+        for changed_source in changed.values():
+            try:
+                self.symbols.update(
+                    changed_source.path, list(definitions(changed_source))
+                )
+            except SyntaxError:
+                logger.debug(f"Keeping old symbols for {changed_source.path}")
+
+        return self.symbols.search(query, limit)
+
+    @contextmanager
+    def using(self) -> Iterator[None]:
+        """
+        Keep trim from evicting modules while an analysis reads them.
+        """
+        with self._in_use:
+            yield
+
+    def trim(self) -> None:
+        """
+        Evict the least recently used modules until the estimated size of
+        the resident ones is within the memory budget. Their symbols stay
+        in the index. While an analysis is using the workspace, nothing is
+        evicted; the trim after it catches up.
+        """
+        if self.memory_budget is None:
+            return
+
+        if not self._in_use.acquire(blocking=False):
+            return
+
+        try:
+            self._trim(self.memory_budget)
+        finally:
+            self._in_use.release()
+
+    def _trim(self, memory_budget: int) -> None:
+        with self._lock:
+            resident = [s for s in self._sources.values() if s.resident]
+        used = sum(s.resident_size for s in resident)
+        if used <= memory_budget:
+            return
+
+        for lru in sorted(resident, key=lambda s: s.last_used):
+            size = lru.resident_size
+            if not lru.evict():
+                continue
+            local_collectors.pop(lru.path, None)
+            self.evictions += 1
+            used -= size
+            if used <= memory_budget:
+                break
+
+    def memory_statistics(self) -> MemoryStatistics:
+        with self._lock:
+            sources = list(self._sources.values())
+        resident = [s for s in sources if s.resident]
+        return MemoryStatistics(
+            budget=self.memory_budget,
+            resident_bytes=sum(s.resident_size for s in resident),
+            resident_modules=len(resident),
+            evicted_modules=len(sources) - len(resident),
+            evictions=self.evictions,
+            rehydrations=sum(max(s.loads - 1, 0) for s in sources),
+        )
+
+    def load(self, path: str) -> source.Source | None:
+        loaded = source.Source(path=path, project_root=self.root)
+        try:
+            parsed = isinstance(loaded.ast, ast.Module)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+            logger.debug(f"Skipping {path}: {e}")
+            return None
+        return loaded if parsed else None
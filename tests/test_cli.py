@@ -0,0 +1,198 @@
+from textwrap import dedent
+
+import pytest
+
+from breakfast import cli
+from breakfast.cli import REFACTOR, Job, Target, TargetError, run, run_job
+from breakfast.types import Edit
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "kitchen.py").write_text(
+        dedent(
+            """\
+            def cook(ingredient):
+                return ingredient
+
+
+            def serve():
+                return cook(1) + cook(2)
+            """
+        )
+    )
+    (tmp_path / "chef.py").write_text(
+        dedent(
+            """\
+            from kitchen import cook
+
+            meal = cook(3)
+            """
+        )
+    )
+    (tmp_path / "pantry.py").write_text(
+        dedent(
+            """\
+            def stock():
+                shelf = [1, 2]
+                return shelf
+            """
+        )
+    )
+    return tmp_path
+
+
+def test_target_should_parse_one_based_position():
+    target = Target.parse("a.py:3:5")
+    assert target.start == (2, 4)
+    assert target.end == (2, 4)
+
+
+def test_target_should_parse_range():
+    target = Target.parse("a.py:3:5-4:1")
+    assert target.start == (2, 4)
+    assert target.end == (3, 0)
+
+
+def test_target_should_reject_zero_line():
+    with pytest.raises(TargetError):
+        Target.parse("a.py:0:1")
+
+
+def test_list_should_print_registered_refactorings(capsys):
+    assert run(["list"]) == 0
+    assert "extract function" in capsys.readouterr().out.split("\n")
+
+
+def test_rename_should_print_diff_across_files(project, capsys):
+    status = run(
+        [
+            "--root",
+            str(project),
+            "rename",
+            "prepare",
+            f"{project}/kitchen.py:1:5",
+        ]
+    )
+
+    output = capsys.readouterr().out
+    assert status == 0
+    assert "+++ b/chef.py" in output
+    assert "+from kitchen import prepare" in output
+    assert "+++ b/kitchen.py" in output
+    assert "+    return prepare(1) + prepare(2)" in output
+    assert "cook" in (project / "kitchen.py").read_text()
+
+
+@pytest.mark.parametrize("new_name", ["1bad", "class", "two words"])
+def test_rename_should_reject_invalid_names(project, capsys, new_name):
+    status = run(
+        [
+            "--root",
+            str(project),
+            "--in-place",
+            "rename",
+            new_name,
+            f"{project}/kitchen.py:1:5",
+        ]
+    )
+
+    assert status == 1
+    assert "is not a valid name" in capsys.readouterr().err
+    assert "def cook(ingredient):" in (project / "kitchen.py").read_text()
+
+
+def test_refactor_should_apply_in_place(project, capsys):
+    status = run(
+        [
+            "--root",
+            str(project),
+            "--in-place",
+            "refactor",
+            "inline variable",
+            f"{project}/pantry.py:3:12",
+        ]
+    )
+
+    assert status == 0
+    assert capsys.readouterr().out == ""
+    text = (project / "pantry.py").read_text()
+    assert "return [1, 2]" in text
+    assert "shelf" not in text
+
+
+def test_jobs_should_process_independent_files_in_parallel(project, capsys):
+    status = run(
+        [
+            "--root",
+            str(project),
+            "--jobs",
+            "2",
+            "refactor",
+            "inline variable",
+            f"{project}/pantry.py:3:12",
+            f"{project}/chef.py:3:1",
+        ]
+    )
+
+    output = capsys.readouterr().out
+    assert status == 0
+    assert "+++ b/pantry.py" in output
+    assert "+++ b/chef.py" in output
+
+
+def test_jobs_changing_the_same_file_should_conflict(project, capsys):
+    status = run(
+        [
+            "--root",
+            str(project),
+            "rename",
+            "prepare",
+            f"{project}/kitchen.py:1:5",
+            f"{project}/chef.py:3:8",
+        ]
+    )
+
+    assert status == 1
+    assert "conflicts with" in capsys.readouterr().err
+
+
+def test_inapplicable_refactoring_should_fail(project, capsys):
+    status = run(
+        [
+            "--root",
+            str(project),
+            "refactor",
+            "inline call",
+            f"{project}/pantry.py:1:1",
+        ]
+    )
+
+    assert status == 1
+    assert "does not apply" in capsys.readouterr().err
+
+
+def test_overlapping_edits_should_fail_the_job(project, monkeypatch):
+    refactoring_edits = cli.refactoring_edits
+
+    def overlapping_edits(job, project):
+        edits = refactoring_edits(job, project)
+        return [
+            *edits,
+            *(Edit(text_range=e.text_range, text=f"{e.text}!") for e in edits),
+        ]
+
+    monkeypatch.setattr(cli, "refactoring_edits", overlapping_edits)
+
+    result = run_job(
+        Job(
+            root=str(project),
+            kind=REFACTOR,
+            target=Target.parse(f"{project}/pantry.py:3:12"),
+            refactoring="inline variable",
+        )
+    )
+
+    assert result.changes == {}
+    assert result.error
+    assert result.error.startswith("ConflictingEditsError")
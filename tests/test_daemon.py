@@ -0,0 +1,144 @@
+import os
+import time
+from functools import partial
+from multiprocessing import AuthenticationError
+from threading import Thread
+
+import pytest
+from lsprotocol.types import TextDocumentItem
+
+from breakfast.breakfast_lsp.analysis import Analysis
+from breakfast.breakfast_lsp.daemon import (
+    Daemon,
+    DaemonRunningError,
+    InsecurePathError,
+    load_authkey,
+    remove_stale_socket,
+    socket_address,
+)
+from breakfast.breakfast_lsp.executors import RemoteExecutor
+
+
+@pytest.fixture(autouse=True)
+def runtime_directory(monkeypatch, tmp_path_factory):
+    runtime = tmp_path_factory.mktemp("runtime")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(runtime))
+    return runtime
+
+
+@pytest.fixture
+def address(tmp_path):
+    (tmp_path / "kitchen.py").write_text("def cook(ingredient):\n    ...\n")
+    address = str(tmp_path / "d.sock")
+    Thread(
+        target=Daemon(address, load_authkey()).serve_forever, daemon=True
+    ).start()
+    while not os.path.exists(address):
+        time.sleep(0.01)
+    return address
+
+
+def open_documents(analysis: Analysis) -> list[str]:
+    return list(analysis.sources)
+
+
+def test_sessions_should_share_the_index_but_not_open_documents(
+    address, tmp_path
+):
+    root = str(tmp_path)
+    first = RemoteExecutor.connect(root, address, load_authkey())
+    second = RemoteExecutor.connect(root, address, load_authkey())
+    reports: list[int] = []
+    first.run(
+        partial(
+            Analysis.open_document,
+            document=TextDocumentItem(
+                uri=f"file://{tmp_path / 'chef.py'}",
+                language_id="python",
+                version=1,
+                text="meal = 3\n",
+            ),
+        )
+    )
+
+    assert first.index(lambda done, total: reports.append(done)) == 1
+    assert second.index(lambda done, total: reports.append(done)) == 1
+    assert reports == [1]
+    assert [s.name for s in second.run(partial(Analysis.symbols, query="cook"))]
+    assert first.run(partial(Analysis.symbols, query="meal"))
+    assert first.run(open_documents) == [f"file://{tmp_path / 'chef.py'}"]
+    assert second.run(open_documents) == []
+
+
+def test_compilers_should_be_shared_and_stop_with_the_last_session(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setenv("BREAKFAST_COMPILE_WORKERS", "1")
+    daemon = Daemon(str(tmp_path / "d.sock"), b"secret")
+    root = str(tmp_path)
+
+    workspace = daemon.attach(root)
+    assert daemon.attach(root) is workspace
+    compilers = workspace.compilers
+    assert compilers is not None
+    assert Analysis(root, workspace=workspace).workspace.compilers is compilers
+
+    daemon.detach(root)
+    assert workspace.compilers is compilers
+    daemon.detach(root)
+    with pytest.raises(RuntimeError):
+        compilers.submit(int)
+
+
+def test_remove_stale_socket_should_only_remove_unused_sockets(
+    address, tmp_path
+):
+    stale = tmp_path / "stale.sock"
+    stale.touch()
+
+    remove_stale_socket(str(stale))
+
+    assert not stale.exists()
+    with pytest.raises(DaemonRunningError):
+        remove_stale_socket(address)
+
+
+def test_clients_should_need_the_authkey(address, tmp_path):
+    with pytest.raises(AuthenticationError):
+        RemoteExecutor.connect(str(tmp_path), address, b"guess")
+
+
+def test_authkey_should_be_private_and_reused(runtime_directory):
+    key = load_authkey()
+    path = runtime_directory / "breakfast" / "authkey"
+
+    assert load_authkey() == key
+    assert path.stat().st_mode & 0o777 == 0o600
+    path.chmod(0o644)
+    with pytest.raises(InsecurePathError):
+        load_authkey()
+
+
+def test_socket_address_should_refuse_directories_others_can_use(
+    monkeypatch, tmp_path
+):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o755)
+    shared.chmod(0o755)
+    private = tmp_path / "private"
+    private.mkdir(mode=0o700)
+    linked = tmp_path / "linked"
+    linked.symlink_to(private)
+
+    monkeypatch.setenv("BREAKFAST_SOCKET", str(private / "d.sock"))
+    assert socket_address() == str(private / "d.sock")
+    for directory in (shared, linked):
+        monkeypatch.setenv("BREAKFAST_SOCKET", str(directory / "d.sock"))
+        with pytest.raises(InsecurePathError):
+            socket_address()
+
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    monkeypatch.setenv("BREAKFAST_SOCKET", str(private / "d.sock"))
+    with pytest.raises(InsecurePathError):
+        socket_address()
@@ -0,0 +1,55 @@
+import pytest
+
+from breakfast.edits import ConflictingEditsError, apply_edits
+from breakfast.source import Source
+
+
+def make_lines_source(*lines: str) -> Source:
+    return Source(path="foo.py", project_root=".", input_lines=lines)
+
+
+def test_apply_edits_should_replace_insert_and_delete():
+    source = make_lines_source("a = 1", "b = a", "c = b")
+    edits = [
+        source.position(2, 0).to(source.position(3, 0)).replace(""),
+        source.position(0, 0).insert("x = 0\n"),
+        source.position(1, 4).to(source.position(1, 5)).replace("a + 1"),
+    ]
+
+    assert apply_edits(source.text, edits) == "x = 0\na = 1\nb = a + 1\n"
+
+
+def test_apply_edits_should_keep_insertions_at_same_position_in_order():
+    source = make_lines_source("a = 1")
+    edits = [
+        source.position(0, 0).insert("b"),
+        source.position(0, 0).insert("a"),
+    ]
+
+    assert apply_edits(source.text, edits) == "baa = 1"
+
+
+def test_apply_edits_should_reject_overlapping_edits():
+    source = make_lines_source("a = 1", "b = a")
+    edits = [
+        source.position(0, 0).to(source.position(1, 1)).replace("c"),
+        source.position(1, 0).to(source.position(1, 5)).replace("d = 2"),
+    ]
+
+    with pytest.raises(ConflictingEditsError):
+        apply_edits(source.text, edits)
+
+
+def test_apply_edits_should_apply_thousands_of_edits():
+    source = make_lines_source(*(f"value_{i} = old" for i in range(20_000)))
+    edits = [
+        source.position(row, 10 + len(str(row))).to(
+            source.position(row, 13 + len(str(row)))
+        )
+        for row in range(20_000)
+    ]
+
+    result = apply_edits(source.text, [e.replace("new") for e in edits])
+
+    assert result.count("new") == 20_000
+    assert "old" not in result
@@ -0,0 +1,152 @@
+from functools import partial
+
+import pytest
+from lsprotocol.types import (
+    DefinitionParams,
+    DidChangeTextDocumentParams,
+    Position,
+    Range,
+    ReferenceContext,
+    ReferenceParams,
+    RenameParams,
+    TextDocumentContentChangeEvent_Type1,
+    TextDocumentIdentifier,
+    TextDocumentItem,
+    VersionedTextDocumentIdentifier,
+)
+
+from breakfast.breakfast_lsp.analysis import Analysis
+from breakfast.breakfast_lsp.executors import RemoteExecutor, ThreadExecutor
+
+
+@pytest.fixture(params=[ThreadExecutor, RemoteExecutor.spawn])
+def executor(request, tmp_path):
+    (tmp_path / "kitchen.py").write_text("def cook(ingredient):\n    ...\n")
+    (tmp_path / "chef.py").write_text("from kitchen import cook\n")
+    return request.param(str(tmp_path))
+
+
+def test_executor_should_index_and_analyse_edited_documents(executor, tmp_path):
+    reports = []
+    uri = f"file://{tmp_path / 'chef.py'}"
+
+    assert executor.index(lambda done, total: reports.append(done)) == 2
+    executor.run(
+        partial(
+            Analysis.open_document,
+            document=TextDocumentItem(
+                uri=uri,
+                language_id="python",
+                version=1,
+                text="from kitchen import cook\n",
+            ),
+        )
+    )
+    executor.run(
+        partial(
+            Analysis.change_document,
+            params=DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(
+                    uri=uri, version=2
+                ),
+                content_changes=[
+                    TextDocumentContentChangeEvent_Type1(
+                        range=Range(Position(1, 0), Position(1, 0)),
+                        text="meal = cook(3)\n",
+                    )
+                ],
+            ),
+        )
+    )
+    edit = executor.run(
+        partial(
+            Analysis.rename,
+            params=RenameParams(
+                text_document=TextDocumentIdentifier(uri=uri),
+                position=Position(1, 7),
+                new_name="bake",
+            ),
+        )
+    )
+
+    assert reports == [1, 2]
+    assert edit is not None
+    assert edit.document_changes is not None
+    assert {
+        (c.text_document.uri.rsplit("/", 1)[-1], c.text_document.version)
+        for c in edit.document_changes
+        if hasattr(c, "edits")
+    } == {("chef.py", 2), ("kitchen.py", None)}
+
+
+def test_process_executor_should_raise_errors_from_the_analysis(tmp_path):
+    executor = RemoteExecutor.spawn(str(tmp_path))
+
+    with pytest.raises(FileNotFoundError):
+        executor.run(
+            partial(
+                Analysis.rename,
+                params=RenameParams(
+                    text_document=TextDocumentIdentifier(
+                        uri=f"file://{tmp_path / 'missing.py'}"
+                    ),
+                    position=Position(0, 0),
+                    new_name="bake",
+                ),
+            )
+        )
+
+
+def test_requests_on_keywords_should_find_nothing(tmp_path):
+    (tmp_path / "kitchen.py").write_text("def cook(ingredient):\n    ...\n")
+    analysis = Analysis(str(tmp_path))
+    document = TextDocumentIdentifier(uri=f"file://{tmp_path / 'kitchen.py'}")
+    keyword = Position(0, 0)
+
+    assert (
+        analysis.rename(
+            RenameParams(
+                text_document=document, position=keyword, new_name="bake"
+            )
+        )
+        is None
+    )
+    assert (
+        analysis.definitions(
+            DefinitionParams(text_document=document, position=keyword)
+        )
+        is None
+    )
+    assert (
+        analysis.references(
+            ReferenceParams(
+                text_document=document,
+                position=keyword,
+                context=ReferenceContext(include_declaration=True),
+            )
+        )
+        is None
+    )
+
+
+def test_changes_should_use_utf_16_offsets_after_astral_characters(tmp_path):
+    analysis = Analysis(str(tmp_path))
+    uri = f"file://{tmp_path / 'kitchen.py'}"
+    analysis.open_document(
+        TextDocumentItem(
+            uri=uri, language_id="python", version=1, text='s = "😀"; foo = 1\n'
+        )
+    )
+
+    analysis.change_document(
+        DidChangeTextDocumentParams(
+            text_document=VersionedTextDocumentIdentifier(uri=uri, version=2),
+            content_changes=[
+                TextDocumentContentChangeEvent_Type1(
+                    range=Range(Position(0, 10), Position(0, 13)), text="bar"
+                )
+            ],
+        )
+    )
+
+    assert analysis.document_source(uri).text == ('s = "😀"; bar = 1', "")
@@ -0,0 +1,190 @@
+import ast
+
+from breakfast import types
+from breakfast.flow import Flow, analyze
+from tests.conftest import make_source
+
+
+def first_function(source: types.Source) -> ast.FunctionDef:
+    assert isinstance(source.ast, ast.Module)
+    function = source.ast.body[0]
+    assert isinstance(function, ast.FunctionDef)
+    return function
+
+
+def function_flow(code: str) -> tuple[Flow, ast.FunctionDef]:
+    source = make_source(code)
+    function = first_function(source)
+    return analyze(source, function), function
+
+
+def test_names_used_in_the_next_iteration_should_be_live_after_the_loop_body():
+    flow, function = function_flow(
+        """
+        def f(items):
+            total = 0
+            for item in items:
+                print(total)
+                total = item
+            return None
+        """
+    )
+    loop = function.body[1]
+    assert isinstance(loop, ast.For)
+
+    assert "total" in flow.live_after(loop.body[-1])
+    assert "total" not in flow.live_after(loop)
+
+
+def test_overwritten_names_should_not_be_live():
+    flow, function = function_flow(
+        """
+        def f():
+            a = 1
+            a = 2
+            return a
+        """
+    )
+
+    assert "a" not in flow.live_after(function.body[0])
+    assert "a" in flow.live_after(function.body[1])
+
+
+def test_names_used_in_exception_handlers_should_be_live_in_the_try_body():
+    flow, function = function_flow(
+        """
+        def f():
+            try:
+                message = "a"
+                message = int(message)
+            except ValueError:
+                print(message)
+        """
+    )
+    try_statement = function.body[0]
+    assert isinstance(try_statement, ast.Try)
+
+    assert "message" in flow.live_after(try_statement.body[0])
+
+
+def test_definitions_should_reach_through_loop_back_edges():
+    flow, function = function_flow(
+        """
+        def f(items):
+            for item in items:
+                print(previous)
+                previous = item
+        """
+    )
+    loop = function.body[0]
+    assert isinstance(loop, ast.For)
+
+    assert {"items", "item", "previous"} <= flow.defined_before(loop.body[0])
+    assert "previous" not in flow.defined_before(loop)
+
+
+def test_branches_should_not_see_each_others_definitions():
+    flow, function = function_flow(
+        """
+        def f(a):
+            if a:
+                b = 1
+            else:
+                print(b)
+        """
+    )
+    condition = function.body[0]
+    assert isinstance(condition, ast.If)
+
+    assert "b" not in flow.defined_before(condition.orelse[0])
+
+
+def test_nested_scopes_should_only_use_free_names():
+    flow, function = function_flow(
+        """
+        def f(a):
+            g = lambda b: a + b
+            squares = [c * c for c in a]
+            def h(d):
+                return d + e
+        """
+    )
+
+    assert flow.uses(function.body[0]) == {"a"}
+    assert flow.uses(function.body[1]) == {"a"}
+    assert flow.uses(function.body[2]) == {"e"}
+    assert flow.definitions(function.body[2]) == {"h"}
+
+
+def test_analysis_should_be_cached_per_function_text():
+    source = make_source(
+        """
+        def f(a):
+            return a
+        """
+    )
+    function = first_function(source)
+    same_source = make_source(
+        """
+        def f(a):
+            return a
+        """
+    )
+    same_function = first_function(same_source)
+    changed_source = make_source(
+        """
+        def f(a):
+            return a + 1
+        """
+    )
+    changed_function = first_function(changed_source)
+
+    assert analyze(source, function) is analyze(same_source, same_function)
+    assert analyze(source, function) is not analyze(
+        changed_source, changed_function
+    )
+
+
+def test_names_bound_in_a_try_body_should_not_be_assigned_in_handlers():
+    flow, function = function_flow(
+        """
+        def f(flag):
+            if flag:
+                a = 1
+            else:
+                a = 2
+            try:
+                b = int(a)
+            except ValueError:
+                print(b)
+                b = 0
+            return b
+        """
+    )
+    handler = function.body[1]
+    assert isinstance(handler, ast.Try)
+
+    assert "a" in flow.assigned_before(handler)
+    assert "b" not in flow.assigned_before(handler.handlers[0].body[0])
+    assert "b" in flow.maybe_unassigned_before(handler.handlers[0].body[0])
+    assert "b" not in flow.maybe_unassigned_before(function.body[2])
+
+
+def test_names_bound_in_every_case_of_an_exhaustive_match_should_be_assigned():
+    flow, function = function_flow(
+        """
+        def f(value):
+            match value:
+                case 1:
+                    x = 1
+                    y = 1
+                case _:
+                    x = 2
+            print(x, y)
+        """
+    )
+    after = function.body[1]
+
+    assert "x" in flow.assigned_before(after)
+    assert "x" not in flow.maybe_unassigned_before(after)
+    assert "y" in flow.maybe_unassigned_before(after)
@@ -2,12 +2,26 @@ from __future__ import annotations
 
 import logging
 import sys
-
-from pytest import mark
-
-from breakfast.names import NameCollector, all_occurrence_positions
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from pytest import mark, raises
+
+from breakfast.names import (
+    Access,
+    ExportedName,
+    NameCollector,
+    PartialCollectionError,
+    all_occurrence_positions,
+    compile_module,
+    compile_modules,
+    compiled_modules,
+    export_summary,
+    import_ordered,
+    local_occurrences,
+)
 from breakfast.project import Project
-from breakfast.source import Position
+from breakfast.source import Position, Source
 from tests.conftest import (
     assert_renames_to,
     make_source,
@@ -1144,6 +1158,46 @@ def test_pattern_matching_should_only_find_occurrences_in_a_single_case():
     )
 
 
+def test_should_find_names_in_pattern_with_capture():
+    assert_renames_to(
+        target="Point",
+        new="Renamed",
+        code="""
+        class Point: ...
+
+        match thing:
+            case Point() as point:
+                print(point)
+        """,
+        expected="""
+        class Renamed: ...
+
+        match thing:
+            case Renamed() as point:
+                print(point)
+        """,
+    )
+
+
+def test_should_find_names_in_keyword_only_defaults():
+    assert_renames_to(
+        target="default",
+        new="renamed",
+        code="""
+        default = 1
+
+        def f(*, a=default):
+            return a
+        """,
+        expected="""
+        renamed = 1
+
+        def f(*, a=renamed):
+            return a
+        """,
+    )
+
+
 def test_should_find_class_used_in_method_annotation():
     assert_renames_to(
         target="C",
@@ -1511,6 +1565,80 @@ def test_rename_should_find_local_variable():
     )
 
 
+def test_occurrences_in_should_return_names_in_range_across_scopes():
+    source = make_source(
+        """
+        def f(a):
+            b = a + 1
+
+            def g(c):
+                return b + c
+
+            return g(b)
+        """
+    )
+    collector = NameCollector.from_sources([source])
+
+    occurrences = collector.occurrences_in(
+        source.position(3, 0).to(source.position(6, 0))
+    )
+
+    assert [(o.name, o.position.row, o.is_definition) for o in occurrences] == [
+        ("g", 4, True),
+        ("c", 4, True),
+        ("b", 5, False),
+        ("c", 5, False),
+    ]
+
+
+def test_call_sites_should_find_calls_across_modules():
+    source1 = make_source(
+        """
+        def stove(heat):
+            return heat
+
+        class Kitchen:
+            def bake(self):
+                return stove(3)
+        """,
+        filename="kitchen.py",
+    )
+    source2 = make_source(
+        """
+        from kitchen import stove
+
+        stoves = [stove]
+        meal = stove(heat=1)
+        """,
+        filename="chef.py",
+    )
+    collector = NameCollector.from_sources([source1, source2])
+
+    call_sites = collector.call_sites(source1.position(1, 4))
+
+    assert [call_site.range.text for call_site in call_sites] == [
+        "stove(heat=1)",
+        "stove(3)",
+    ]
+
+
+def test_call_sites_should_refuse_collections_made_for_a_query():
+    source = make_source(
+        """
+        def stove(heat):
+            return heat
+
+        meal = stove(heat=1)
+        """
+    )
+    collector = NameCollector.from_sources([source], query="stove")
+
+    with raises(PartialCollectionError):
+        collector.call_sites(source.position(1, 4))
+    with raises(PartialCollectionError):
+        collector.attribute_accesses(source.position(1, 4))
+
+
 @mark.xfail
 def test_rename_should_rename_class_fields_in_classmethod():
     assert_renames_to(
@@ -1542,3 +1670,233 @@ def test_dogfood(project_root):
     sources = application.find_sources()
     collector = NameCollector.from_sources(sources)
     assert collector is not None
+
+
+def test_attribute_accesses_should_tag_loads_stores_and_calls():
+    source = make_source(
+        """
+        class Oven:
+            def heat(self):
+                self.temperature = 180
+                return self.temperature
+
+            def bake(self):
+                print(self.temperature())
+        """
+    )
+    collector = NameCollector.from_sources([source])
+
+    accesses = collector.attribute_accesses(source.position(3, 13))
+
+    assert [
+        (access.access, access.attribute.range.text) for access in accesses
+    ] == [
+        (Access.STORE, "self.temperature"),
+        (Access.LOAD, "self.temperature"),
+        (Access.CALL, "self.temperature"),
+    ]
+    assert accesses[-1].call is not None
+    assert accesses[-1].call.range.text == "self.temperature()"
+
+
+def test_occurrences_should_be_sorted_and_grouped_by_source():
+    source1 = make_source(
+        """
+        from kitchen import stove
+
+        stove()
+        """,
+        filename="chef.py",
+    )
+    source2 = make_source(
+        """
+        def stove():
+            pass
+
+        stove()
+        """,
+        filename="kitchen.py",
+    )
+    collector = NameCollector.from_sources([source2, source1])
+
+    occurrences = collector.all_occurrences_for(source2.position(1, 4))
+
+    assert [(o.position.source, o.position.row) for o in occurrences] == [
+        (source1, 1),
+        (source1, 3),
+        (source2, 1),
+        (source2, 4),
+    ]
+    assert occurrences[-1].position == source2.position(4, 0)
+    assert [o.position.row for o in occurrences.in_source(source2)] == [1, 4]
+    assert [o.position.row for o in reversed(occurrences)] == [4, 1, 3, 1]
+
+
+def test_local_occurrences_should_stay_in_module_and_follow_edits():
+    source = Source(
+        path="chef.py",
+        project_root=".",
+        input_lines=("def stove():", "    pass", "", "stove()"),
+    )
+
+    occurrences = local_occurrences(source.position(3, 0))
+
+    assert [o.position.row for o in occurrences] == [0, 3]
+    assert local_occurrences(source.position(3, 0)) is occurrences
+
+    source.apply_edit(source.position(3, 7).insert("\nstove()"))
+
+    assert [
+        o.position.row for o in local_occurrences(source.position(3, 0))
+    ] == [0, 3, 4]
+    assert not local_occurrences(source.position(1, 4))
+
+
+def test_export_summary_should_list_what_other_modules_can_see():
+    source = make_source(
+        """
+        from kitchen import Kitchen, Stove as Oven
+        import cooking.tools
+
+        meal = Kitchen()
+
+        class Chef(Oven):
+            title = "chef"
+
+            def __init__(self, kitchen: Kitchen):
+                self.kitchen = kitchen
+                knife = cooking.tools.Knife()
+
+            def cook(self) -> Meal:
+                ...
+        """,
+        filename="chef.py",
+    )
+
+    summary = export_summary(source)
+
+    assert summary.imported_modules == {("kitchen",), ("cooking", "tools")}
+    assert [n.name for n in summary.names] == [
+        "Kitchen",
+        "Stove",
+        "cooking.tools",
+        "meal",
+        "Chef",
+    ]
+    meal, chef = summary.names[-2:]
+    assert isinstance(meal, ExportedName)
+    assert meal.types == (("Kitchen",),)
+    assert isinstance(chef, ExportedName)
+    assert (chef.row, chef.column) == (6, 6)
+    assert chef.bases == (("Oven",),)
+    assert [a.name for a in chef.attributes] == ["title", "__init__", "cook"]
+    assert [(a.name, a.types) for a in chef.instance_attributes] == [
+        ("kitchen", (("Kitchen",),))
+    ]
+
+
+def test_should_find_attributes_typed_in_modules_that_do_not_mention_them():
+    kitchen = make_source(
+        """
+        class Kitchen:
+            def cook(self):
+                ...
+        """,
+        filename="kitchen.py",
+    )
+    chef = make_source(
+        """
+        from kitchen import Kitchen
+
+        class Chef:
+            def __init__(self, kitchen: Kitchen):
+                self.kitchen = kitchen
+        """,
+        filename="chef.py",
+    )
+    restaurant = make_source(
+        """
+        from chef import Chef
+
+        def serve(chef: Chef):
+            chef.kitchen.cook()
+
+        def clean():
+            return 1
+        """,
+        filename="restaurant.py",
+    )
+    sources = [restaurant, chef, kitchen]
+
+    positions = all_occurrence_positions(
+        restaurant.position(4, 17), sources=sources
+    )
+
+    assert positions == [
+        kitchen.position(2, 8),
+        restaurant.position(4, 17),
+    ]
+    assert positions == [
+        o.position
+        for o in NameCollector.from_sources(sources).all_occurrences_for(
+            restaurant.position(4, 17)
+        )
+    ]
+
+
+def test_modules_compiled_elsewhere_should_link_like_collected_modules():
+    kitchen = make_source(
+        """
+        class Kitchen:
+            def cook(self, meal):
+                def stir():
+                    return meal
+
+                return stir()
+        """,
+        filename="kitchen.py",
+    )
+    chef = make_source(
+        """
+        from kitchen import Kitchen
+
+        class Chef(Kitchen):
+            def cook(self, meal):
+                self.meal = super().cook(meal=meal)
+        """,
+        filename="chef.py",
+    )
+    sources = [chef, kitchen]
+
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        compile_modules(sources, executor=executor)
+
+    assert compiled_modules["kitchen.py"][1] == compile_module(kitchen)
+    collector = NameCollector.from_sources(sources)
+    for position, name in collector.positions.items():
+        if name is not None:
+            assert all_occurrence_positions(position, sources=sources) == [
+                o.position for o in collector.all_occurrences_for(position)
+            ]
+
+
+def test_import_ordered_should_ignore_modules_outside_the_sources():
+    kitchen = make_source(
+        """
+        import os
+
+        class Kitchen: ...
+        """,
+        filename="kitchen.py",
+    )
+    chef = make_source(
+        """
+        from kitchen import Kitchen
+
+        kitchen = Kitchen()
+        """,
+        filename="chef.py",
+    )
+
+    assert import_ordered([kitchen, chef]) == (kitchen, chef)
+    assert import_ordered([chef, kitchen]) == (kitchen, chef)
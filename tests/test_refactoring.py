@@ -1,3 +1,4 @@
+from breakfast.names import NameCollector
 from breakfast.refactoring import (
     AddParameter,
     CodeSelection,
@@ -23,7 +24,12 @@ from breakfast.refactoring import (
     SlideStatementsUp,
 )
 from breakfast.source import TextRange
-from tests.conftest import assert_refactors_to, dedent, make_source
+from tests.conftest import (
+    assert_refactors_to,
+    dedent,
+    make_source,
+    range_for,
+)
 
 
 def test_extract_variable_should_insert_name_definition():
@@ -359,6 +365,122 @@ def test_extract_function_should_return_modified_variable_used_after_call():
     )
 
 
+def test_extract_function_should_not_return_variable_overwritten_before_use():
+    assert_refactors_to(
+        refactoring=ExtractFunction,
+        target="b = a + 2",
+        code="""
+        a = 1
+        b = a + 2
+        b = 3
+        print(b)
+        """,
+        expected="""
+        a = 1
+        def f(a):
+            b = a + 2
+        f(a)
+        b = 3
+        print(b)
+        """,
+    )
+
+
+def test_extract_function_should_not_pass_variables_unbound_in_the_first_iteration():
+    source = make_source(
+        """
+        def f(items):
+            for item in items:
+                if item > 1:
+                    print(previous)
+                previous = item
+        """
+    )
+    selection = CodeSelection(
+        text_range=range_for(("if item", "print(previous)"), source, 1),
+        sources=[source],
+    )
+
+    assert ExtractFunction.from_selection(selection) is None
+
+
+def test_extract_function_should_pass_variables_carried_over_from_previous_iteration():
+    assert_refactors_to(
+        refactoring=ExtractFunction,
+        target=("if item", "print(previous)"),
+        code="""
+        def f(items):
+            previous = None
+            for item in items:
+                if item > 1:
+                    print(previous)
+                previous = item
+        """,
+        expected="""
+        def f(items):
+            previous = None
+            for item in items:
+                f_0(previous=previous, item=item)
+                previous = item
+
+        def f_0(previous, item):
+            if item > 1:
+                print(previous)
+        """,
+    )
+
+
+def test_extract_function_should_pass_variables_bound_in_every_case_of_a_match():
+    assert_refactors_to(
+        refactoring=ExtractFunction,
+        target=("print(x)", "print(x + 1)"),
+        code="""
+        def f(value):
+            match value:
+                case 1:
+                    x = 1
+                case _:
+                    x = 2
+            print(x)
+            print(x + 1)
+        """,
+        expected="""
+        def f(value):
+            match value:
+                case 1:
+                    x = 1
+                case _:
+                    x = 2
+            f_0(x)
+
+        def f_0(x):
+            print(x)
+            print(x + 1)
+        """,
+    )
+
+
+def test_extract_function_should_not_pass_variables_unbound_without_a_catch_all_case():
+    source = make_source(
+        """
+        def f(value):
+            match value:
+                case 1:
+                    x = 1
+                case other if other:
+                    x = 2
+            print(x)
+            print(x + 1)
+        """
+    )
+    selection = CodeSelection(
+        text_range=range_for(("print(x)", "print(x + 1)"), source),
+        sources=[source],
+    )
+
+    assert ExtractFunction.from_selection(selection) is None
+
+
 def test_extract_function_should_extract_inside_function():
     assert_refactors_to(
         refactoring=ExtractFunction,
@@ -847,6 +969,55 @@ def test_slide_statements_up_should_slide_past_irrelevant_statements():
     assert delete.start.row == 3
 
 
+def test_slide_statements_up_should_not_slide_into_preceding_block():
+    source = make_source(
+        """
+        def f(a):
+            if a:
+                x = 1
+                y = 2
+            x = 3
+        """
+    )
+
+    first = source.lines[5]
+    last = source.lines[5]
+
+    refactor = SlideStatementsUp(
+        selection=CodeSelection(
+            text_range=TextRange(start=first.start, end=last.end),
+            sources=[source],
+        )
+    )
+
+    assert not list(refactor.edits)
+
+
+def test_slide_statements_down_should_stop_before_redefinition():
+    source = make_source(
+        """
+        a = 1
+        b = 2
+        a = 5
+        print(a)
+        """
+    )
+
+    first = source.lines[1]
+    last = source.lines[1]
+
+    refactor = SlideStatementsDown(
+        selection=CodeSelection(
+            text_range=TextRange(start=first.start, end=last.end),
+            sources=[source],
+        )
+    )
+    insert, delete = refactor.edits
+
+    assert insert.start.row == 3
+    assert delete.start.row == 1
+
+
 def test_extract_function_should_extract_to_local_scope():
     assert_refactors_to(
         refactoring=ExtractFunction,
@@ -935,6 +1106,34 @@ def test_inline_call_should_replace_call_with_function_return_value():
     )
 
 
+def test_inline_call_should_collect_names_once(monkeypatch):
+    calls = []
+    from_sources = NameCollector.from_sources
+
+    def counting_from_sources(sources):
+        calls.append(sources)
+        return from_sources(sources)
+
+    monkeypatch.setattr(NameCollector, "from_sources", counting_from_sources)
+    assert_refactors_to(
+        refactoring=InlineCall,
+        target="f",
+        occurrence=2,
+        code="""
+        def f(a, b, c, d):
+            return a + b + c + d
+
+        e = f(1, 2, 3, 4)
+        """,
+        expected="""
+        result = 1 + 2 + 3 + 4
+        e = result
+        """,
+    )
+
+    assert len(calls) == 1
+
+
 def test_inline_call_should_work_without_return_value():
     source = make_source(
         """
@@ -2322,6 +2521,35 @@ def test_add_parameter_should_pass_none_in_callers():
     )
 
 
+def test_add_parameter_should_only_change_calls_of_the_function():
+    assert_refactors_to(
+        refactoring=AddParameter,
+        target="b",
+        code=r"""
+        def function(a, b):
+            return a or b
+
+        class C:
+            def method(self):
+                return function(1, 2)
+
+        d = map(function, [1], [2])
+        e = C().method()
+        """,
+        expected=r"""
+        def function(a, b, p):
+            return a or b
+
+        class C:
+            def method(self):
+                return function(1, 2, p=None)
+
+        d = map(function, [1], [2])
+        e = C().method()
+        """,
+    )
+
+
 def test_method_to_property_should_convert_a_method_with_no_arguments():
     assert_refactors_to(
         refactoring=MethodToProperty,
@@ -2346,6 +2574,30 @@ def test_method_to_property_should_convert_a_method_with_no_arguments():
     )
 
 
+def test_method_to_property_should_leave_method_references_alone():
+    assert_refactors_to(
+        refactoring=MethodToProperty,
+        target="def m",
+        code=r"""
+        class C:
+            def m(self):
+                return 2
+
+            def m2(self):
+                return sorted([1], key=self.m) + [self.m()]
+        """,
+        expected=r"""
+        class C:
+            @property
+            def m(self):
+                return 2
+
+            def m2(self):
+                return sorted([1], key=self.m) + [self.m]
+        """,
+    )
+
+
 def test_property_to_method_should_convert_to_a_method_with_no_arguments():
     assert_refactors_to(
         refactoring=PropertyToMethod,
@@ -3316,3 +3568,33 @@ def test_replace_loop_should_replace_set_add_with_set_comprehension():
         s = {i for i in range(10)}
         """,
     )
+
+
+def test_refactorings_should_skip_those_whose_requirements_are_not_met(
+    monkeypatch,
+):
+    source = make_source(
+        """
+        def f(a):
+            return g(a)
+        """
+    )
+    consulted = []
+    original = ExtractClass.from_selection
+
+    def from_selection(selection):
+        consulted.append(selection)
+        return original(selection)
+
+    monkeypatch.setattr(ExtractClass, "from_selection", from_selection)
+    selection = CodeSelection(
+        text_range=source.position(2, 11).to(source.position(2, 15)),
+        sources=[source],
+    )
+
+    refactorings = selection.refactorings
+
+    assert "inline call" in refactorings
+    assert "extract variable" in refactorings
+    assert "replace loop with comprehension" not in refactorings
+    assert consulted == []
@@ -0,0 +1,122 @@
+from functools import partial
+from threading import Event
+
+from lsprotocol.types import (
+    DidChangeTextDocumentParams,
+    Position,
+    Range,
+    RenameParams,
+    TextDocumentContentChangeEvent_Type1,
+    TextDocumentIdentifier,
+    TextDocumentItem,
+    VersionedTextDocumentIdentifier,
+)
+
+from breakfast.breakfast_lsp.analysis import Analysis
+from breakfast.breakfast_lsp.scheduler import Priority, Scheduler
+
+
+def blocked_scheduler() -> tuple[Scheduler, Event]:
+    scheduler = Scheduler()
+    release = Event()
+    scheduler.submit(release.wait, priority=Priority.EDIT)
+    return scheduler, release
+
+
+def test_edits_should_run_in_order_before_newest_requests():
+    scheduler, release = blocked_scheduler()
+    ran: list[str] = []
+
+    futures = [
+        scheduler.submit(partial(ran.append, name), priority=priority)
+        for name, priority in (
+            ("action", Priority.CODE_ACTION),
+            ("first edit", Priority.EDIT),
+            ("rename", Priority.NAVIGATION),
+            ("second edit", Priority.EDIT),
+            ("definition", Priority.NAVIGATION),
+        )
+    ]
+    release.set()
+    for future in futures:
+        future.result(timeout=1)
+
+    assert ran == [
+        "first edit",
+        "second edit",
+        "definition",
+        "rename",
+        "action",
+    ]
+
+
+def test_submit_should_cancel_pending_job_with_the_same_key():
+    scheduler, release = blocked_scheduler()
+
+    stale = scheduler.submit(
+        lambda: "stale", priority=Priority.HIGHLIGHT, key=("a.py",)
+    )
+    other = scheduler.submit(
+        lambda: "other", priority=Priority.HIGHLIGHT, key=("b.py",)
+    )
+    fresh = scheduler.submit(
+        lambda: "fresh", priority=Priority.HIGHLIGHT, key=("a.py",)
+    )
+    release.set()
+
+    assert fresh.result(timeout=1) == "fresh"
+    assert other.result(timeout=1) == "other"
+    assert stale.cancelled()
+
+
+def test_rename_queued_before_a_change_should_not_apply_to_the_new_text(
+    tmp_path,
+):
+    uri = f"file://{tmp_path / 'chef.py'}"
+    analysis = Analysis(str(tmp_path))
+    analysis.open_document(
+        TextDocumentItem(
+            uri=uri, language_id="python", version=1, text="meal = 3\n"
+        )
+    )
+    scheduler, release = blocked_scheduler()
+
+    rename = scheduler.submit(
+        partial(
+            analysis.rename,
+            params=RenameParams(
+                text_document=TextDocumentIdentifier(uri=uri),
+                position=Position(0, 0),
+                new_name="dinner",
+            ),
+            version=1,
+        ),
+        priority=Priority.NAVIGATION,
+    )
+    change = scheduler.submit(
+        partial(
+            analysis.change_document,
+            params=DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(
+                    uri=uri, version=2
+                ),
+                content_changes=[
+                    TextDocumentContentChangeEvent_Type1(
+                        range=Range(Position(0, 0), Position(0, 0)),
+                        text="lunch = 2\n",
+                    )
+                ],
+            ),
+        ),
+        priority=Priority.EDIT,
+    )
+    release.set()
+
+    change.result(timeout=1)
+    assert rename.result(timeout=1) is None
+    assert (
+        analysis.code_actions(
+            uri, Range(Position(0, 0), Position(0, 4)), version=1
+        )
+        is None
+    )
@@ -0,0 +1,165 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from lsprotocol.types import (
+    CodeAction,
+    CodeActionContext,
+    CodeActionParams,
+    DidChangeTextDocumentParams,
+    DidCloseTextDocumentParams,
+    DidOpenTextDocumentParams,
+    Position,
+    Range,
+    TextDocumentIdentifier,
+    TextDocumentItem,
+    VersionedTextDocumentIdentifier,
+)
+from pygls.workspace import PositionCodec
+
+from breakfast.breakfast_lsp import server
+
+URI = "file:///kitchen.py"
+
+
+@pytest.fixture
+def analysed(monkeypatch):
+    requests = []
+    results = {"actions": [CodeAction(title="extract function")]}
+
+    async def analyse(editor, function, *, priority, key=None):
+        requests.append(function.keywords["selection"])
+        return results["actions"]
+
+    monkeypatch.setattr(server, "analyse", analyse)
+    monkeypatch.setattr(server, "submit", lambda *args, **kwargs: None)
+    server.CODE_ACTIONS.clear()
+    yield requests, results
+    server.CODE_ACTIONS.clear()
+
+
+def editor_with(version: int | None = 1) -> Any:
+    documents = (
+        {} if version is None else {URI: SimpleNamespace(version=version)}
+    )
+    return SimpleNamespace(
+        workspace=SimpleNamespace(
+            text_documents=documents, position_codec=PositionCodec()
+        )
+    )
+
+
+def request_code_actions(
+    editor: Any, row: int = 0, column: int = 4
+) -> list[CodeAction] | None:
+    return asyncio.run(
+        server.code_action(
+            editor,
+            CodeActionParams(
+                text_document=TextDocumentIdentifier(uri=URI),
+                range=Range(Position(row, 0), Position(row, column)),
+                context=CodeActionContext(diagnostics=[]),
+            ),
+        )
+    )
+
+
+def test_repeated_code_action_requests_should_not_analyse_again(analysed):
+    requests, _ = analysed
+    editor = editor_with()
+
+    first = request_code_actions(editor)
+    again = request_code_actions(editor)
+
+    assert again == first
+    assert len(requests) == 1
+
+
+def test_code_actions_should_be_analysed_again_for_a_new_version(analysed):
+    requests, _ = analysed
+
+    request_code_actions(editor_with(version=1))
+    request_code_actions(editor_with(version=2))
+
+    assert len(requests) == 2
+
+
+@pytest.mark.parametrize(
+    "notify",
+    [
+        lambda editor: server.did_open(
+            editor,
+            DidOpenTextDocumentParams(
+                text_document=TextDocumentItem(
+                    uri=URI, language_id="python", version=1, text=""
+                )
+            ),
+        ),
+        lambda editor: server.did_change(
+            editor,
+            DidChangeTextDocumentParams(
+                text_document=VersionedTextDocumentIdentifier(
+                    uri=URI, version=1
+                ),
+                content_changes=[],
+            ),
+        ),
+        lambda editor: server.did_close(
+            editor,
+            DidCloseTextDocumentParams(
+                text_document=TextDocumentIdentifier(uri=URI)
+            ),
+        ),
+    ],
+    ids=["open", "change", "close"],
+)
+def test_document_notifications_should_clear_cached_code_actions(
+    analysed, notify
+):
+    requests, _ = analysed
+    editor = editor_with()
+    request_code_actions(editor)
+
+    notify(editor)
+    request_code_actions(editor)
+
+    assert len(requests) == 2
+
+
+def test_cached_code_actions_should_be_limited(analysed, monkeypatch):
+    monkeypatch.setattr(server, "CODE_ACTION_CACHE_SIZE", 2)
+    requests, _ = analysed
+    editor = editor_with()
+
+    for column in (1, 2, 3):
+        request_code_actions(editor, column=column)
+    request_code_actions(editor, column=1)
+
+    assert len(server.CODE_ACTIONS) == 2
+    assert [r.end.character for r in requests] == [1, 2, 3, 1]
+
+
+def test_code_actions_should_not_be_cached_without_a_document_version(
+    analysed,
+):
+    requests, _ = analysed
+    editor = editor_with(version=None)
+
+    request_code_actions(editor)
+    request_code_actions(editor)
+
+    assert len(requests) == 2
+    assert not server.CODE_ACTIONS
+
+
+def test_outdated_code_actions_should_not_be_cached(analysed):
+    requests, results = analysed
+    editor = editor_with()
+    results["actions"] = None
+
+    assert request_code_actions(editor) is None
+    request_code_actions(editor)
+
+    assert len(requests) == 2
+    assert not server.CODE_ACTIONS
@@ -1,3 +1,5 @@
+import ast
+
 from breakfast.source import Source
 
 
@@ -13,3 +15,136 @@ def test_ordering():
 def test_module_name():
     source = Source(path=__file__, project_root=".", input_lines=())
     assert source.module_name == ("tests", "test_source")
+
+
+def test_equal_spans_should_share_one_text_range():
+    source = Source(
+        path="foo.py", project_root=".", input_lines=("a = 1", "b = a")
+    )
+    text_range = source.position(0, 0).to(source.position(1, 5))
+
+    assert text_range.text == "a = 1\nb = a"
+    assert source.position(0, 0).to(source.position(1, 5)) is text_range
+
+
+def test_text_range_cache_should_be_bounded(monkeypatch):
+    monkeypatch.setattr("breakfast.source.TEXT_RANGE_CACHE_SIZE", 2)
+    source = Source(path="foo.py", project_root=".", input_lines=("abc",))
+    first = source.position(0, 0).to(source.position(0, 1))
+    source.position(0, 0).to(source.position(0, 2))
+    source.position(0, 0).to(source.position(0, 3))
+
+    assert source.position(0, 0).to(source.position(0, 1)) is not first
+
+
+def test_apply_edit_should_splice_edited_lines_in_place():
+    source = Source(
+        path="foo.py", project_root=".", input_lines=("a = 1", "b = a", "c = b")
+    )
+    first_line = source.lines[0]
+    assert source.ast
+
+    source.apply_edit(
+        source.position(1, 4).to(source.position(1, 5)).replace("a\nd = 2")
+    )
+
+    assert source.text == ("a = 1", "b = a", "d = 2", "c = b")
+    assert source.lines[0] is first_line
+    assert [line.text for line in source.lines] == list(source.text)
+    assert [type(node) for node in ast.walk(source.ast)].count(ast.Assign) == 4
+
+
+def test_apply_edit_should_drop_ranges_of_the_old_text():
+    source = Source(path="foo.py", project_root=".", input_lines=("a = 1",))
+    text_range = source.position(0, 0).to(source.position(0, 5))
+    assert text_range.text == "a = 1"
+
+    source.apply_edit(source.position(0, 4).insert("2"))
+
+    assert source.position(0, 0).to(source.position(0, 5)) is not text_range
+    assert source.position(0, 0).to(source.position(0, 6)).text == "a = 21"
+
+
+def test_apply_edit_should_only_reparse_the_edited_definition():
+    source = Source(
+        path="foo.py",
+        project_root=".",
+        input_lines=(
+            "def f():",
+            "    return 1",
+            "",
+            "@decorator",
+            "def g():",
+            "    return 2",
+            "",
+            "class C:",
+            "    x = 3",
+        ),
+    )
+    tree = source.ast
+    assert isinstance(tree, ast.Module)
+    unchanged = tree.body[0]
+
+    source.apply_edit(source.position(5, 4).insert("y = 1\n    "))
+
+    reparsed = source.ast
+    assert isinstance(reparsed, ast.Module)
+    assert reparsed.body[0] is unchanged
+    assert ast.dump(reparsed, include_attributes=True) == ast.dump(
+        ast.parse("\n".join(source.text)), include_attributes=True
+    )
+
+
+def test_apply_edit_should_leave_the_previous_tree_untouched():
+    lines = ("def f():", "    return 1", "", "def g():", "    return f()")
+    source = Source(path="foo.py", project_root=".", input_lines=lines)
+    tree = source.ast
+    before = ast.dump(tree, include_attributes=True)
+
+    source.apply_edit(source.position(1, 4).insert("x = 1\n    "))
+
+    assert ast.dump(tree, include_attributes=True) == before
+    assert ast.dump(source.ast, include_attributes=True) == ast.dump(
+        ast.parse("\n".join(source.text)), include_attributes=True
+    )
+
+
+def test_apply_edit_should_drop_the_tree_for_structural_edits():
+    source = Source(
+        path="foo.py",
+        project_root=".",
+        input_lines=("def f():", "    return 1", "", "x = f()"),
+    )
+    tree = source.ast
+
+    source.apply_edit(source.position(3, 6).insert("1"))
+
+    assert "ast" not in vars(source)
+    assert source.ast is not tree
+
+
+def test_evict_should_drop_the_tree_until_it_is_needed_again(tmp_path):
+    path = tmp_path / "kitchen.py"
+    path.write_text("def cook():\n    pass\n")
+    source = Source(path=str(path), project_root=str(tmp_path))
+    tree = source.ast
+
+    assert source.evict()
+
+    assert not source.resident
+    assert source.resident_size == 0
+    assert source.ast is not tree
+    assert ast.dump(source.ast) == ast.dump(tree)
+    assert source.loads == 2
+
+
+def test_evict_should_keep_edited_sources(tmp_path):
+    path = tmp_path / "kitchen.py"
+    path.write_text("def cook():\n    pass\n")
+    source = Source(path=str(path), project_root=str(tmp_path))
+    source.apply_edit(
+        source.position(0, 4).to(source.position(0, 8)).replace("bake")
+    )
+
+    assert not source.evict()
+    assert source.text == ("def bake():", "    pass")
@@ -0,0 +1,65 @@
+from breakfast.symbols import Kind, SymbolIndex, definitions
+from tests.conftest import make_source
+
+
+def test_definitions_should_qualify_names_with_module_and_classes():
+    source = make_source(
+        """
+        LIMIT = 3
+
+        class Kitchen:
+            def cook(self):
+                ingredient = 1
+
+        def serve():
+            pass
+        """,
+        filename="restaurant/kitchen.py",
+    )
+
+    assert {
+        (s.qualified_name, s.kind, s.position.row) for s in definitions(source)
+    } == {
+        ("restaurant.kitchen.LIMIT", Kind.VARIABLE, 1),
+        ("restaurant.kitchen.Kitchen", Kind.CLASS, 3),
+        ("restaurant.kitchen.Kitchen.cook", Kind.METHOD, 4),
+        ("restaurant.kitchen.serve", Kind.FUNCTION, 7),
+    }
+
+
+def test_search_should_find_prefixes_substrings_and_typos():
+    source = make_source(
+        """
+        def get_name(): ...
+        def set_name(): ...
+        def get_names_from_scope(): ...
+        def unrelated(): ...
+        """,
+        filename="names.py",
+    )
+    index = SymbolIndex()
+    index.update(source.path, definitions(source))
+
+    assert [s.name for s in index.search("get_name")] == [
+        "get_name",
+        "get_names_from_scope",
+        "set_name",
+    ]
+    assert [s.name for s in index.search("u")] == ["unrelated"]
+    assert [s.name for s in index.search("unrleated")] == ["unrelated"]
+    assert index.search("names.set_name")[0].name == "set_name"
+    assert not index.search("other.set_name")
+
+
+def test_update_should_replace_symbols_of_the_same_path():
+    old = make_source("def get_name(): ...", filename="names.py")
+    new = make_source("def get_title(): ...", filename="names.py")
+    index = SymbolIndex()
+    index.update(old.path, definitions(old))
+
+    index.update(new.path, definitions(new))
+
+    assert "get_name" not in [s.name for s in index.search("get_name")]
+    assert [s.name for s in index.search("title")] == ["get_title"]
+    assert len(index) == 1
+    assert "nam" not in index.postings
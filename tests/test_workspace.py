@@ -0,0 +1,204 @@
+from textwrap import dedent
+
+import pytest
+
+from breakfast.breakfast_lsp.analysis import Analysis
+from breakfast.project import Project
+from breakfast.source import Source
+from breakfast.workspace import Workspace
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "kitchen.py").write_text(
+        dedent(
+            """\
+            def cook(ingredient):
+                return ingredient
+            """
+        )
+    )
+    (tmp_path / "chef.py").write_text(
+        dedent(
+            """\
+            from kitchen import cook
+
+            meal = cook(3)
+            """
+        )
+    )
+    (tmp_path / "broken.py").write_text("def (:\n")
+    return tmp_path
+
+
+def test_index_should_parse_modules_and_report_progress(root):
+    workspace = Workspace(str(root))
+    reports = []
+
+    workspace.index(report=lambda done, total: reports.append((done, total)))
+
+    assert sorted(s.path for s in workspace.sources) == [
+        str(root / "chef.py"),
+        str(root / "kitchen.py"),
+    ]
+    assert reports == [(1, 3), (2, 3), (3, 3)]
+    assert workspace.indexed.is_set()
+
+
+def test_reload_should_replace_source_with_the_file_on_disk(root):
+    workspace = Workspace(str(root))
+    workspace.index()
+    path = str(root / "chef.py")
+    (root / "chef.py").write_text("meal = 4\n")
+
+    workspace.reload(path)
+
+    (reloaded,) = [s for s in workspace.sources if s.path == path]
+    assert reloaded.text == ("meal = 4",)
+
+
+def test_project_should_only_use_known_sources_when_given(root):
+    workspace = Workspace(str(root))
+    kitchen = workspace.load(str(root / "kitchen.py"))
+    assert kitchen
+
+    project = Project(root=str(root), source=kitchen, known_sources=())
+
+    assert project.sources == (kitchen,)
+    occurrences = project.get_occurrences(kitchen.position(0, 4))
+    assert [o.position.source for o in occurrences] == [kitchen]
+
+
+def test_search_should_pick_up_changed_sources(root):
+    workspace = Workspace(str(root))
+    workspace.index()
+    kitchen = workspace.load(str(root / "kitchen.py"))
+    assert isinstance(kitchen, Source)
+    assert [s.name for s in workspace.search("cook")] == ["cook"]
+
+    kitchen.apply_edit(
+        kitchen.position(0, 4).to(kitchen.position(0, 8)).replace("bake")
+    )
+    workspace.changed(kitchen)
+
+    assert not workspace.search("cook")
+    assert [s.qualified_name for s in workspace.search("bake")] == [
+        "kitchen.bake"
+    ]
+
+
+def test_trim_should_evict_least_recently_used_modules(root):
+    workspace = Workspace(str(root), memory_budget=1)
+    workspace.index()
+    chef, kitchen = sorted(workspace.sources, key=lambda s: s.path)
+    assert isinstance(chef, Source)
+    assert isinstance(kitchen, Source)
+    assert not chef.resident
+    assert not kitchen.resident
+
+    assert kitchen.ast
+    assert chef.ast
+    workspace.memory_budget = chef.resident_size
+    workspace.trim()
+
+    assert chef.resident
+    assert not kitchen.resident
+    assert [s.name for s in workspace.search("cook")] == ["cook"]
+    statistics = workspace.memory_statistics()
+    assert statistics.resident_modules == 1
+    assert statistics.evicted_modules == 1
+    assert statistics.evictions == 3
+    assert statistics.rehydrations == 2
+
+
+def test_trim_should_not_evict_modules_while_they_are_in_use(root):
+    workspace = Workspace(str(root), memory_budget=1)
+    workspace.index()
+    kitchen, *_ = workspace.sources
+    assert isinstance(kitchen, Source)
+
+    with workspace.using():
+        assert kitchen.ast
+        workspace.trim()
+        assert kitchen.resident
+
+    workspace.trim()
+    assert not kitchen.resident
+
+
+@pytest.fixture
+def pantry(root):
+    (root / "pantry").mkdir()
+    (root / "pantry" / "__init__.py").write_text("from kitchen import cook\n")
+    (root / "diner.py").write_text("from pantry import cook\n\ncook(4)\n")
+    (root / "menu.py").write_text("def cook(dish):\n    return dish\n")
+    return root
+
+
+def test_importers_should_follow_re_exports_and_changes(pantry):
+    workspace = Workspace(str(pantry))
+    workspace.index()
+
+    assert workspace.importers([str(pantry / "kitchen.py")]) == {
+        str(pantry / "chef.py"),
+        str(pantry / "diner.py"),
+        str(pantry / "pantry" / "__init__.py"),
+    }
+    menu = workspace.load(str(pantry / "menu.py"))
+    assert isinstance(menu, Source)
+    menu.apply_edit(
+        menu.position(0, 0).to(menu.position(0, 0)).replace("import diner\n")
+    )
+    workspace.changed(menu)
+
+    assert str(pantry / "menu.py") in workspace.importers(
+        [str(pantry / "kitchen.py")]
+    )
+
+
+def test_occurrences_should_only_load_importers_of_the_defining_module(pantry):
+    analysis = Analysis(str(pantry))
+    analysis.index()
+    diner = analysis.document_source(f"file://{pantry / 'diner.py'}")
+    known = {s.path: s for s in analysis.workspace.sources}
+
+    position = diner.position(2, 0)
+    occurrences = analysis.occurrences(diner, position)
+
+    assert analysis.defining_module(diner, position, known) == str(
+        pantry / "kitchen.py"
+    )
+    assert sorted(
+        (o.position.source.path[len(str(pantry)) + 1 :], o.position.row)
+        for o in occurrences
+    ) == [
+        ("chef.py", 0),
+        ("chef.py", 2),
+        ("diner.py", 0),
+        ("diner.py", 2),
+        ("kitchen.py", 0),
+        ("pantry/__init__.py", 0),
+    ]
+
+
+def test_queries_after_trim_should_leave_evicted_modules_unloaded(pantry):
+    workspace = Workspace(str(pantry), memory_budget=1)
+    workspace.index()
+    kitchen = workspace.load(str(pantry / "kitchen.py"))
+    assert isinstance(kitchen, Source)
+    project = Project(
+        root=str(pantry), source=kitchen, known_sources=workspace.sources
+    )
+    first = project.get_occurrences(kitchen.position(0, 4))
+
+    workspace.trim()
+    again = project.get_occurrences(kitchen.position(0, 4))
+
+    assert again == first
+    others = [
+        s
+        for s in workspace.sources
+        if isinstance(s, Source) and s is not kitchen
+    ]
+    assert others
+    assert not any(s.resident for s in others)